@@ -0,0 +1,149 @@
+"""
+Vectorized spatio-temporal matching of hazard reports against INCOIS alerts.
+
+The alert set is turned into NumPy arrays once (coordinates in radians with
+their cosines precomputed, issue times as epoch seconds, radii and integer
+type codes), so correlating a report is a handful of array operations and
+a whole batch of reports is a single (reports x alerts) pass.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Default alert radius when the feed does not give one
+DEFAULT_RADIUS_KM = 50.0
+
+# Reports count as related to alerts issued this many hours before or after them
+MATCH_WINDOW_HOURS = 24.0
+
+# Reports per vectorized pass (bounds the size of the reports x alerts matrices)
+MATCH_CHUNK_SIZE = 2048
+
+_EPOCH = datetime(1970, 1, 1)
+
+# (hazard_type, latitude, longitude, timestamp)
+Report = Tuple[str, float, float, datetime]
+
+
+def _epoch_seconds(value) -> float:
+    """Naive-UTC epoch seconds of a datetime or ISO-8601 string"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH).total_seconds()
+
+
+class AlertMatcher:
+    """
+    Immutable index over one set of alerts
+
+    Alerts without coordinates, or whose issue time cannot be parsed, can
+    never match and are left out of the arrays.
+    """
+
+    def __init__(self, alerts: Sequence[Dict]):
+        self._type_codes: Dict[str, int] = {}
+        self._alerts: List[Dict] = []
+        rows = []
+
+        for alert in alerts:
+            alert_lat = alert.get('latitude')
+            alert_lon = alert.get('longitude')
+            if not (alert_lat and alert_lon):
+                continue
+            try:
+                issued = _epoch_seconds(alert.get('issued_at'))
+            except (TypeError, ValueError, AttributeError):
+                continue
+            radius = alert.get('radius_km', DEFAULT_RADIUS_KM)
+            code = self._type_codes.setdefault(alert.get('alert_type'), len(self._type_codes))
+            rows.append((alert_lat, alert_lon, issued, DEFAULT_RADIUS_KM if radius is None else radius, code))
+            self._alerts.append(alert)
+
+        table = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        self._lat = np.radians(table[:, 0])
+        self._lon = np.radians(table[:, 1])
+        self._cos_lat = np.cos(self._lat)
+        self._issued = table[:, 2]
+        self._radius = table[:, 3]
+        self._type = table[:, 4].astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def match(self, hazard_type: str, latitude: float, longitude: float, timestamp: datetime) -> List[Dict]:
+        """Matching alerts for one report (see match_many)"""
+        return self.match_many([(hazard_type, latitude, longitude, timestamp)])[0]
+
+    def match_many(self, reports: Sequence[Report]) -> List[List[Dict]]:
+        """
+        Correlate many reports in one vectorized pass
+
+        An alert matches a report of the same type issued within
+        MATCH_WINDOW_HOURS of it whose centre lies within radius_km of the
+        report (haversine distance).
+
+        Args:
+            reports: (hazard_type, latitude, longitude, timestamp) per report
+
+        Returns:
+            One list per report of {'alert_id', 'title', 'distance_km',
+            'time_diff_hours'}, in alert order
+        """
+        results: List[List[Dict]] = [[] for _ in reports]
+        if not self._alerts or not reports:
+            return results
+
+        # Reports of a type no alert has (or without coordinates) get code -1 and never match
+        codes = np.array([
+            self._type_codes.get(hazard_type, -1) if lat is not None and lon is not None else -1
+            for hazard_type, lat, lon, _ in reports
+        ], dtype=np.int32)
+        candidates = np.flatnonzero(codes >= 0)
+
+        for start in range(0, len(candidates), MATCH_CHUNK_SIZE):
+            chunk = candidates[start:start + MATCH_CHUNK_SIZE]
+            lat = np.radians(np.array([reports[i][1] for i in chunk], dtype=np.float64))[:, None]
+            lon = np.radians(np.array([reports[i][2] for i in chunk], dtype=np.float64))[:, None]
+            when = np.array([_epoch_seconds(reports[i][3]) for i in chunk], dtype=np.float64)[:, None]
+
+            a = (np.sin((self._lat - lat) / 2) ** 2
+                 + np.cos(lat) * self._cos_lat * np.sin((self._lon - lon) / 2) ** 2)
+            distance = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+            hours = np.abs(when - self._issued) / 3600
+
+            hits = ((codes[chunk][:, None] == self._type)
+                    & (distance <= self._radius)
+                    & (hours <= MATCH_WINDOW_HOURS))
+
+            for row, col in zip(*np.nonzero(hits)):
+                alert = self._alerts[col]
+                results[chunk[row]].append({
+                    'alert_id': alert.get('id'),
+                    'title': alert.get('title'),
+                    'distance_km': round(float(distance[row, col]), 2),
+                    'time_diff_hours': round(float(hours[row, col]), 2)
+                })
+
+        return results
+
+
+def correlation_result(matching_alerts: List[Dict]) -> Dict:
+    """validate_hazard's result dict for a report's matching alerts"""
+    validated = len(matching_alerts) > 0
+
+    if validated:
+        correlation = f"Matches {len(matching_alerts)} INCOIS alert(s). "
+        correlation += f"Closest: {matching_alerts[0]['title']} "
+        correlation += f"({matching_alerts[0]['distance_km']}km away)"
+    else:
+        correlation = "No matching INCOIS alerts found in vicinity"
+
+    return {
+        'validated': validated,
+        'correlation': correlation,
+        'matching_alerts': matching_alerts
+    }
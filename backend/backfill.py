@@ -0,0 +1,141 @@
+"""
+Chunked online backfills.
+
+Schema changes live in Alembic migrations; data rewrites that touch every
+row run here instead, walking the table by primary key in small batches.
+Each batch is its own short transaction, so the app keeps serving reads
+and writes while a multi-GB table is rewritten, and an interrupted run can
+be resumed with --start-after.
+
+Usage:
+    python backfill.py --list
+    python backfill.py geohash [--batch-size 500] [--pause 0.05] [--start-after ID]
+"""
+import argparse
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import or_
+
+from database import SessionLocal, HazardPost, INCOISAlert, init_db
+import geo
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BackfillJob:
+    """A row-by-row rewrite of one model, limited to rows matching `where`"""
+
+    def __init__(self, model, where: Callable, apply: Callable, description: str):
+        self.model = model
+        self.where = where        # () -> SQLAlchemy filter clause selecting rows to fix
+        self.apply = apply        # (row) -> bool, True if the row was changed
+        self.description = description
+
+
+def run_job(job: BackfillJob, batch_size: int = 500, pause: float = 0.05,
+            start_after: int = 0) -> int:
+    """
+    Run one backfill job in primary-key order
+
+    Returns:
+        Number of rows changed
+    """
+    model = job.model
+    last_id = start_after
+    changed = 0
+    scanned = 0
+
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.query(model).filter(
+                model.id > last_id, job.where()
+            ).order_by(model.id).limit(batch_size).all()
+
+            if not rows:
+                break
+
+            for row in rows:
+                if job.apply(row):
+                    changed += 1
+            db.commit()
+
+            scanned += len(rows)
+            last_id = rows[-1].id
+            logger.info(f"{model.__tablename__}: {scanned} rows scanned, {changed} changed "
+                        f"(resume with --start-after {last_id})")
+        finally:
+            db.close()
+
+        # Give concurrent writers a chance at the database lock
+        if pause:
+            time.sleep(pause)
+
+    return changed
+
+
+# ---- jobs ----
+
+def _set_geohash(row) -> bool:
+    row.geohash = geo.encode(row.latitude, row.longitude)
+    return row.geohash is not None
+
+
+def _fix_image_paths(row) -> bool:
+    changed = False
+    if row.image_path and '\\' in row.image_path:
+        row.image_path = row.image_path.replace('\\', '/')
+        changed = True
+    if row.watermarked_image_path and '\\' in row.watermarked_image_path:
+        row.watermarked_image_path = row.watermarked_image_path.replace('\\', '/')
+        changed = True
+    return changed
+
+
+JOBS: Dict[str, List[BackfillJob]] = {
+    "geohash": [
+        BackfillJob(HazardPost, lambda: HazardPost.geohash == None, _set_geohash,
+                    "Fill hazard_posts.geohash from latitude/longitude"),
+        BackfillJob(INCOISAlert, lambda: INCOISAlert.geohash == None, _set_geohash,
+                    "Fill incois_alerts.geohash from latitude/longitude"),
+    ],
+    "image_paths": [
+        BackfillJob(
+            HazardPost,
+            lambda: or_(HazardPost.image_path.contains('\\'),
+                        HazardPost.watermarked_image_path.contains('\\')),
+            _fix_image_paths,
+            "Normalize Windows backslashes in hazard post image paths"
+        ),
+    ],
+}
+
+
+def run(name: str, batch_size: int = 500, pause: float = 0.05,
+        start_after: Optional[int] = None) -> int:
+    total = 0
+    for job in JOBS[name]:
+        logger.info(f"Backfill {name}: {job.description}")
+        total += run_job(job, batch_size, pause, start_after or 0)
+    logger.info(f"Backfill {name} complete: {total} rows changed")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run chunked online data backfills")
+    parser.add_argument("job", nargs="?", choices=sorted(JOBS))
+    parser.add_argument("--list", action="store_true", help="List available jobs")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches")
+    parser.add_argument("--start-after", type=int, default=None, help="Resume after this primary key")
+    args = parser.parse_args()
+
+    if args.list or not args.job:
+        for name, jobs in sorted(JOBS.items()):
+            for job in jobs:
+                print(f"{name:12} {job.description}")
+    else:
+        init_db()
+        run(args.job, args.batch_size, args.pause, args.start_after)
@@ -1,72 +1,131 @@
+import asyncio
 import logging
 import json
-from database import SessionLocal, HazardPost, ImageAnalysis
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, HazardPost, ImageAnalysis, upsert
 from services.vision_service import vision_service
+from services.analysis_cache_service import analysis_cache_service
+from services.image_service import image_service, IMAGE_MIME_TYPES
 from services.incois_service import incois_service
 from services.twilio_service import twilio_service
+from services.stats_service import stats_service  # registers post_stats flush hook
+from services.heatmap_service import heatmap_service  # registers heatmap grid hooks
+from services.tile_service import tile_service
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-async def process_post_background(post_id: int):
+# Strong references so in-flight watermark tasks are not garbage collected
+_watermark_tasks = set()
+# Sources whose responsive variants are being rendered (one task per source)
+_variant_tasks = {}
+
+
+def schedule_watermark(post: HazardPost):
+    """Start watermarking a committed post; its watermarked_image_path is set when done"""
+    task = asyncio.create_task(watermark_post_background(
+        post.id, post.image_path, post.location_name or "Unknown",
+        post.latitude, post.longitude, post.timestamp
+    ))
+    _watermark_tasks.add(task)
+    task.add_done_callback(_watermark_tasks.discard)
+
+
+def schedule_variants(source_path: str):
+    """Render the responsive variants of an image that has none yet (e.g. posts older than variants)"""
+    if source_path in _variant_tasks:
+        return
+    task = asyncio.create_task(image_service.create_variants(source_path))
+    _variant_tasks[source_path] = task
+    task.add_done_callback(lambda _: _variant_tasks.pop(source_path, None))
+
+
+def image_variants(source_path: Optional[str]) -> Optional[Dict]:
+    """Variant map for an API response; schedules rendering when it is missing or stale"""
+    if not source_path:
+        return None
+    variants = image_service.variant_map(source_path)
+    if variants is None:
+        schedule_variants(source_path)
+    return variants
+
+
+async def schedule_missing_watermarks(db: AsyncSession) -> int:
+    """Restart watermarking for posts whose stage was cut off (e.g. by a restart)"""
+    posts = (await db.scalars(
+        select(HazardPost).where(HazardPost.watermarked_image_path == None)
+    )).all()
+    for post in posts:
+        schedule_watermark(post)
+    if posts:
+        logger.info(f"Rescheduled watermarking for {len(posts)} posts")
+    return len(posts)
+
+
+async def watermark_post_background(post_id: int, image_path: str, location_name: str,
+                                    latitude: float, longitude: float, timestamp: datetime):
+    """Watermark stage: render in the process pool, then record the path on the post"""
+    # Named per post: posts sharing a stored image still get their own overlay
+    watermarked_path = await image_service.add_watermark(
+        image_path, location_name, latitude, longitude, timestamp,
+        watermarked_filename=f"wm_{post_id}.jpg"
+    )
+    
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(HazardPost).where(HazardPost.id == post_id)
+                .values(watermarked_image_path=watermarked_path)
+            )
+            await db.commit()
+    except Exception as e:
+        logger.error(f"Failed to record watermark for post {post_id}: {str(e)}")
+        return
+    
+    # Grid-sized copies of what the dashboard shows
+    await image_service.create_variants(watermarked_path)
+
+class RetryableValidationError(Exception):
+    """A validation step failed transiently (Gemini or INCOIS unavailable); the job queue retries it"""
+
+
+async def process_post_background(post_id: int, final_attempt: bool = True):
     """
-    Background task to process hazard post:
+    Validation job for a hazard post (run by services.job_service):
     1. AI Validation (Gemini)
     2. INCOIS Verification
     3. Update Post Status
     4. Send Alerts
+    
+    Each stage commits on its own and is skipped when a previous run of
+    the job already completed it, so a retried or reclaimed job never
+    analyses an image twice or re-sends an SMS.
+    
+    Args:
+        post_id: Post to validate
+        final_attempt: Record fallback results instead of raising
+            RetryableValidationError when Gemini or INCOIS fail
     """
     logger.info(f"Starting background processing for post {post_id}")
     
     # Create new DB session for background task
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
-        post = db.query(HazardPost).filter(HazardPost.id == post_id).first()
+        post = await db.get(HazardPost, post_id)
         if not post:
             logger.error(f"Post {post_id} not found in background task")
             return
+        # Map tiles only show verified posts, so only a change there invalidates them
+        was_verified = post.verified
 
-        # 1. Perform AI validation
-        try:
-            ai_result = await vision_service.analyze_image(post.image_path)
-            
-            # Store analysis results
-            analysis = ImageAnalysis(
-                post_id=post.id,
-                labels=json.dumps(ai_result.get('labels', [])),
-                objects=json.dumps(ai_result.get('objects', [])),
-                web_entities=json.dumps(ai_result.get('web_entities', [])),
-                ocean_related=ai_result.get('ocean_related', False),
-                hazard_detected=ai_result.get('hazard_detected', False),
-                confidence_score=ai_result.get('confidence_score', 0.0),
-                scene_description=ai_result.get('scene_description'),
-                detected_elements=json.dumps(ai_result.get('all_elements', []))
-            )
-            db.add(analysis)
-            
-            # Update post with AI results
-            is_ocean = ai_result.get('ocean_related', False)
-            is_hazard = ai_result.get('hazard_detected', False)
-            
-            post.ai_validated = is_ocean and is_hazard
-            post.ai_confidence = ai_result.get('confidence_score', 0.0)
-            post.ai_analysis = json.dumps(ai_result)
-            
-            # Explicit Rejection: only if AI is sure it is NOT related to ocean
-            if not is_ocean and post.ai_confidence > 0.5:
-                post.rejected = True
-                post.rejection_reason = "Image not related to ocean hazard"
-            else:
-                post.rejected = False
-            
-            logger.info(f"AI validation complete: ocean_related={is_ocean}, "
-                       f"hazard_detected={is_hazard}, rejected={post.rejected}")
-            
-        except Exception as e:
-            logger.error(f"AI validation failed: {str(e)}")
-            post.ai_validated = False
-            post.ai_confidence = 0.0
-            # Don't reject if the service itself fails
+        # 1. Perform AI validation (stored by an earlier run if ai_analysis is set)
+        if post.ai_analysis is None:
+            await _validate_with_ai(db, post, final_attempt)
+        else:
+            logger.info(f"AI validation already stored for post {post_id}")
             
         # 2. Perform INCOIS validation
         try:
@@ -80,15 +139,18 @@ async def process_post_background(post_id: int):
             logger.info(f"INCOIS validation: {incois_result.get('validated')}")
             
         except Exception as e:
+            if not final_attempt:
+                raise RetryableValidationError(f"INCOIS validation failed: {str(e)}") from e
             logger.error(f"INCOIS validation failed: {str(e)}")
             post.incois_validated = False
         
         # 3. Determine final verification status
+        alert = None
         if post.ai_validated and post.incois_validated:
             post.verified = True
             post.rejected = False
             message = "Report verified! Both AI and INCOIS confirm ocean hazard."
-            await twilio_service.send_validation_alert(post.id, "verified")
+            alert = "verified"
             
         elif post.ai_validated:
             # AI says yes, but no INCOIS match yet
@@ -99,7 +161,7 @@ async def process_post_background(post_id: int):
         elif post.rejected:
             # AI explicitly rejected
             message = f"Report rejected: {post.rejection_reason}"
-            await twilio_service.send_validation_alert(post.id, "rejected", post.rejection_reason)
+            alert = "rejected"
             
         else:
             # Fallback
@@ -107,11 +169,105 @@ async def process_post_background(post_id: int):
             post.rejected = False
             message = "Pending manual review."
             
-        db.commit()
+        await db.commit()
+        if post.verified != was_verified:
+            tile_service.invalidate_point(post.latitude, post.longitude)
+        
+        # 4. Send the SMS once per status: whichever run marks the post sends it
+        if alert:
+            marked = await db.execute(
+                update(HazardPost)
+                .where(HazardPost.id == post.id,
+                       or_(HazardPost.notified_status == None, HazardPost.notified_status != alert))
+                .values(notified_status=alert)
+            )
+            await db.commit()
+            if marked.rowcount == 1:
+                await twilio_service.send_validation_alert(post.id, alert, post.rejection_reason)
+            
         logger.info(f"Background processing complete for post {post_id}: {message}")
         
     except Exception as e:
-        logger.error(f"Critical background error: {str(e)}")
-        db.rollback()
+        if not isinstance(e, RetryableValidationError):  # the job queue logs the retry
+            logger.error(f"Critical background error: {str(e)}")
+        await db.rollback()
+        raise  # the job queue retries with backoff
+    finally:
+        await db.close()
+
+
+async def _validate_with_ai(db: AsyncSession, post: HazardPost, final_attempt: bool):
+    """Analyse the post's image and commit the analysis together with the AI verdict"""
+    fresh, phash, ai_result, shared = False, None, None, None
+    try:
+        try:
+            # Gemini gets a downscaled copy, not the multi-MB original
+            size = (post.image_width, post.image_height) if post.image_width and post.image_height else None
+            analysis_path = await image_service.create_analysis_derivative(post.image_path, post.image_format, size)
+            # Derivatives are JPEG; an original's type is known from the upload (None: sniffed)
+            mime_type = IMAGE_MIME_TYPES.get(post.image_format) if analysis_path == post.image_path else 'image/jpeg'
+            
+            # Near-duplicates of an analysed (or in-progress) image reuse its result
+            phash = await analysis_cache_service.compute_hash(analysis_path)
+            ai_result = await analysis_cache_service.lookup_or_claim(phash)
+            fresh = ai_result is None
+            if fresh:
+                ai_result = await vision_service.analyze_image(analysis_path, mime_type)
+                if vision_service.is_fallback(ai_result):
+                    if vision_service.configured and not final_attempt:
+                        raise RetryableValidationError("Gemini analysis unavailable")
+                else:
+                    shared = ai_result
+            else:
+                logger.info(f"Analysis cache hit for post {post.id}")
+        except RetryableValidationError:
+            raise
+        except Exception as e:
+            if not final_attempt:
+                raise RetryableValidationError(f"AI validation failed: {str(e)}") from e
+            logger.error(f"AI validation failed: {str(e)}")
+            post.ai_validated = False
+            post.ai_confidence = 0.0
+            # Don't reject if the service itself fails
+            return
+        
+        # Store analysis results (replacing a row left by an interrupted run)
+        analysis = {
+            'labels': json.dumps(ai_result.get('labels', [])),
+            'objects': json.dumps(ai_result.get('objects', [])),
+            'web_entities': json.dumps(ai_result.get('web_entities', [])),
+            'ocean_related': ai_result.get('ocean_related', False),
+            'hazard_detected': ai_result.get('hazard_detected', False),
+            'confidence_score': ai_result.get('confidence_score', 0.0),
+            'scene_description': ai_result.get('scene_description'),
+            'detected_elements': json.dumps(ai_result.get('all_elements', [])),
+            'phash': phash if shared is not None or not fresh else None,  # never index a placeholder result
+            'analyzed_at': datetime.utcnow()
+        }
+        await db.execute(upsert(db, ImageAnalysis, 'post_id', list(analysis)), {'post_id': post.id, **analysis})
+        
+        # Update post with AI results
+        is_ocean = ai_result.get('ocean_related', False)
+        is_hazard = ai_result.get('hazard_detected', False)
+        
+        post.ai_validated = is_ocean and is_hazard
+        post.ai_confidence = ai_result.get('confidence_score', 0.0)
+        post.ai_analysis = json.dumps(ai_result)
+        
+        # Explicit Rejection: only if AI is sure it is NOT related to ocean
+        if not is_ocean and post.ai_confidence > 0.5:
+            post.rejected = True
+            post.rejection_reason = "Image not related to ocean hazard"
+        else:
+            post.rejected = False
+        
+        await db.commit()
+        if shared is not None:
+            analysis_cache_service.add(phash, shared)
+        
+        logger.info(f"AI validation complete: ocean_related={is_ocean}, "
+                   f"hazard_detected={is_hazard}, rejected={post.rejected}")
     finally:
-        db.close()
+        if fresh:
+            # Near-duplicates waiting on this analysis get it (or analyse themselves if it failed)
+            analysis_cache_service.release(phash, shared)
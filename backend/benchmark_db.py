@@ -0,0 +1,162 @@
+"""
+Read/write concurrency benchmark for the SQLite storage profiles.
+
+Seeds a scratch database, then runs concurrent report writers against
+dashboard-style readers for a fixed time, once with the legacy profile
+(rollback journal, no pragmas, one shared pool) and once with the tuned
+profile (WAL + pragmas, separate read-only pool). The live database is
+never touched.
+
+Usage:
+    python benchmark_db.py [--writers 4] [--readers 16] [--duration 10] [--seed 5000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import Base, HazardPost, INCOISAlert, SQLITE_PRAGMAS, DB_POOL_SIZE, DB_READ_POOL_SIZE, make_async_engine
+import geo
+
+HAZARD_TYPES = ['tsunami', 'cyclone', 'high_tide']
+SEVERITIES = ['low', 'medium', 'high']
+
+
+def _random_post(user_id: str) -> Dict:
+    latitude = random.uniform(8.0, 22.0)
+    longitude = random.uniform(68.0, 90.0)
+    return {
+        'user_id': user_id,
+        'hazard_type': random.choice(HAZARD_TYPES),
+        'severity': random.choice(SEVERITIES),
+        'latitude': latitude,
+        'longitude': longitude,
+        'geohash': geo.encode(latitude, longitude),
+        'image_path': 'uploads/benchmark.jpg',
+        'timestamp': datetime.utcnow(),
+        'verified': random.random() < 0.5,
+        'rejected': False,
+    }
+
+
+def seed(path: str, rows: int):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(HazardPost), [_random_post('seed') for _ in range(rows)])
+    engine.dispose()
+
+
+class _Result:
+    def __init__(self):
+        self.read_latencies: List[float] = []
+        self.write_latencies: List[float] = []
+        self.locked = 0
+
+
+async def _writer(sessions, result: _Result, deadline: float, worker: int):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with sessions() as db:
+                db.add(HazardPost(**_random_post(f"bench_{worker}")))
+                await db.commit()
+            result.write_latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            result.locked += 1
+
+
+async def _reader(sessions, result: _Result, deadline: float):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with sessions() as db:
+                # Same shape as /api/dashboard: newest page plus active alerts
+                (await db.scalars(
+                    select(HazardPost).where(HazardPost.rejected == False)
+                    .order_by(HazardPost.timestamp.desc(), HazardPost.id.desc()).limit(50)
+                )).all()
+                (await db.scalars(
+                    select(INCOISAlert).where(INCOISAlert.active == True)
+                    .order_by(INCOISAlert.issued_at.desc()).limit(2)
+                )).all()
+            result.read_latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            result.locked += 1
+
+
+async def run_profile(path: str, profile: str, writers: int, readers: int, duration: float) -> _Result:
+    url = f"sqlite+aiosqlite:///{path}"
+    if profile == "legacy":
+        write_engine = make_async_engine(url, pragmas={})
+        read_engine = write_engine
+    else:
+        write_engine = make_async_engine(url, DB_POOL_SIZE, SQLITE_PRAGMAS)
+        read_engine = make_async_engine(url, DB_READ_POOL_SIZE, SQLITE_PRAGMAS, read_only=True)
+
+    write_sessions = async_sessionmaker(write_engine, expire_on_commit=False)
+    read_sessions = async_sessionmaker(read_engine, expire_on_commit=False)
+
+    result = _Result()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *[_writer(write_sessions, result, deadline, i) for i in range(writers)],
+        *[_reader(read_sessions, result, deadline) for _ in range(readers)]
+    )
+
+    await write_engine.dispose()
+    if read_engine is not write_engine:
+        await read_engine.dispose()
+    return result
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0] * 1000
+    return statistics.quantiles(values, n=100)[int(pct) - 1] * 1000
+
+
+def report(profile: str, result: _Result, duration: float):
+    print(
+        f"{profile:8} "
+        f"{len(result.write_latencies) / duration:10.1f} "
+        f"{len(result.read_latencies) / duration:10.1f} "
+        f"{_percentile(result.write_latencies, 95):12.1f} "
+        f"{_percentile(result.read_latencies, 50):11.1f} "
+        f"{_percentile(result.read_latencies, 95):11.1f} "
+        f"{result.locked:7}"
+    )
+
+
+async def main(writers: int, readers: int, duration: float, rows: int):
+    print(f"{writers} writers, {readers} readers, {duration:g}s per profile, {rows} seeded posts")
+    print(f"{'profile':8} {'writes/s':>10} {'reads/s':>10} {'write p95 ms':>12} "
+          f"{'read p50 ms':>11} {'read p95 ms':>11} {'locked':>7}")
+
+    for profile in ("legacy", "tuned"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "benchmark.db")
+            seed(path, rows)
+            result = await run_profile(path, profile, writers, readers, duration)
+            report(profile, result, duration)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SQLite read/write concurrency per storage profile")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run each profile")
+    parser.add_argument("--seed", type=int, default=5000, help="Posts inserted before the run")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.writers, args.readers, args.duration, args.seed))
@@ -0,0 +1,30 @@
+"""
+Compile the localized UI and guideline catalogs ahead of time.
+
+    python build_catalogs.py [--force]
+"""
+import argparse
+import asyncio
+from database import init_db
+from services.catalog_service import catalog_service
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def build(force: bool = False):
+    catalog_service.load()
+    built = await catalog_service.build(force)
+    for bundle, etag in catalog_service.versions().items():
+        logger.info(f"  {bundle}: {etag}")
+    logger.info(f"Catalogs built: {built}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--force", action="store_true", help="Rebuild every bundle, even if current")
+    args = parser.parse_args()
+
+    init_db()  # translation memory table
+    asyncio.run(build(args.force))
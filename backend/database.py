@@ -1,15 +1,146 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Index, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+from typing import Dict, List, Optional
 import os
 
+import geo
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./ocean_hazard.db")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Async drivers used by the web app when ASYNC_DATABASE_URL is not set explicitly
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+# GET endpoints read through their own pool (point this at a replica on a server DB)
+ASYNC_READ_DATABASE_URL = os.getenv("ASYNC_READ_DATABASE_URL", ASYNC_DATABASE_URL)
+
+# SQLite storage profile, applied to every pooled connection.
+# SQLITE_PROFILE=legacy keeps the stock rollback journal with no pragmas.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),  # safe with WAL, fsync only at checkpoints
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB, i.e. 64 MiB per connection
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+} if SQLITE_PROFILE != "legacy" else {}
+
+# Connection pools (SQLite has a single writer, so the write pool stays small)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _is_memory(url: str) -> bool:
+    return _is_sqlite(url) and (":memory:" in url or url.split("://", 1)[1] in ("", "/"))
+
+
+def apply_sqlite_pragmas(sync_engine, pragmas: Dict, read_only: bool = False):
+    """Run the storage profile pragmas on each new DBAPI connection of an engine"""
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def _engine_args(url: str, pool_size: int) -> Dict:
+    args = {}
+    if _is_sqlite(url):
+        args["connect_args"] = {"check_same_thread": False}
+    if not _is_memory(url):
+        args.update(pool_size=pool_size, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return args
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+def make_async_engine(url: str, pool_size: int = DB_POOL_SIZE,
+                      pragmas: Optional[Dict] = None, read_only: bool = False):
+    """
+    Create an async engine with a sized pool and, for SQLite, the storage profile
+
+    Args:
+        url: Async database URL
+        pool_size: Persistent connections kept in the pool
+        pragmas: SQLite pragmas to apply (defaults to SQLITE_PRAGMAS)
+        read_only: Open SQLite connections with query_only so the pool can never write
+    """
+    async_engine = create_async_engine(url, **_engine_args(url, pool_size))
+    if _is_sqlite(url):
+        apply_sqlite_pragmas(
+            async_engine.sync_engine,
+            SQLITE_PRAGMAS if pragmas is None else pragmas,
+            read_only
+        )
+    return async_engine
+
+
+# Sync engine: migrations, backfills and one-off scripts
+engine = create_engine(DATABASE_URL, **_engine_args(DATABASE_URL, DB_POOL_SIZE))
+if _is_sqlite(DATABASE_URL):
+    apply_sqlite_pragmas(engine, SQLITE_PRAGMAS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engines: request handlers and background processing write through
+# async_engine; GET endpoints read through read_engine
+async_engine = make_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if _is_memory(ASYNC_DATABASE_URL):
+    # Each in-memory connection is its own database, so share the write engine
+    read_engine = async_engine
+else:
+    read_engine = make_async_engine(ASYNC_READ_DATABASE_URL, DB_READ_POOL_SIZE, read_only=True)
+AsyncReadSessionLocal = async_sessionmaker(read_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+
+def upsert(session: AsyncSession, model, key: str, columns: List[str]):
+    """
+    INSERT that rewrites `columns` of the existing row when the unique `key` column collides
+
+    Execute it with one dict of values or a list of them; it is a single
+    statement, so concurrent writers cannot both insert the same key.
+    """
+    dialect = session.bind.dialect.name
+    if dialect == "mysql":
+        stmt = mysql.insert(model)
+        return stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in columns})
+    stmt = (postgresql if dialect == "postgresql" else sqlite).insert(model)
+    return stmt.on_conflict_do_update(
+        index_elements=[key], set_={column: stmt.excluded[column] for column in columns}
+    )
+
+
+def _geohash_default(context):
+    """Column default deriving the spatial key from the inserted coordinates"""
+    params = context.get_current_parameters()
+    return geo.encode(params.get('latitude'), params.get('longitude'))
+
+
 # Database Models
 
 class User(Base):
@@ -39,10 +170,15 @@ class HazardPost(Base):
     latitude = Column(Float)
     longitude = Column(Float)
     location_name = Column(String, nullable=True)
+    geohash = Column(String, nullable=True, default=_geohash_default)
     
     # Image
     image_path = Column(String)
     watermarked_image_path = Column(String, nullable=True)
+    # Sniffed at upload (services.image_service.ImageMetadata); NULL on older posts
+    image_format = Column(String, nullable=True)  # PIL format name, e.g. JPEG
+    image_width = Column(Integer, nullable=True)
+    image_height = Column(Integer, nullable=True)
     
     # Validation Status
     ai_validated = Column(Boolean, default=False)
@@ -55,6 +191,7 @@ class HazardPost(Base):
     verified = Column(Boolean, default=False)  # Both AI and INCOIS
     rejected = Column(Boolean, default=False)
     rejection_reason = Column(Text, nullable=True)
+    notified_status = Column(String, nullable=True)  # status the validation SMS went out for
     
     # Metadata
     timestamp = Column(DateTime, default=datetime.utcnow)
@@ -63,13 +200,40 @@ class HazardPost(Base):
     # Relationships
     user = relationship("User", back_populates="posts")
     image_analysis = relationship("ImageAnalysis", back_populates="post", uselist=False)
+    
+    __table_args__ = (
+        Index("ix_hazard_posts_verified_geohash", "verified", "geohash"),
+        # Keyset pagination: (timestamp, id) newest first, optionally per status
+        Index("ix_hazard_posts_timestamp_id", "timestamp", "id"),
+        Index("ix_hazard_posts_verified_timestamp_id", "verified", "timestamp", "id"),
+        Index("ix_hazard_posts_rejected_timestamp_id", "rejected", "timestamp", "id"),
+    )
+
+
+class PostStat(Base):
+    __tablename__ = "post_stats"
+
+    # One counter row per (hazard_type, status) pair, kept in step with
+    # hazard_posts by services.stats_service
+    hazard_type = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)  # pending, verified, rejected
+    count = Column(Integer, default=0, nullable=False)
+
+
+class CacheGeneration(Base):
+    __tablename__ = "cache_generations"
+
+    # Version of a per-process cache's source data, bumped in the transaction
+    # that changes it so other workers can tell their copy is out of date
+    name = Column(String, primary_key=True)
+    generation = Column(Integer, default=0, nullable=False)
 
 
 class ImageAnalysis(Base):
     __tablename__ = "image_analysis"
     
     id = Column(Integer, primary_key=True, index=True)
-    post_id = Column(Integer, ForeignKey("hazard_posts.id"))
+    post_id = Column(Integer, ForeignKey("hazard_posts.id"), unique=True, index=True)  # one analysis per post
     
     # Google Vision API Results
     labels = Column(Text)  # JSON string
@@ -86,6 +250,10 @@ class ImageAnalysis(Base):
     scene_description = Column(Text, nullable=True)
     detected_elements = Column(Text, nullable=True)  # JSON string
     
+    # 64-bit dHash (hex) of the analysed image, set only for real Gemini results;
+    # services.analysis_cache reuses results for near-duplicate uploads
+    phash = Column(String, nullable=True)
+    
     analyzed_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -108,6 +276,7 @@ class INCOISAlert(Base):
     longitude = Column(Float)
     affected_area = Column(String)
     radius_km = Column(Float, default=50.0)
+    geohash = Column(String, nullable=True, default=_geohash_default)
     
     # Timing
     issued_at = Column(DateTime)
@@ -115,11 +284,17 @@ class INCOISAlert(Base):
     
     # Source
     source = Column(String, default="INCOIS")
-    external_id = Column(String, nullable=True)
+    external_id = Column(String, nullable=True, unique=True, index=True)  # feed id (NULL for alerts added by hand)
     
     # Metadata
     fetched_at = Column(DateTime, default=datetime.utcnow)
     active = Column(Boolean, default=True)
+    
+    __table_args__ = (
+        Index("ix_incois_alerts_active_geohash", "active", "geohash"),
+        Index("ix_incois_alerts_active_issued_at", "issued_at",
+              sqlite_where=text("active = 1"), postgresql_where=text("active")),
+    )
 
 
 class AdminNotification(Base):
@@ -156,6 +331,11 @@ class SafetyAlert(Base):
     
     active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_safety_alerts_active", "id",
+              sqlite_where=text("active = 1"), postgresql_where=text("active")),
+    )
 
 
 class SOSReport(Base):
@@ -188,12 +368,71 @@ class SOSReport(Base):
     
     # Metadata
     timestamp = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_sos_reports_timestamp_id", "timestamp", "id"),
+        Index("ix_sos_reports_active_resolved_timestamp_id", "active", "resolved", "timestamp", "id"),
+    )
+
+
+class ValidationJob(Base):
+    __tablename__ = "validation_jobs"
+
+    # One AI/INCOIS validation run for a post, worked by services.job_service
+    id = Column(Integer, primary_key=True, index=True)
+    post_id = Column(Integer, ForeignKey("hazard_posts.id"), index=True)
+
+    status = Column(String, default="queued", nullable=False)  # queued, running, done, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)  # next eligible run (retry backoff)
+
+    # Lease held by the claiming worker; an expired lease makes the job claimable again
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index("ix_validation_jobs_status_run_after_id", "status", "run_after", "id"),
+    )
 
 
-# Create all tables
+class ImageBlob(Base):
+    __tablename__ = "image_blobs"
+
+    # One file in the content-addressed image store, kept by services.blob_store_service
+    sha256 = Column(String, primary_key=True)
+    path = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=True)
+    ref_count = Column(Integer, default=0, nullable=False)  # hazard_posts + sos_reports rows using it
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TranslationMemory(Base):
+    __tablename__ = "translation_memory"
+
+    # Persistent tier of services.translation_memory_service, one row per (text, language, model)
+    source_hash = Column(String, primary_key=True)  # SHA-256 of the source text
+    target_language = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+
+    source_text = Column(Text, nullable=False)
+    translated_text = Column(Text, nullable=False)
+    version = Column(Integer, default=1, nullable=False)  # TRANSLATION_CACHE_VERSION when stored
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Bring the schema up to date (Alembic migrations in migrations/versions)
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    from alembic import command
+    from alembic.config import Config
+    
+    config = Config(os.path.join(BASE_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BASE_DIR, "migrations"))
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, "head")
 
 
 # Dependency to get DB session
@@ -203,3 +442,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency to get an async DB session (used by all API endpoints that write)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependency to get a read-only async DB session (used by GET endpoints)
+async def get_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
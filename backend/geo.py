@@ -0,0 +1,220 @@
+"""
+Geohash spatial keys and viewport (bounding box) helpers.
+
+Posts and alerts store a fixed-precision geohash; because geohash strings
+sort in Z-order, every coarser cell is a contiguous string range, so a
+viewport can be answered with a handful of indexed range scans.
+"""
+import math
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, or_
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# ~4.8m x 4.8m cells; coarser levels are plain prefixes of this
+GEOHASH_PRECISION = 9
+
+# Upper bound on the number of cells used to cover one viewport
+MAX_COVER_CELLS = 32
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> Optional[str]:
+    """
+    Encode a coordinate as a geohash string
+
+    Returns:
+        Geohash of the given precision, or None if a coordinate is missing
+    """
+    if latitude is None or longitude is None:
+        return None
+
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves longitude first
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lng_lo = mid
+            else:
+                bits = bits * 2
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_lo = mid
+            else:
+                bits = bits * 2
+                lat_hi = mid
+
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Return (height, width) in degrees of a geohash cell"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def precision_for_zoom(zoom: float) -> int:
+    """Pick a geohash precision whose cells are roughly a quarter of the viewport"""
+    return max(1, min(GEOHASH_PRECISION, int(zoom * 2 / 5) + 1))
+
+
+def normalize_bbox(north: float, south: float, east: float, west: float) -> Tuple[float, float, float, float]:
+    """Clamp latitudes and wrap longitudes from map libraries into [-180, 180]"""
+    north = max(-90.0, min(90.0, north))
+    south = max(-90.0, min(90.0, south))
+    if east - west >= 360.0:
+        return north, south, 180.0, -180.0
+
+    def wrap(lng):
+        if -180.0 <= lng <= 180.0:
+            return lng
+        return ((lng + 180.0) % 360.0) - 180.0
+
+    return north, south, wrap(east), wrap(west)
+
+
+def _split_antimeridian(north, south, east, west) -> List[Tuple[float, float, float, float]]:
+    if west <= east:
+        return [(north, south, east, west)]
+    return [(north, south, 180.0, west), (north, south, east, -180.0)]
+
+
+def _cell_index_range(south, north, west, east, precision):
+    height, width = cell_size(precision)
+    rows = (
+        max(0, int(math.floor((south + 90.0) / height))),
+        min(int(180.0 / height) - 1, int(math.floor((north + 90.0) / height)))
+    )
+    cols = (
+        max(0, int(math.floor((west + 180.0) / width))),
+        min(int(360.0 / width) - 1, int(math.floor((east + 180.0) / width)))
+    )
+    return rows, cols
+
+
+def cover(north: float, south: float, east: float, west: float,
+          zoom: Optional[float] = None) -> List[str]:
+    """
+    Find the geohash cells covering a bounding box
+
+    The precision starts from the zoom level (or the finest useful level)
+    and is coarsened until the viewport fits in MAX_COVER_CELLS cells.
+    """
+    boxes = _split_antimeridian(north, south, east, west)
+    precision = precision_for_zoom(zoom) if zoom is not None else 6
+
+    while True:
+        ranges = [_cell_index_range(s, n, w, e, precision) for n, s, e, w in boxes]
+        count = sum((r[1] - r[0] + 1) * (c[1] - c[0] + 1) for r, c in ranges)
+        if count <= MAX_COVER_CELLS or precision == 1:
+            break
+        precision -= 1
+
+    height, width = cell_size(precision)
+    cells = set()
+    for (row_lo, row_hi), (col_lo, col_hi) in ranges:
+        for row in range(row_lo, row_hi + 1):
+            for col in range(col_lo, col_hi + 1):
+                cells.add(encode(
+                    (row + 0.5) * height - 90.0,
+                    (col + 0.5) * width - 180.0,
+                    precision
+                ))
+
+    return sorted(cells)
+
+
+def _prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with prefix"""
+    chars = list(prefix)
+    while chars:
+        index = _BASE32.index(chars[-1])
+        if index + 1 < len(_BASE32):
+            chars[-1] = _BASE32[index + 1]
+            return ''.join(chars)
+        chars.pop()
+    return None
+
+
+def prefix_ranges(prefixes: List[str]) -> List[Tuple[str, Optional[str]]]:
+    """Turn sorted cell prefixes into merged [lo, hi) string ranges"""
+    ranges = []
+    for prefix in sorted(prefixes):
+        lo, hi = prefix, _prefix_upper_bound(prefix)
+        if ranges and ranges[-1][1] == lo:
+            ranges[-1] = (ranges[-1][0], hi)
+        else:
+            ranges.append((lo, hi))
+    return ranges
+
+
+def bbox_filter(model, north: float, south: float, east: float, west: float,
+                zoom: Optional[float] = None):
+    """
+    Build a SQLAlchemy filter selecting rows of model inside a bounding box
+
+    The geohash ranges hit the index; the exact latitude/longitude test
+    trims the partial cells along the viewport edges. Rows without a
+    geohash yet (written before the column existed and not backfilled)
+    are matched by the latitude/longitude test alone, so they never drop
+    out of a viewport.
+    """
+    north, south, east, west = normalize_bbox(north, south, east, west)
+    ranges = prefix_ranges(cover(north, south, east, west, zoom))
+    key_clauses = [
+        and_(model.geohash >= lo, model.geohash < hi) if hi else model.geohash >= lo
+        for lo, hi in ranges
+    ]
+
+    if west <= east:
+        lng_clause = model.longitude.between(west, east)
+    else:
+        lng_clause = or_(model.longitude >= west, model.longitude <= east)
+
+    return and_(
+        or_(*key_clauses, model.geohash == None),
+        model.latitude.between(south, north),
+        lng_clause
+    )
+
+
+# ---- Web Mercator (slippy map) tiles ----
+
+MAX_MERCATOR_LATITUDE = 85.05112878
+
+
+def tile_for(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """Return the (x, y) of the zoom-level tile containing a coordinate"""
+    n = 1 << zoom
+    lat = math.radians(max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, latitude)))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return the (north, south, east, west) bounds of a tile"""
+    n = 1 << zoom
+
+    def lat_of(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * row / n))))
+
+    return lat_of(y), lat_of(y + 1), (x + 1) / n * 360.0 - 180.0, x / n * 360.0 - 180.0
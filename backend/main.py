@@ -1,13 +1,15 @@
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Form, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from pydantic import BaseModel
 import os
+import re
 import json
-import shutil
 from datetime import datetime
 import logging
 import schemas # Added to support schemas.ClassName usage
@@ -18,7 +20,9 @@ load_dotenv()
 
 
 import database
-from database import get_db, init_db, SessionLocal, User, HazardPost, ImageAnalysis, INCOISAlert, AdminNotification, SafetyAlert
+import geo
+from pagination import paginate
+from database import get_async_db, get_read_db, init_db, AsyncSessionLocal, User, HazardPost, ImageAnalysis, INCOISAlert, AdminNotification, SafetyAlert
 from schemas import (
     UserCreate, UserResponse, HazardPostCreate, HazardPostResponse, HazardPostDetail,
     DashboardResponse, DashboardPost, INCOISAlertResponse, MapDataResponse, MapMarker,
@@ -28,7 +32,17 @@ from services.vision_service import vision_service
 from services.twilio_service import twilio_service
 from services.translation_service import translation_service
 from services.incois_service import incois_service
-from services.image_service import image_service
+from services.incois_sync_service import incois_sync_service
+from services.image_service import image_service, ImageRejected
+from services.stats_service import stats_service
+from services.heatmap_service import heatmap_service
+from services.tile_service import tile_service
+from services.job_service import job_service
+from services.analysis_cache_service import analysis_cache_service
+from services.blob_store_service import blob_store_service
+from services.translation_memory_service import translation_memory_service
+from services.catalog_service import catalog_service
+from background_tasks import schedule_watermark, schedule_missing_watermarks, image_variants
 
 # Configure logging
 logging.basicConfig(
@@ -52,6 +66,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Create upload directories
@@ -67,23 +82,37 @@ async def startup_event():
     init_db()
     logger.info("Database initialized")
     
-    # Fetch and store INCOIS alerts
-    db = SessionLocal()
-    try:
-        await sync_incois_alerts(db=db)
-    except Exception as e:
-        logger.error(f"Startup INCOIS sync failed: {str(e)}")
-    finally:
-        db.close()
-    db = SessionLocal()
-    try:
-        await sync_incois_alerts(db)
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        await stats_service.ensure_initialized(db)
+        await heatmap_service.rebuild(db)
+        await analysis_cache_service.load(db)
+        await blob_store_service.collect_garbage(db)
+        # Posts may have changed while we were down
+        tile_service.clear()
+        # Queue posts left pending by a crash or by the old in-process tasks
+        await job_service.resubmit_pending(db)
+        await schedule_missing_watermarks(db)
+        # Rows from before the geohash column still show up on the map, but bypass its index
+        if await db.scalar(select(HazardPost.id).where(
+            HazardPost.geohash == None, HazardPost.latitude != None
+        ).limit(1)):
+            logger.warning("Some posts have no geohash yet; run `python backfill.py geohash`")
+    
+    job_service.start()
+    await translation_memory_service.purge_stale()
+    catalog_service.start()
+    
+    # Fetch and store INCOIS alerts now, then every INCOIS_POLL_INTERVAL_SECONDS
+    incois_sync_service.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await job_service.stop()
+    await incois_sync_service.stop()
+    image_service.shutdown()
+    await translation_service.close()
+    await incois_service.close()
     logger.info("Application shutting down")
 
 
@@ -105,16 +134,16 @@ async def health_check():
 # ==================== USER ENDPOINTS ====================
 
 @app.post("/api/users", response_model=UserResponse)
-async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Create or get user"""
     # Check if user exists
-    existing_user = db.query(User).filter(User.user_id == user.user_id).first()
+    existing_user = await db.scalar(select(User).where(User.user_id == user.user_id))
     
     if existing_user:
         # Update language preference
         existing_user.language_preference = user.language_preference
-        db.commit()
-        db.refresh(existing_user)
+        await db.commit()
+        await db.refresh(existing_user)
         return existing_user
     
     # Create new user
@@ -123,17 +152,17 @@ async def create_user(user: UserCreate, db: Session = Depends(get_db)):
         language_preference=user.language_preference
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     logger.info(f"User created: {user.user_id}")
     return new_user
 
 
 @app.get("/api/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str, db: Session = Depends(get_db)):
+async def get_user(user_id: str, db: AsyncSession = Depends(get_read_db)):
     """Get user by ID"""
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user = await db.scalar(select(User).where(User.user_id == user_id))
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -142,9 +171,9 @@ async def get_user(user_id: str, db: Session = Depends(get_db)):
 
 
 @app.put("/api/users/{user_id}/language")
-async def update_language(user_id: str, language: str, db: Session = Depends(get_db)):
+async def update_language(user_id: str, language: str, db: AsyncSession = Depends(get_async_db)):
     """Update user language preference"""
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user = await db.scalar(select(User).where(User.user_id == user_id))
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -153,14 +182,13 @@ async def update_language(user_id: str, language: str, db: Session = Depends(get
         raise HTTPException(status_code=400, detail="Invalid language code")
     
     user.language_preference = language
-    db.commit()
+    await db.commit()
     
     return {"success": True, "language": language}
 
 
 
 # ==================== HAZARD POST ENDPOINTS ====================
-from background_tasks import process_post_background
 
 
 @app.post("/api/posts", response_model=ValidationResult)
@@ -174,12 +202,11 @@ async def create_hazard_post(
     location_name: Optional[str] = Form(None),
     synced: bool = Form(True),
     image: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Create new hazard post with image
-    Performs AI validation and INCOIS verification in background
+    AI validation and INCOIS verification run from the durable job queue
     """
     try:
         # Validate hazard type
@@ -190,26 +217,12 @@ async def create_hazard_post(
         if severity not in ['low', 'medium', 'high']:
             raise HTTPException(status_code=400, detail="Invalid severity level")
         
-        # Save uploaded image
+        # Stream into the image store; size, hash and format are checked on the way in
         timestamp = datetime.utcnow()
-        filename = f"{user_id}_{int(timestamp.timestamp())}_{image.filename}"
-        image_path = os.path.join("uploads", filename)
-        
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
-        
-        logger.info(f"Image uploaded: {image_path}")
-        
-        # Validate image format (Quick check)
-        is_valid = await image_service.validate_image(image_path)
-        if not is_valid:
-            os.remove(image_path)
-            raise HTTPException(status_code=400, detail="Invalid image file or format")
-        
-        # Add watermark (Fast operation)
-        watermarked_path = await image_service.add_watermark(
-            image_path, location_name or "Unknown", latitude, longitude, timestamp
-        )
+        try:
+            metadata = await blob_store_service.store_upload(image)
+        except ImageRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
         
         # Create post record with initial state
         post = HazardPost(
@@ -220,8 +233,11 @@ async def create_hazard_post(
             latitude=latitude,
             longitude=longitude,
             location_name=location_name,
-            image_path=image_path,
-            watermarked_image_path=watermarked_path,
+            image_path=metadata.path,
+            watermarked_image_path=None,  # filled in by the watermark stage
+            image_format=metadata.format,
+            image_width=metadata.width,
+            image_height=metadata.height,
             timestamp=timestamp,
             synced=synced,
             # Initial validation state
@@ -232,8 +248,14 @@ async def create_hazard_post(
             rejected=False
         )
         db.add(post)
-        db.commit()
-        db.refresh(post)
+        await db.flush()
+        
+        # Queue heavy AI/INCOIS processing in the same transaction as the post
+        job_service.enqueue(db, post.id)
+        await db.commit()
+        await db.refresh(post)
+        job_service.notify()
+        schedule_watermark(post)
         
         logger.info(f"Post created: ID={post.id}")
         
@@ -243,9 +265,6 @@ async def create_hazard_post(
                 post.id, location_name or f"{latitude}, {longitude}"
             )
         
-        # Add to background tasks for heavy AI/INCOIS processing
-        background_tasks.add_task(process_post_background, post.id)
-        
         return ValidationResult(
             success=True,
             ai_validated=False,
@@ -267,57 +286,71 @@ async def create_hazard_post(
 
 @app.get("/api/posts", response_model=List[HazardPostResponse])
 async def get_all_posts(
+    response: Response,
     verified_only: bool = False,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get all hazard posts"""
-    query = db.query(HazardPost)
+    """
+    Get hazard posts, newest first
+    Pass the X-Next-Cursor response header back as ?cursor= for the next page
+    """
+    stmt = select(HazardPost)
     
     if verified_only:
-        query = query.filter(HazardPost.verified == True)
+        stmt = stmt.where(HazardPost.verified == True)
     
-    posts = query.order_by(HazardPost.timestamp.desc()).limit(limit).all()
+    posts, next_cursor = await paginate(db, stmt, HazardPost, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
-    return posts
+    return [with_variants(HazardPostResponse, post) for post in posts]
 
 
 @app.get("/api/posts/{post_id}", response_model=HazardPostDetail)
-async def get_post(post_id: int, db: Session = Depends(get_db)):
+async def get_post(post_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get specific post with details"""
-    post = db.query(HazardPost).filter(HazardPost.id == post_id).first()
+    post = await db.scalar(
+        select(HazardPost)
+        .options(selectinload(HazardPost.image_analysis))
+        .where(HazardPost.id == post_id)
+    )
     
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    return post
+    return with_variants(HazardPostDetail, post)
+
+
+def with_variants(schema, post: HazardPost):
+    """Serialize a post with the srcset variant map of its watermarked image"""
+    return schema.model_validate(post).model_copy(
+        update={"image_variants": image_variants(post.watermarked_image_path)}
+    )
 
 
 # ==================== DASHBOARD ENDPOINTS ====================
 
 @app.get("/api/dashboard", response_model=DashboardResponse)
-async def get_dashboard(db: Session = Depends(get_db)):
+async def get_dashboard(cursor: Optional[str] = None, db: AsyncSession = Depends(get_read_db)):
     """Get dashboard data with all non-rejected posts and INCOIS alerts"""
     
     # Get all non-rejected posts (includes verified AND pending)
     # This ensures posts show up immediately while AI analyzes them
-    all_posts = db.query(HazardPost).filter(
-        HazardPost.rejected == False  # Show everything except rejected
-    ).order_by(HazardPost.timestamp.desc()).limit(50).all()
+    all_posts, next_cursor = await paginate(
+        db, select(HazardPost).where(HazardPost.rejected == False),  # Show everything except rejected
+        HazardPost, cursor, 50
+    )
     
     # Get INCOIS alerts (Limit to 2 as per user request)
-    incois_alerts = db.query(INCOISAlert).filter(
-        INCOISAlert.active == True
-    ).order_by(INCOISAlert.issued_at.desc()).limit(2).all()
-    
-    # Get statistics
-    total_posts = db.query(HazardPost).count()
-    verified_count = db.query(HazardPost).filter(HazardPost.verified == True).count()
-    pending_count = db.query(HazardPost).filter(
-        HazardPost.verified == False,
-        HazardPost.rejected == False
-    ).count()
-    rejected_count = db.query(HazardPost).filter(HazardPost.rejected == True).count()
+    incois_alerts = (await db.scalars(
+        select(INCOISAlert).where(INCOISAlert.active == True)
+        .order_by(INCOISAlert.issued_at.desc()).limit(2)
+    )).all()
+    
+    # Get statistics (maintained counters, no table scans)
+    stats = await stats_service.get_counts(db)
     
     # Format posts for dashboard with status indicators
     dashboard_posts = [
@@ -330,6 +363,7 @@ async def get_dashboard(db: Session = Depends(get_db)):
             longitude=post.longitude,
             location_name=post.location_name,
             watermarked_image_path=post.watermarked_image_path or post.image_path,
+            image_variants=image_variants(post.watermarked_image_path),
             ai_confidence=post.ai_confidence,
             verified=post.verified,
             timestamp=post.timestamp
@@ -340,21 +374,42 @@ async def get_dashboard(db: Session = Depends(get_db)):
     return DashboardResponse(
         posts=dashboard_posts,
         incois_alerts=[INCOISAlertResponse.model_validate(alert) for alert in incois_alerts],
-        total_posts=total_posts,
-        verified_posts=verified_count,
-        pending_posts=pending_count
+        total_posts=stats['total'],
+        verified_posts=stats['verified'],
+        pending_posts=stats['pending'],
+        next_cursor=next_cursor
     )
 
 # ==================== MAP ENDPOINTS ====================
 
 @app.get("/api/map/data", response_model=MapDataResponse)
-async def get_map_data(db: Session = Depends(get_db)):
-    """Get map markers and heatmap data"""
+async def get_map_data(
+    n: Optional[float] = None,
+    s: Optional[float] = None,
+    e: Optional[float] = None,
+    w: Optional[float] = None,
+    zoom: Optional[float] = None,
+    limit: int = 2000,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Get map markers and heatmap data
+    If a viewport (n, s, e, w) is given, only markers inside it are returned
+    """
     markers = []
-    heatmap_data = []
+    
+    viewport = (n, s, e, w)
+    has_viewport = all(v is not None for v in viewport)
+    if any(v is not None for v in viewport) and not has_viewport:
+        raise HTTPException(status_code=400, detail="Viewport requires n, s, e and w")
+    if has_viewport and s > n:
+        raise HTTPException(status_code=400, detail="Invalid viewport: s is north of n")
     
     # Get verified posts
-    posts = db.query(HazardPost).filter(HazardPost.verified == True).all()
+    stmt = select(HazardPost).where(HazardPost.verified == True)
+    if has_viewport:
+        stmt = stmt.where(geo.bbox_filter(HazardPost, n, s, e, w, zoom))
+    posts = (await db.scalars(stmt.order_by(HazardPost.timestamp.desc()).limit(limit))).all()
     
     for post in posts:
         markers.append(MapMarker(
@@ -369,16 +424,12 @@ async def get_map_data(db: Session = Depends(get_db)):
             timestamp=post.timestamp,
             verified=post.verified
         ))
-        
-        # Add to heatmap
-        heatmap_data.append({
-            "lat": post.latitude,
-            "lng": post.longitude,
-            "intensity": 1.0 if post.severity == "high" else 0.6 if post.severity == "medium" else 0.3
-        })
     
     # Get INCOIS alerts
-    alerts = db.query(INCOISAlert).filter(INCOISAlert.active == True).all()
+    stmt = select(INCOISAlert).where(INCOISAlert.active == True)
+    if has_viewport:
+        stmt = stmt.where(geo.bbox_filter(INCOISAlert, n, s, e, w, zoom))
+    alerts = (await db.scalars(stmt)).all()
     
     for alert in alerts:
         markers.append(MapMarker(
@@ -393,13 +444,13 @@ async def get_map_data(db: Session = Depends(get_db)):
             timestamp=alert.issued_at,
             verified=True
         ))
-        
-        # Add to heatmap with higher intensity
-        heatmap_data.append({
-            "lat": alert.latitude,
-            "lng": alert.longitude,
-            "intensity": 1.5
-        })
+    
+    # Heatmap comes pre-aggregated: one value per grid cell, not per report
+    await heatmap_service.refresh(db)
+    if has_viewport:
+        heatmap_data = heatmap_service.query(n, s, e, w, zoom or 0)["cells"]
+    else:
+        heatmap_data = heatmap_service.query(90, -90, 180, -180, zoom or 0)["cells"]
     
     return MapDataResponse(
         markers=markers,
@@ -407,6 +458,32 @@ async def get_map_data(db: Session = Depends(get_db)):
     )
 
 
+@app.get("/api/map/heatmap", response_model=schemas.HeatmapResponse)
+async def get_heatmap(n: float, s: float, e: float, w: float, zoom: float = 0,
+                      db: AsyncSession = Depends(get_read_db)):
+    """Get pre-aggregated heatmap cells (severity-weighted) for a viewport"""
+    if s > n:
+        raise HTTPException(status_code=400, detail="Invalid viewport: s is north of n")
+    
+    await heatmap_service.refresh(db)
+    return heatmap_service.query(n, s, e, w, zoom)
+
+
+@app.get("/api/map/tiles/{z}/{x}/{y}")
+async def get_map_tile(z: int, x: int, y: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    """Get a cached marker tile (clustered at low zoom levels)"""
+    if not tile_service.is_valid(z, x, y):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    
+    body, etag = await tile_service.get_tile(db, z, x, y)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=30"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 # ==================== TRANSLATION ENDPOINTS ====================
 
 @app.post("/api/translate", response_model=TranslationResponse)
@@ -428,111 +505,72 @@ async def translate_text(request: TranslationRequest):
 
 
 @app.get("/api/ui-translations/{language}")
-async def get_ui_translations(language: str):
+async def get_ui_translations(language: str, request: Request, v: Optional[str] = None):
     """Get UI element translations for specified language"""
     if language not in ['en', 'hi', 'kn']:
         raise HTTPException(status_code=400, detail="Invalid language code")
     
-    # Define UI elements to translate
-    ui_elements = {
-        "app_title": "Ocean Hazard Live Reporting",
-        "report_hazard": "Report Hazard",
-        "dashboard": "Dashboard",
-        "map": "Map",
-        "select_language": "Select Language",
-        "hazard_type": "Hazard Type",
-        "tsunami": "Tsunami",
-        "cyclone": "Cyclone",
-        "high_tide": "High Tide",
-        "severity": "Severity",
-        "low": "Low",
-        "medium": "Medium",
-        "high": "High",
-        "description": "Description",
-        "location": "Location",
-        "capture_image": "Capture Image",
-        "upload_image": "Upload Image",
-        "submit_report": "Submit Report",
-        "verified_reports": "Verified Reports",
-        "pending_reports": "Pending Reports",
-        "incois_alerts": "INCOIS Alerts",
-        "ai_confidence": "AI Confidence",
-        "view_details": "View Details",
-        "report_submitted": "Report Submitted Successfully",
-        "report_verified": "Report Verified",
-        "report_rejected": "Report Rejected",
-        "offline_mode": "Offline Mode - Will sync when online",
-        "network_restored": "Network Restored - Syncing data",
-        "safety_guidelines": "Safety Guidelines",
-        "evacuation_info": "Evacuation Information"
-    }
+    return catalog_response(request, "ui", language, v)
+
+
+@app.get("/api/catalogs")
+async def get_catalog_versions():
+    """ETag of every compiled catalog bundle (pass it as ?v= to get an immutable response)"""
+    return catalog_service.versions()
+
+
+# One entity tag (optionally weak) or "*" in an If-None-Match list
+_ETAG_TOKEN = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match check (RFC 9110 weak comparison): true if any tag in the
+    comma-separated header, or "*", matches etag with W/ prefixes ignored
+    """
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in _ETAG_TOKEN.findall(if_none_match):
+        if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == opaque:
+            return True
+    return False
+
+
+def catalog_response(request: Request, name: str, language: str, version: Optional[str]) -> Response:
+    """Serve a precompiled catalog bundle with ETag revalidation"""
+    body, etag, exact = catalog_service.get(name, language)
     
-    if language == 'en':
-        return ui_elements
+    if not exact:
+        cache_control = "no-cache"  # English stand-in until the translation is compiled
+    elif version and f'"{version}"' == etag:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = f"public, max-age={catalog_service.max_age}"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
     
-    try:
-        translated = await translation_service.translate_ui_elements(
-            ui_elements, language
-        )
-        return translated
-    except Exception as e:
-        logger.error(f"UI translation error: {str(e)}")
-        return ui_elements  # Return English on error
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 # ==================== INCOIS SYNC ENDPOINTS ====================
 
 @app.post("/api/incois/sync")
-async def sync_incois_alerts(db: Session = Depends(get_db)):
+async def sync_incois_alerts(db: AsyncSession = Depends(get_async_db)):
     """Fetch and sync INCOIS alerts"""
     try:
-        alerts = await incois_service.fetch_active_alerts()
-        
-        synced_count = 0
-        
-        for alert_data in alerts:
-            # Check if alert already exists
-            existing = db.query(INCOISAlert).filter(
-                INCOISAlert.external_id == alert_data.get('id')
-            ).first()
-            
-            if existing:
-                # Update existing alert
-                existing.active = alert_data.get('active', True)
-                existing.valid_until = datetime.fromisoformat(alert_data.get('valid_until')) if alert_data.get('valid_until') else None
-            else:
-                # Create new alert
-                new_alert = INCOISAlert(
-                    alert_type=alert_data.get('alert_type'),
-                    severity=alert_data.get('severity'),
-                    title=alert_data.get('title'),
-                    description=alert_data.get('description'),
-                    latitude=alert_data.get('latitude'),
-                    longitude=alert_data.get('longitude'),
-                    affected_area=alert_data.get('affected_area'),
-                    radius_km=alert_data.get('radius_km', 50.0),
-                    issued_at=datetime.fromisoformat(alert_data.get('issued_at')),
-                    valid_until=datetime.fromisoformat(alert_data.get('valid_until')) if alert_data.get('valid_until') else None,
-                    source=alert_data.get('source', 'INCOIS'),
-                    external_id=str(alert_data.get('id')),
-                    active=alert_data.get('active', True)
-                )
-                db.add(new_alert)
-                synced_count += 1
-        
-        db.commit()
-        
-        logger.info(f"Synced {synced_count} new INCOIS alerts")
-        
-        return {
-            "success": True,
-            "synced": synced_count,
-            "total": len(alerts)
-        }
-        
+        result = await incois_sync_service.sync(db, force=True)
     except Exception as e:
         logger.error(f"INCOIS sync error: {str(e)}")
         raise HTTPException(status_code=500, detail="INCOIS sync failed")
+    
+    return {
+        "success": True,
+        "synced": result['inserted'],
+        **result
+    }
 
 
 # ==================== OFFLINE SYNC ENDPOINTS ====================
@@ -540,7 +578,7 @@ async def sync_incois_alerts(db: Session = Depends(get_db)):
 @app.post("/api/offline/sync", response_model=SyncResponse)
 async def sync_offline_post(
     sync_data: OfflinePostSync,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Sync offline post when network is restored"""
     try:
@@ -549,19 +587,11 @@ async def sync_offline_post(
         # Decode base64 image
         image_data = base64.b64decode(sync_data.image_base64)
         
-        # Save image
         ts_str = sync_data.timestamp.replace('Z', '+00:00')
         timestamp = datetime.fromisoformat(ts_str)
-        filename = f"{sync_data.user_id}_{int(timestamp.timestamp())}_offline.jpg"
         
-        # Ensure path uses forward slashes for DB consistency
-        image_path = f"uploads/{filename}" 
-        
-        # Use os.path.join for filesystem operations
-        fs_image_path = os.path.join("uploads", filename)
-        
-        with open(fs_image_path, "wb") as f:
-            f.write(image_data)
+        # Save image (store paths already use forward slashes for DB consistency)
+        metadata = await blob_store_service.store_bytes(image_data)
         
         # Create post (similar to create_hazard_post but from offline data)
         post = HazardPost(
@@ -572,19 +602,23 @@ async def sync_offline_post(
             latitude=sync_data.latitude,
             longitude=sync_data.longitude,
             location_name=sync_data.location_name,
-            image_path=image_path, # URL friendly path
+            image_path=metadata.path, # URL friendly path
+            image_format=metadata.format,
+            image_width=metadata.width,
+            image_height=metadata.height,
             timestamp=timestamp,
             synced=True  # Now synced
         )
         db.add(post)
-        db.commit()
-        db.refresh(post)
+        await db.flush()
+        job_service.enqueue(db, post.id)
+        await db.commit()
+        await db.refresh(post)
+        job_service.notify()
+        schedule_watermark(post)
         
         logger.info(f"Offline post synced: ID={post.id}")
         
-        # Trigger validation in background (would use background tasks in production)
-        # For now, just return success
-        
         return SyncResponse(
             success=True,
             post_id=post.id,
@@ -603,116 +637,12 @@ async def sync_offline_post(
 # ==================== GUIDELINES ENDPOINTS ====================
 
 @app.get("/api/guidelines/{hazard_type}")
-async def get_safety_guidelines(hazard_type: str, language: str = "en"):
+async def get_safety_guidelines(hazard_type: str, request: Request, language: str = "en", v: Optional[str] = None):
     """Get safety guidelines for specific hazard type"""
-    guidelines = {
-        "tsunami": {
-            "title": "Tsunami Safety Guidelines",
-            "precautions": [
-                "Move to higher ground immediately",
-                "Stay away from the beach and coastal areas",
-                "Listen to emergency broadcasts",
-                "Do not return until authorities say it's safe"
-            ],
-            "evacuation": [
-                "Evacuate vertically (go to upper floors) if you cannot evacuate horizontally",
-                "Take emergency supplies with you",
-                "Help others who need assistance",
-                "Follow designated evacuation routes"
-            ],
-            "dos": [
-                "Stay informed through official channels",
-                "Keep emergency kit ready",
-                "Know your evacuation routes",
-                "Practice evacuation drills"
-            ],
-            "donts": [
-                "Don't go to the beach to watch the waves",
-                "Don't wait for official warnings if you feel strong earthquake",
-                "Don't return home until all-clear is given",
-                "Don't drive unless absolutely necessary"
-            ]
-        },
-        "cyclone": {
-            "title": "Cyclone Safety Guidelines",
-            "precautions": [
-                "Stay indoors and away from windows",
-                "Secure loose objects outside",
-                "Stock up on food, water, and medicines",
-                "Charge all electronic devices"
-            ],
-            "evacuation": [
-                "Move to designated cyclone shelters if advised",
-                "Take important documents and valuables",
-                "Turn off electricity and gas",
-                "Inform family members of your location"
-            ],
-            "dos": [
-                "Monitor weather updates regularly",
-                "Keep emergency supplies ready",
-                "Reinforce doors and windows",
-                "Stay in the strongest part of the building"
-            ],
-            "donts": [
-                "Don't venture outside during the storm",
-                "Don't use electrical appliances",
-                "Don't touch wet switches or wires",
-                "Don't spread rumors or unverified information"
-            ]
-        },
-        "high_tide": {
-            "title": "High Tide Safety Guidelines",
-            "precautions": [
-                "Stay away from low-lying coastal areas",
-                "Monitor tide schedules and warnings",
-                "Secure boats and marine equipment",
-                "Be prepared to evacuate if necessary"
-            ],
-            "evacuation": [
-                "Move to higher ground if flooding occurs",
-                "Take valuables and important documents",
-                "Follow local authority instructions",
-                "Help elderly and children evacuate first"
-            ],
-            "dos": [
-                "Check tide timings regularly",
-                "Keep emergency contact numbers handy",
-                "Maintain drainage systems around your property",
-                "Stay informed about weather conditions"
-            ],
-            "donts": [
-                "Don't park vehicles in low-lying areas",
-                "Don't ignore warning signs",
-                "Don't attempt to cross flooded areas",
-                "Don't delay evacuation if advised"
-            ]
-        }
-    }
-    
-    if hazard_type not in guidelines:
+    if f"guidelines.{hazard_type}" not in catalog_service.contents():
         raise HTTPException(status_code=404, detail="Hazard type not found")
     
-    guideline_data = guidelines[hazard_type]
-    
-    # Translate if not English
-    if language != 'en':
-        try:
-            # Translate all text fields
-            for key in guideline_data:
-                if isinstance(guideline_data[key], str):
-                    guideline_data[key] = await translation_service.translate(
-                        guideline_data[key], language
-                    )
-                elif isinstance(guideline_data[key], list):
-                    translated_list = []
-                    for item in guideline_data[key]:
-                        translated_item = await translation_service.translate(item, language)
-                        translated_list.append(translated_item)
-                    guideline_data[key] = translated_list
-        except Exception as e:
-            logger.error(f"Guidelines translation error: {str(e)}")
-    
-    return guideline_data
+    return catalog_response(request, f"guidelines.{hazard_type}", language, v)
 
 
 # ==================== ADMIN ENDPOINTS ====================
@@ -723,9 +653,9 @@ class PostStatusUpdate(BaseModel):
     rejection_reason: Optional[str] = None
 
 @app.put("/api/admin/posts/{post_id}/status", response_model=HazardPostResponse)
-async def update_post_status(post_id: int, status: PostStatusUpdate, db: Session = Depends(get_db)):
+async def update_post_status(post_id: int, status: PostStatusUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update post status (verify/reject)"""
-    post = db.query(HazardPost).filter(HazardPost.id == post_id).first()
+    post = await db.get(HazardPost, post_id)
     
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -734,49 +664,88 @@ async def update_post_status(post_id: int, status: PostStatusUpdate, db: Session
     post.rejected = status.rejected
     post.rejection_reason = status.rejection_reason
     
-    db.commit()
-    db.refresh(post)
+    await db.commit()
+    await db.refresh(post)
+    tile_service.invalidate_point(post.latitude, post.longitude)
     
     return post
 
 # --- Safety Alerts Endpoints ---
 
 @app.post("/api/admin/safety-alerts", response_model=schemas.SafetyAlertResponse)
-def create_safety_alert(alert: schemas.SafetyAlertCreate, db: Session = Depends(get_db)):
+async def create_safety_alert(alert: schemas.SafetyAlertCreate, db: AsyncSession = Depends(get_async_db)):
     db_alert = SafetyAlert(
         location_name=alert.location_name,
         hazard_type=alert.hazard_type,
         active=True
     )
     db.add(db_alert)
-    db.commit()
-    db.refresh(db_alert)
+    await db.commit()
+    await db.refresh(db_alert)
     return db_alert
 
 
 @app.get("/api/safety-alerts", response_model=List[schemas.SafetyAlertResponse])
-def get_active_safety_alerts(db: Session = Depends(get_db)):
-    return db.query(SafetyAlert).filter(SafetyAlert.active == True).all()
+async def get_active_safety_alerts(db: AsyncSession = Depends(get_read_db)):
+    return (await db.scalars(select(SafetyAlert).where(SafetyAlert.active == True))).all()
 
 
 @app.put("/api/admin/safety-alerts/{alert_id}/deactivate")
-def deactivate_safety_alert(alert_id: int, db: Session = Depends(get_db)):
-    alert = db.query(SafetyAlert).filter(SafetyAlert.id == alert_id).first()
+async def deactivate_safety_alert(alert_id: int, db: AsyncSession = Depends(get_async_db)):
+    alert = await db.get(SafetyAlert, alert_id)
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
     
     alert.active = False
-    db.commit()
+    await db.commit()
     return {"message": "Alert deactivated"}
 
+@app.get("/api/admin/jobs")
+async def get_job_queue(db: AsyncSession = Depends(get_read_db)):
+    """Get validation queue depth (jobs per status, oldest queued age)"""
+    return await job_service.get_depth(db)
+
+
+@app.get("/api/admin/analysis-cache")
+async def get_analysis_cache_stats():
+    """Get perceptual-hash analysis cache size and hit rate"""
+    return analysis_cache_service.stats()
+
+
+@app.get("/api/admin/translation-cache")
+async def get_translation_cache_stats():
+    """Get translation memory size and hit/miss counters, and the Groq rate limiter state"""
+    return {**translation_memory_service.stats(), "rate_limit": translation_service.limiter.stats()}
+
+
+@app.delete("/api/admin/translation-cache")
+async def invalidate_translation_cache(language: Optional[str] = None):
+    """Drop stored translations (all, or one target language)"""
+    removed = await translation_memory_service.invalidate(language)
+    return {"removed": removed}
+
+
+@app.get("/api/admin/incois-cache")
+async def get_incois_cache_stats():
+    """Get INCOIS alert snapshot age, hit/fetch counters and poller state"""
+    return {**incois_service.stats(), "sync": incois_sync_service.stats()}
+
+
+@app.get("/api/admin/image-store")
+async def get_image_store_stats(db: AsyncSession = Depends(get_read_db)):
+    """Get blob count, reference count and bytes held by the image store"""
+    return await blob_store_service.stats(db)
+
+
 @app.get("/api/admin/historical-data")
-async def get_historical_data(db: Session = Depends(get_db)):
+async def get_historical_data(db: AsyncSession = Depends(get_read_db)):
     """Get status for admin analysis (Sensors & Stats)"""
     
     # Get post stats
-    total_posts = db.query(HazardPost).count()
-    verified_posts = db.query(HazardPost).filter(HazardPost.verified == True).count()
-    rejected_posts = db.query(HazardPost).filter(HazardPost.rejected == True).count()
+    stats = await stats_service.get_counts(db)
+    total_posts = stats['total']
+    verified_posts = stats['verified']
+    rejected_posts = stats['rejected']
     
     # Realistic Sensor Data - Active High Wave Alert on Kerala/Karnataka Coast
     sensors = [
@@ -796,7 +765,8 @@ async def get_historical_data(db: Session = Depends(get_db)):
             "total_reports": total_posts,
             "verified": verified_posts,
             "rejected": rejected_posts,
-            "accuracy_rate": (verified_posts / total_posts * 100) if total_posts > 0 else 0
+            "accuracy_rate": (verified_posts / total_posts * 100) if total_posts > 0 else 0,
+            "by_hazard_type": stats['by_hazard_type']
         }
     }
 
@@ -812,17 +782,18 @@ async def create_sos_report(
     contact_number: Optional[str] = Form(None),
     location_name: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new SOS report"""
     
     image_path = None
     if image:
-        timestamp = datetime.utcnow()
-        filename = f"sos_{int(timestamp.timestamp())}_{image.filename}"
-        image_path = os.path.join("uploads", filename)
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        try:
+            image_path = (await blob_store_service.store_upload(image)).path
+        except ImageRejected as e:
+            # Never lose an SOS over its attachment
+            logger.warning(f"SOS image dropped: {str(e)}")
+            image_path = None
 
     sos_report = database.SOSReport(
         emergency_type=emergency_type,
@@ -836,25 +807,36 @@ async def create_sos_report(
     )
     
     db.add(sos_report)
-    db.commit()
-    db.refresh(sos_report)
+    await db.commit()
+    await db.refresh(sos_report)
     
     return sos_report
 
 
 @app.get("/api/sos/reports", response_model=List[schemas.SOSReportResponse])
-def get_sos_reports(active_only: bool = True, db: Session = Depends(get_db)):
-    """Get SOS reports"""
-    query = db.query(database.SOSReport)
+async def get_sos_reports(
+    response: Response,
+    active_only: bool = True,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get SOS reports, newest first (paged like /api/posts)"""
+    stmt = select(database.SOSReport)
     if active_only:
-        query = query.filter(database.SOSReport.active == True, database.SOSReport.resolved == False)
-    return query.order_by(database.SOSReport.timestamp.desc()).all()
+        stmt = stmt.where(database.SOSReport.active == True, database.SOSReport.resolved == False)
+    
+    reports, next_cursor = await paginate(db, stmt, database.SOSReport, cursor, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    
+    return reports
 
 
 @app.put("/api/sos/{sos_id}/deploy")
-def deploy_rescue_team(sos_id: int, deployment: schemas.SOSDeployment, db: Session = Depends(get_db)):
+async def deploy_rescue_team(sos_id: int, deployment: schemas.SOSDeployment, db: AsyncSession = Depends(get_async_db)):
     """Deploy rescue team to SOS location"""
-    report = db.query(database.SOSReport).filter(database.SOSReport.id == sos_id).first()
+    report = await db.get(database.SOSReport, sos_id)
     if not report:
         raise HTTPException(status_code=404, detail="SOS Report not found")
         
@@ -863,21 +845,21 @@ def deploy_rescue_team(sos_id: int, deployment: schemas.SOSDeployment, db: Sessi
     report.deployed_at = datetime.utcnow()
     report.rescue_notes = deployment.rescue_notes
     
-    db.commit()
+    await db.commit()
     return {"message": "Rescue team deployed successfully"}
 
 
 @app.put("/api/sos/{sos_id}/resolve")
-def resolve_sos_report(sos_id: int, db: Session = Depends(get_db)):
+async def resolve_sos_report(sos_id: int, db: AsyncSession = Depends(get_async_db)):
     """Mark SOS report as resolved"""
-    report = db.query(database.SOSReport).filter(database.SOSReport.id == sos_id).first()
+    report = await db.get(database.SOSReport, sos_id)
     if not report:
         raise HTTPException(status_code=404, detail="SOS Report not found")
         
     report.resolved = True
     report.active = False
     
-    db.commit()
+    await db.commit()
     return {"message": "SOS report resolved"}
 
 
@@ -0,0 +1,75 @@
+"""
+Move uploads from the flat uploads/ directory into the content-addressed store.
+
+Every hazard_posts / sos_reports image_path outside uploads/blobs is hashed,
+moved to its blob (byte-identical files collapse into one) and rewritten;
+reference counts are then rebuilt. Safe to re-run: paths already in the
+store are skipped, and rows whose file is missing are left untouched.
+
+    python migrate_image_store.py [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+from sqlalchemy import select, update
+from database import AsyncSessionLocal, init_db
+from services.blob_store_service import blob_store_service, REFERRERS
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def migrate(dry_run: bool = False):
+    async with AsyncSessionLocal() as db:
+        legacy_paths = set()
+        for model in REFERRERS:
+            paths = (await db.scalars(
+                select(model.image_path).where(model.image_path != None).distinct()
+            )).all()
+            legacy_paths.update(path for path in paths if not blob_store_service.blob_hash(path))
+
+        moved, missing, saved_bytes = 0, 0, 0
+        blobs = set()
+        for path in sorted(legacy_paths):
+            if not os.path.isfile(path):
+                missing += 1
+                logger.warning(f"Missing file, left as is: {path}")
+                continue
+
+            size = os.path.getsize(path)
+            if dry_run:
+                logger.info(f"Would move {path}")
+                moved += 1
+                continue
+
+            blob_path, _ = blob_store_service.store_file(path, keep_original=True)
+            if blob_path in blobs:
+                saved_bytes += size
+            blobs.add(blob_path)
+
+            # Core UPDATEs skip the flush hook; reconcile below recounts everything
+            for model in REFERRERS:
+                await db.execute(
+                    update(model).where(model.image_path == path).values(image_path=blob_path)
+                )
+            await db.commit()
+            os.remove(path)  # only once no row points at it any more
+            moved += 1
+
+        if not dry_run:
+            await blob_store_service.reconcile(db)
+
+        logger.info(
+            f"Image store migration{' (dry run)' if dry_run else ''}: {moved} files moved into "
+            f"{len(blobs)} blobs, {saved_bytes} duplicate bytes removed, {missing} missing"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="List the files that would move")
+    args = parser.parse_args()
+
+    init_db()
+    asyncio.run(migrate(args.dry_run))
@@ -0,0 +1,35 @@
+"""
+Idempotent DDL helpers for migrations.
+
+Databases created before Alembic was introduced already contain some or
+all of these objects (create_all, backfill scripts), so every revision
+checks before it creates and the first upgrade needs no manual stamping.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def has_table(table: str) -> bool:
+    return table in _inspector().get_table_names()
+
+
+def has_column(table: str, column: str) -> bool:
+    return column in [col["name"] for col in _inspector().get_columns(table)]
+
+
+def has_index(table: str, name: str) -> bool:
+    return name in [index["name"] for index in _inspector().get_indexes(table)]
+
+
+def create_index_if_missing(name: str, table: str, columns, **kwargs):
+    if not has_index(table, name):
+        op.create_index(name, table, columns, **kwargs)
+
+
+def drop_index_if_exists(name: str, table: str):
+    if has_table(table) and has_index(table, name):
+        op.drop_index(name, table_name=table)
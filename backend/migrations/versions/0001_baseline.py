@@ -0,0 +1,149 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table, create_index_if_missing
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.String()),
+            sa.Column('language_preference', sa.String()),
+            sa.Column('created_at', sa.DateTime()),
+        )
+    create_index_if_missing('ix_users_id', 'users', ['id'])
+    create_index_if_missing('ix_users_user_id', 'users', ['user_id'], unique=True)
+
+    if not has_table('hazard_posts'):
+        op.create_table(
+            'hazard_posts',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_id', sa.String(), sa.ForeignKey('users.user_id')),
+            sa.Column('hazard_type', sa.String()),
+            sa.Column('severity', sa.String()),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('latitude', sa.Float()),
+            sa.Column('longitude', sa.Float()),
+            sa.Column('location_name', sa.String(), nullable=True),
+            sa.Column('image_path', sa.String()),
+            sa.Column('watermarked_image_path', sa.String(), nullable=True),
+            sa.Column('ai_validated', sa.Boolean()),
+            sa.Column('ai_confidence', sa.Float()),
+            sa.Column('ai_analysis', sa.Text(), nullable=True),
+            sa.Column('incois_validated', sa.Boolean()),
+            sa.Column('incois_correlation', sa.Text(), nullable=True),
+            sa.Column('verified', sa.Boolean()),
+            sa.Column('rejected', sa.Boolean()),
+            sa.Column('rejection_reason', sa.Text(), nullable=True),
+            sa.Column('timestamp', sa.DateTime()),
+            sa.Column('synced', sa.Boolean()),
+        )
+    create_index_if_missing('ix_hazard_posts_id', 'hazard_posts', ['id'])
+
+    if not has_table('image_analysis'):
+        op.create_table(
+            'image_analysis',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('post_id', sa.Integer(), sa.ForeignKey('hazard_posts.id')),
+            sa.Column('labels', sa.Text()),
+            sa.Column('objects', sa.Text()),
+            sa.Column('landmarks', sa.Text(), nullable=True),
+            sa.Column('web_entities', sa.Text(), nullable=True),
+            sa.Column('ocean_related', sa.Boolean()),
+            sa.Column('hazard_detected', sa.Boolean()),
+            sa.Column('confidence_score', sa.Float()),
+            sa.Column('scene_description', sa.Text(), nullable=True),
+            sa.Column('detected_elements', sa.Text(), nullable=True),
+            sa.Column('analyzed_at', sa.DateTime()),
+        )
+    create_index_if_missing('ix_image_analysis_id', 'image_analysis', ['id'])
+
+    if not has_table('incois_alerts'):
+        op.create_table(
+            'incois_alerts',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('alert_type', sa.String()),
+            sa.Column('severity', sa.String()),
+            sa.Column('title', sa.String()),
+            sa.Column('description', sa.Text()),
+            sa.Column('latitude', sa.Float()),
+            sa.Column('longitude', sa.Float()),
+            sa.Column('affected_area', sa.String()),
+            sa.Column('radius_km', sa.Float()),
+            sa.Column('issued_at', sa.DateTime()),
+            sa.Column('valid_until', sa.DateTime(), nullable=True),
+            sa.Column('source', sa.String()),
+            sa.Column('external_id', sa.String(), nullable=True),
+            sa.Column('fetched_at', sa.DateTime()),
+            sa.Column('active', sa.Boolean()),
+        )
+    create_index_if_missing('ix_incois_alerts_id', 'incois_alerts', ['id'])
+
+    if not has_table('admin_notifications'):
+        op.create_table(
+            'admin_notifications',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('notification_type', sa.String()),
+            sa.Column('title', sa.String()),
+            sa.Column('message', sa.Text()),
+            sa.Column('post_id', sa.Integer(), nullable=True),
+            sa.Column('user_id', sa.String(), nullable=True),
+            sa.Column('sms_sent', sa.Boolean()),
+            sa.Column('sms_sid', sa.String(), nullable=True),
+            sa.Column('sms_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('read', sa.Boolean()),
+        )
+    create_index_if_missing('ix_admin_notifications_id', 'admin_notifications', ['id'])
+
+    if not has_table('safety_alerts'):
+        op.create_table(
+            'safety_alerts',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('location_name', sa.String()),
+            sa.Column('hazard_type', sa.String()),
+            sa.Column('active', sa.Boolean()),
+            sa.Column('created_at', sa.DateTime()),
+        )
+    create_index_if_missing('ix_safety_alerts_id', 'safety_alerts', ['id'])
+
+    if not has_table('sos_reports'):
+        op.create_table(
+            'sos_reports',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('emergency_type', sa.String()),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('contact_number', sa.String(), nullable=True),
+            sa.Column('latitude', sa.Float()),
+            sa.Column('longitude', sa.Float()),
+            sa.Column('location_name', sa.String(), nullable=True),
+            sa.Column('image_path', sa.String(), nullable=True),
+            sa.Column('active', sa.Boolean()),
+            sa.Column('deployed', sa.Boolean()),
+            sa.Column('resolved', sa.Boolean()),
+            sa.Column('deployed_by', sa.String(), nullable=True),
+            sa.Column('deployed_at', sa.DateTime(), nullable=True),
+            sa.Column('rescue_notes', sa.Text(), nullable=True),
+            sa.Column('timestamp', sa.DateTime()),
+        )
+    create_index_if_missing('ix_sos_reports_id', 'sos_reports', ['id'])
+
+
+def downgrade():
+    for table in ('sos_reports', 'safety_alerts', 'admin_notifications',
+                  'incois_alerts', 'image_analysis', 'hazard_posts', 'users'):
+        if has_table(table):
+            op.drop_table(table)
@@ -0,0 +1,33 @@
+"""post_stats summary table
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16
+
+Counters are filled by the app on startup (stats_service.ensure_initialized)
+or explicitly with `python reconcile_stats.py`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table('post_stats'):
+        op.create_table(
+            'post_stats',
+            sa.Column('hazard_type', sa.String(), primary_key=True),
+            sa.Column('status', sa.String(), primary_key=True),
+            sa.Column('count', sa.Integer(), nullable=False),
+        )
+
+
+def downgrade():
+    if has_table('post_stats'):
+        op.drop_table('post_stats')
@@ -0,0 +1,37 @@
+"""geohash spatial keys for posts and alerts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16
+
+Only adds the nullable columns and indexes. Existing rows are filled
+online, in small batches, with `python backfill.py geohash`; until then
+geo.bbox_filter matches them by latitude/longitude alone.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_column, create_index_if_missing, drop_index_if_exists
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('hazard_posts', 'incois_alerts'):
+        if not has_column(table, 'geohash'):
+            op.add_column(table, sa.Column('geohash', sa.String(), nullable=True))
+
+    create_index_if_missing('ix_hazard_posts_verified_geohash', 'hazard_posts', ['verified', 'geohash'])
+    create_index_if_missing('ix_incois_alerts_active_geohash', 'incois_alerts', ['active', 'geohash'])
+
+
+def downgrade():
+    drop_index_if_exists('ix_incois_alerts_active_geohash', 'incois_alerts')
+    drop_index_if_exists('ix_hazard_posts_verified_geohash', 'hazard_posts')
+    for table in ('incois_alerts', 'hazard_posts'):
+        if has_column(table, 'geohash'):
+            with op.batch_alter_table(table) as batch:
+                batch.drop_column('geohash')
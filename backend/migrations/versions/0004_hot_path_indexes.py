@@ -0,0 +1,48 @@
+"""hot-path composite and partial indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-16
+
+One index per query shape in main.py:
+- post listings / dashboard feed: (timestamp, id), optionally behind verified or rejected
+- SOS listing: (timestamp, id), optionally behind (active, resolved)
+- dashboard alerts: issued_at where active (partial)
+- INCOIS sync lookups: external_id
+- active safety alerts: partial on active
+- post detail: image_analysis.post_id
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import create_index_if_missing, drop_index_if_exists
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_hazard_posts_timestamp_id', 'hazard_posts', ['timestamp', 'id'], {}),
+    ('ix_hazard_posts_verified_timestamp_id', 'hazard_posts', ['verified', 'timestamp', 'id'], {}),
+    ('ix_hazard_posts_rejected_timestamp_id', 'hazard_posts', ['rejected', 'timestamp', 'id'], {}),
+    ('ix_sos_reports_timestamp_id', 'sos_reports', ['timestamp', 'id'], {}),
+    ('ix_sos_reports_active_resolved_timestamp_id', 'sos_reports',
+     ['active', 'resolved', 'timestamp', 'id'], {}),
+    ('ix_incois_alerts_active_issued_at', 'incois_alerts', ['issued_at'],
+     {'sqlite_where': sa.text('active = 1'), 'postgresql_where': sa.text('active')}),
+    ('ix_incois_alerts_external_id', 'incois_alerts', ['external_id'], {}),
+    ('ix_safety_alerts_active', 'safety_alerts', ['id'],
+     {'sqlite_where': sa.text('active = 1'), 'postgresql_where': sa.text('active')}),
+    ('ix_image_analysis_post_id', 'image_analysis', ['post_id'], {}),
+]
+
+
+def upgrade():
+    for name, table, columns, kwargs in INDEXES:
+        create_index_if_missing(name, table, columns, **kwargs)
+
+
+def downgrade():
+    for name, table, _, _ in reversed(INDEXES):
+        drop_index_if_exists(name, table)
@@ -0,0 +1,44 @@
+"""validation_jobs queue table
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-16
+
+Posts left pending by earlier in-process background tasks are queued by
+the app on startup (job_service.resubmit_pending).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table, create_index_if_missing
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table('validation_jobs'):
+        op.create_table(
+            'validation_jobs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('post_id', sa.Integer(), sa.ForeignKey('hazard_posts.id'), nullable=True),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('run_after', sa.DateTime(), nullable=False),
+            sa.Column('locked_by', sa.String(), nullable=True),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+    create_index_if_missing('ix_validation_jobs_id', 'validation_jobs', ['id'])
+    create_index_if_missing('ix_validation_jobs_post_id', 'validation_jobs', ['post_id'])
+    create_index_if_missing('ix_validation_jobs_status_run_after_id', 'validation_jobs',
+                            ['status', 'run_after', 'id'])
+
+
+def downgrade():
+    if has_table('validation_jobs'):
+        op.drop_table('validation_jobs')
@@ -0,0 +1,29 @@
+"""perceptual hash on image_analysis
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-16
+
+Rows analysed before this revision have no hash and simply never match
+the analysis cache.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_column
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_column('image_analysis', 'phash'):
+        op.add_column('image_analysis', sa.Column('phash', sa.String(), nullable=True))
+
+
+def downgrade():
+    if has_column('image_analysis', 'phash'):
+        with op.batch_alter_table('image_analysis') as batch:
+            batch.drop_column('phash')
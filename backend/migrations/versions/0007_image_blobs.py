@@ -0,0 +1,35 @@
+"""image_blobs table for the content-addressed image store
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-16
+
+Existing uploads are moved into the store, deduplicated and their
+image_path values rewritten with `python migrate_image_store.py`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table('image_blobs'):
+        op.create_table(
+            'image_blobs',
+            sa.Column('sha256', sa.String(), primary_key=True),
+            sa.Column('path', sa.String(), nullable=False),
+            sa.Column('size_bytes', sa.Integer(), nullable=True),
+            sa.Column('ref_count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+
+
+def downgrade():
+    if has_table('image_blobs'):
+        op.drop_table('image_blobs')
@@ -0,0 +1,36 @@
+"""translation_memory table
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+
+Starts empty; it fills as strings are translated.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table('translation_memory'):
+        op.create_table(
+            'translation_memory',
+            sa.Column('source_hash', sa.String(), primary_key=True),
+            sa.Column('target_language', sa.String(), primary_key=True),
+            sa.Column('model', sa.String(), primary_key=True),
+            sa.Column('source_text', sa.Text(), nullable=False),
+            sa.Column('translated_text', sa.Text(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+        )
+
+
+def downgrade():
+    if has_table('translation_memory'):
+        op.drop_table('translation_memory')
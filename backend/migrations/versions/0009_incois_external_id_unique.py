@@ -0,0 +1,51 @@
+"""unique incois_alerts.external_id
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+
+The INCOIS sync upserts by external_id, so it becomes unique (NULLs,
+i.e. alerts not from the feed, stay allowed). Duplicate rows left by
+earlier syncs are collapsed onto the oldest one first.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table
+
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_incois_alerts_external_id'
+
+
+def _index_unique():
+    for index in sa.inspect(op.get_bind()).get_indexes('incois_alerts'):
+        if index['name'] == INDEX:
+            return bool(index['unique'])
+    return None
+
+
+def upgrade():
+    if not has_table('incois_alerts'):
+        return
+    unique = _index_unique()
+    if unique:
+        return
+
+    op.execute(sa.text(
+        "DELETE FROM incois_alerts WHERE external_id IS NOT NULL AND id NOT IN ("
+        "SELECT MIN(id) FROM incois_alerts WHERE external_id IS NOT NULL GROUP BY external_id)"
+    ))
+    if unique is not None:
+        op.drop_index(INDEX, table_name='incois_alerts')
+    op.create_index(INDEX, 'incois_alerts', ['external_id'], unique=True)
+
+
+def downgrade():
+    if not has_table('incois_alerts') or not _index_unique():
+        return
+    op.drop_index(INDEX, table_name='incois_alerts')
+    op.create_index(INDEX, 'incois_alerts', ['external_id'])
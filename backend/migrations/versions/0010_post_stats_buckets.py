@@ -0,0 +1,30 @@
+"""post_stats: separate bucket for verified and rejected posts
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17
+
+Posts flagged both verified and rejected used to be counted as rejected
+only; they now have their own bucket and count towards both statuses.
+The counters are cleared here and rebuilt by the app on startup
+(stats_service.ensure_initialized) or with `python reconcile_stats.py`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table
+
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if has_table('post_stats'):
+        op.execute(sa.text("DELETE FROM post_stats"))
+
+
+def downgrade():
+    if has_table('post_stats'):
+        op.execute(sa.text("DELETE FROM post_stats"))
@@ -0,0 +1,62 @@
+"""idempotent validation jobs: one image_analysis per post, SMS marker
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17
+
+A validation job that is run again (retry or expired lease) upserts its
+analysis by post_id, so image_analysis.post_id becomes unique; duplicate
+rows left by earlier re-runs are collapsed onto the newest one first.
+hazard_posts.notified_status records which status the validation SMS
+was sent for; posts already validated are marked as notified so nothing
+is sent twice.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_column, has_table
+
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+INDEX = 'ix_image_analysis_post_id'
+
+
+def _index_unique():
+    for index in sa.inspect(op.get_bind()).get_indexes('image_analysis'):
+        if index['name'] == INDEX:
+            return bool(index['unique'])
+    return None
+
+
+def upgrade():
+    if has_table('image_analysis'):
+        unique = _index_unique()
+        if not unique:
+            op.execute(sa.text(
+                "DELETE FROM image_analysis WHERE post_id IS NOT NULL AND id NOT IN ("
+                "SELECT MAX(id) FROM image_analysis WHERE post_id IS NOT NULL GROUP BY post_id)"
+            ))
+            if unique is not None:
+                op.drop_index(INDEX, table_name='image_analysis')
+            op.create_index(INDEX, 'image_analysis', ['post_id'], unique=True)
+
+    if has_table('hazard_posts') and not has_column('hazard_posts', 'notified_status'):
+        op.add_column('hazard_posts', sa.Column('notified_status', sa.String(), nullable=True))
+        op.execute(sa.text(
+            "UPDATE hazard_posts SET notified_status = CASE "
+            "WHEN verified AND NOT rejected THEN 'verified' WHEN rejected THEN 'rejected' END "
+            "WHERE ai_analysis IS NOT NULL"
+        ))
+
+
+def downgrade():
+    if has_table('hazard_posts') and has_column('hazard_posts', 'notified_status'):
+        with op.batch_alter_table('hazard_posts') as batch:
+            batch.drop_column('notified_status')
+
+    if has_table('image_analysis') and _index_unique():
+        op.drop_index(INDEX, table_name='image_analysis')
+        op.create_index(INDEX, 'image_analysis', ['post_id'])
@@ -0,0 +1,42 @@
+"""image format and dimensions on hazard_posts
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17
+
+Filled in at upload from what ingest sniffed; posts created before this
+revision keep NULLs and are simply processed without the shortcuts.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_column, has_table
+
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+COLUMNS = [
+    ('image_format', sa.String()),
+    ('image_width', sa.Integer()),
+    ('image_height', sa.Integer()),
+]
+
+
+def upgrade():
+    if not has_table('hazard_posts'):
+        return
+    for name, type_ in COLUMNS:
+        if not has_column('hazard_posts', name):
+            op.add_column('hazard_posts', sa.Column(name, type_, nullable=True))
+
+
+def downgrade():
+    if not has_table('hazard_posts'):
+        return
+    present = [name for name, _ in COLUMNS if has_column('hazard_posts', name)]
+    if present:
+        with op.batch_alter_table('hazard_posts') as batch:
+            for name in present:
+                batch.drop_column(name)
@@ -0,0 +1,33 @@
+"""cache_generations: cross-worker version counters for in-memory caches
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-17
+
+services.heatmap_service keeps its grids in each worker's memory; the
+counters here are bumped by every transaction that changes verified posts
+or synced alerts, so a worker whose grids lag behind rebuilds them.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import has_table
+
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table('cache_generations'):
+        op.create_table(
+            'cache_generations',
+            sa.Column('name', sa.String(), primary_key=True),
+            sa.Column('generation', sa.Integer(), nullable=False),
+        )
+
+
+def downgrade():
+    if has_table('cache_generations'):
+        op.drop_table('cache_generations')
@@ -0,0 +1,67 @@
+"""
+Keyset (cursor) pagination over (timestamp, id), newest first.
+
+Cursors are opaque to clients: URL-safe base64 of the last row's
+timestamp and id. Each page is a single indexed range scan, so deep
+pages cost the same as the first one. Rows without a timestamp come
+after all dated rows, newest id first (the same on every backend,
+whatever its NULL ordering).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(timestamp: Optional[datetime], row_id: int) -> str:
+    payload = json.dumps([timestamp.isoformat() if timestamp else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(timestamp) if timestamp is not None else None, int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def paginate(db: AsyncSession, stmt: Select, model, cursor: Optional[str],
+                   limit: int) -> Tuple[List, Optional[str]]:
+    """
+    Fetch one page of a select() ordered by (timestamp, id) descending
+
+    Returns:
+        Tuple of (rows, next_cursor); next_cursor is None on the last page
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    timestamp, row_id = decode_cursor(cursor) if cursor else (None, None)
+
+    rows = []
+    if not cursor or timestamp is not None:
+        dated = stmt.where(model.timestamp != None)
+        if cursor:
+            dated = dated.where(tuple_(model.timestamp, model.id) < tuple_(timestamp, row_id))
+        dated = dated.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1)
+        rows = list((await db.scalars(dated)).all())
+
+    if len(rows) <= limit:
+        # Past the dated rows: the undated tail
+        undated = stmt.where(model.timestamp == None)
+        if cursor and timestamp is None:
+            undated = undated.where(model.id < row_id)
+        undated = undated.order_by(model.id.desc()).limit(limit + 1 - len(rows))
+        rows.extend((await db.scalars(undated)).all())
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.timestamp, last.id)
@@ -0,0 +1,105 @@
+"""
+Token-bucket limiter for upstream APIs with per-minute request and token quotas.
+
+Callers wait in FIFO order (asyncio.Lock is fair), so concurrent requests
+share the quota first come, first served; a caller that would have to wait
+past its deadline gets RateLimitTimeout instead of queueing forever. A 429
+from upstream pauses every caller until its Retry-After has passed.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+
+class RateLimitTimeout(asyncio.TimeoutError):
+    """The quota would not allow the call before the caller's deadline"""
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class TokenBucketLimiter:
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None):
+        self._requests = _Bucket(requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+        self.waits = 0
+        self.timeouts = 0
+        self.throttled = 0
+
+    async def acquire(self, tokens: int = 0, deadline: Optional[float] = None) -> int:
+        """
+        Wait for one request (and `tokens` tokens) of quota
+
+        Args:
+            tokens: Estimated tokens the call will use (clamped to the per-minute quota)
+            deadline: time.monotonic() by which the call must be allowed to start
+
+        Returns:
+            The number of tokens reserved (pass the difference to settle() afterwards)
+
+        Raises:
+            RateLimitTimeout: the wait would run past the deadline
+        """
+        if self._tokens:
+            tokens = min(tokens, int(self._tokens.capacity))
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._requests.refill(now)
+                delay = max(self._paused_until - now, self._requests.wait_for(1))
+                if self._tokens:
+                    self._tokens.refill(now)
+                    delay = max(delay, self._tokens.wait_for(tokens))
+
+                if delay <= 0:
+                    self._requests.level -= 1
+                    if self._tokens:
+                        self._tokens.level -= tokens
+                    return tokens
+
+                if deadline is not None and now + delay > deadline:
+                    self.timeouts += 1
+                    raise RateLimitTimeout(f"Rate limit wait of {delay:.1f}s exceeds the deadline")
+                self.waits += 1
+                await asyncio.sleep(delay)
+
+    def settle(self, reserved: int, used: int):
+        """Correct the token bucket once the real usage of a call is known"""
+        if self._tokens:
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + reserved - used)
+
+    def pause(self, seconds: float):
+        """Hold every caller back (e.g. after a 429 with Retry-After)"""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        self._requests.refill(now)
+        if self._tokens:
+            self._tokens.refill(now)
+        return {
+            "requests_available": round(self._requests.level, 1),
+            "requests_per_minute": self._requests.capacity,
+            "tokens_available": round(self._tokens.level) if self._tokens else None,
+            "tokens_per_minute": self._tokens.capacity if self._tokens else None,
+            "paused_seconds": round(max(0.0, self._paused_until - now), 1),
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "throttled": self.throttled
+        }
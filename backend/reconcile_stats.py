@@ -0,0 +1,31 @@
+"""
+Rebuild the post_stats counters from hazard_posts.
+
+Posts are bucketed by (hazard_type, status) where status is pending,
+verified, rejected or verified_rejected; the dashboard reports verified
+and rejected independently (as `verified == True` / `rejected == True`
+counts), so a post flagged both ways appears under both.
+
+    python reconcile_stats.py
+"""
+import asyncio
+from database import AsyncSessionLocal, init_db
+from services.stats_service import stats_service
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def reconcile():
+    async with AsyncSessionLocal() as db:
+        counts = await stats_service.reconcile(db)
+        logger.info(
+            f"Post stats rebuilt: total={counts['total']}, verified={counts['verified']}, "
+            f"pending={counts['pending']}, rejected={counts['rejected']}"
+        )
+        for hazard_type, per_status in counts['by_hazard_type'].items():
+            logger.info(f"  {hazard_type}: {per_status}")
+
+if __name__ == "__main__":
+    init_db()
+    asyncio.run(reconcile())
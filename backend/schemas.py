@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 
@@ -42,13 +42,14 @@ class HazardPostResponse(BaseModel):
     location_name: Optional[str]
     image_path: str
     watermarked_image_path: Optional[str]
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None  # format -> width -> path (srcset)
     ai_validated: bool
     ai_confidence: float
     incois_validated: bool
     verified: bool
     rejected: bool
     rejection_reason: Optional[str]
-    timestamp: datetime
+    timestamp: Optional[datetime] = None  # NULL on some legacy rows
     synced: bool
     
     class Config:
@@ -108,9 +109,10 @@ class DashboardPost(BaseModel):
     longitude: float
     location_name: Optional[str]
     watermarked_image_path: str
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None  # format -> width -> path (srcset)
     ai_confidence: float
     verified: bool
-    timestamp: datetime
+    timestamp: Optional[datetime] = None  # NULL on some legacy rows
 
 
 class DashboardResponse(BaseModel):
@@ -119,6 +121,7 @@ class DashboardResponse(BaseModel):
     total_posts: int
     verified_posts: int
     pending_posts: int
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for older posts
 
 
 # Translation Schemas
@@ -164,6 +167,17 @@ class MapDataResponse(BaseModel):
     heatmap_data: List[dict]
 
 
+class HeatmapCell(BaseModel):
+    lat: float
+    lng: float
+    intensity: float
+
+
+class HeatmapResponse(BaseModel):
+    zoom: int  # grid level actually used (clamped to the configured range)
+    cells: List[HeatmapCell]
+
+
 # Offline Sync Schemas
 class OfflinePostSync(BaseModel):
     user_id: str
@@ -231,7 +245,7 @@ class SOSReportResponse(BaseModel):
     deployed_by: Optional[str]
     deployed_at: Optional[datetime]
     rescue_notes: Optional[str]
-    timestamp: datetime
+    timestamp: Optional[datetime] = None  # NULL on some legacy rows
     
     class Config:
         from_attributes = True
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from database import HazardPost, ImageAnalysis
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(image_path: str, size: int = 8) -> Optional[str]:
+    """
+    64-bit difference hash of an image (robust to re-encoding and resizing)
+
+    Returns:
+        16-character hex string, or None if the image cannot be read
+    """
+    try:
+        with Image.open(image_path) as img:
+            img.draft('L', (size * 4, size * 4))  # cheap JPEG downscale while decoding
+            pixels = list(img.convert('L').resize((size + 1, size), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.warning(f"Could not hash image {image_path}: {str(e)}")
+        return None
+
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+class AnalysisCacheService:
+    """
+    Reuses Gemini results for near-duplicate uploads.
+
+    Each real analysis is indexed by the dHash of its image (persisted on
+    ImageAnalysis.phash); a new upload within ANALYSIS_CACHE_MAX_DISTANCE
+    bits of an indexed hash gets that result instead of a Gemini call. The
+    in-memory index is an LRU bounded by ANALYSIS_CACHE_SIZE and is warmed
+    from the most recent analyses on startup.
+
+    Lookups avoid a full scan by multi-index hashing: the 64 bits are cut
+    into max_distance + 1 bands, and two hashes within max_distance bits
+    must agree on at least one whole band, so only the entries sharing a
+    band value with the query are compared. Analyses still running are
+    registered too, so a burst of near-duplicates waits for the first
+    Gemini call instead of each making its own.
+    """
+
+    def __init__(self):
+        self.max_size = int(os.getenv("ANALYSIS_CACHE_SIZE", "5000"))
+        self.max_distance = int(os.getenv("ANALYSIS_CACHE_MAX_DISTANCE", "6"))
+
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()  # hash -> vision result
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+        # Band i covers bits [bounds[i], bounds[i + 1]); one bucket dict per band
+        bands = min(64, self.max_distance + 1)
+        bounds = [64 * i // bands for i in range(bands + 1)]
+        self._bands = [(low, (1 << (high - low)) - 1) for low, high in zip(bounds, bounds[1:])]
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in self._bands]
+
+        # hash -> result future of an analysis in progress (event loop only)
+        self._in_flight: Dict[int, asyncio.Future] = {}
+
+    async def compute_hash(self, image_path: str) -> Optional[str]:
+        """dHash an image off the event loop"""
+        return await asyncio.to_thread(dhash, image_path)
+
+    def _band_values(self, value: int):
+        return [(value >> low) & mask for low, mask in self._bands]
+
+    def lookup(self, phash: Optional[str]) -> Optional[Dict]:
+        """Return the cached result of the closest indexed image within the threshold"""
+        if phash is None:
+            return None
+        value = int(phash, 16)
+
+        with self._lock:
+            best_key, best_distance = None, self.max_distance + 1
+            if value in self._entries:
+                best_key = value
+            else:
+                candidates = set()
+                for bucket, band in zip(self._buckets, self._band_values(value)):
+                    candidates.update(bucket.get(band, ()))
+                for key in candidates:
+                    distance = (key ^ value).bit_count()
+                    if distance < best_distance:
+                        best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            return dict(self._entries[best_key])
+
+    async def lookup_or_claim(self, phash: Optional[str]) -> Optional[Dict]:
+        """
+        Like lookup, but also waits for a near-duplicate that is being analysed
+
+        Returns:
+            The reused result, or None when the caller has to analyse the
+            image itself; the hash is then registered as in flight and the
+            caller must call release() with the outcome
+        """
+        if phash is None:
+            return None
+        value = int(phash, 16)
+
+        while True:
+            result = self.lookup(phash)
+            if result is not None:
+                return result
+
+            future = next((
+                pending for key, pending in self._in_flight.items()
+                if (key ^ value).bit_count() <= self.max_distance
+            ), None)
+            if future is None:
+                self._in_flight[value] = asyncio.get_running_loop().create_future()
+                return None
+
+            # shield: a cancelled waiter must not cancel the analysis it waits on
+            result = await asyncio.shield(future)
+            if result is not None:
+                self.coalesced += 1
+                return dict(result)
+            # That analysis failed; take over (or wait for whoever did)
+
+    def release(self, phash: Optional[str], result: Optional[Dict]):
+        """
+        End an analysis claimed by lookup_or_claim
+
+        Args:
+            phash: Hash passed to lookup_or_claim
+            result: Vision result for the waiters, or None if the analysis
+                failed (they then analyse the image themselves)
+        """
+        if phash is None:
+            return
+        future = self._in_flight.pop(int(phash, 16), None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def add(self, phash: Optional[str], result: Dict):
+        if phash is None:
+            return
+        value = int(phash, 16)
+        with self._lock:
+            if value not in self._entries:
+                for bucket, band in zip(self._buckets, self._band_values(value)):
+                    bucket.setdefault(band, set()).add(value)
+            self._entries[value] = result
+            self._entries.move_to_end(value)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                for bucket, band in zip(self._buckets, self._band_values(evicted)):
+                    keys = bucket[band]
+                    keys.discard(evicted)
+                    if not keys:
+                        del bucket[band]
+                self.evictions += 1
+
+    async def load(self, db: AsyncSession):
+        """Warm the index from the most recent hashed analyses"""
+        rows = (await db.execute(
+            select(ImageAnalysis.phash, HazardPost.ai_analysis)
+            .join(HazardPost, HazardPost.id == ImageAnalysis.post_id)
+            .where(ImageAnalysis.phash != None, HazardPost.ai_analysis != None)
+            .order_by(ImageAnalysis.id.desc())
+            .limit(self.max_size)
+        )).all()
+
+        # Oldest first so the newest end up most recently used
+        for phash, ai_analysis in reversed(rows):
+            try:
+                self.add(phash, json.loads(ai_analysis))
+            except (ValueError, TypeError):
+                continue
+        logger.info(f"Analysis cache warmed with {len(self._entries)} image hashes")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight),
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# Singleton instance
+analysis_cache_service = AnalysisCacheService()
@@ -0,0 +1,394 @@
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from sqlalchemy import delete, event, func, inspect, insert, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import logging
+
+from database import HazardPost, ImageBlob, SOSReport
+from services.image_service import image_service, ImageMetadata
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'MPO': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+    'GIF': '.gif',
+    'BMP': '.bmp'
+}
+
+# Models whose image_path points into the store
+REFERRERS = (HazardPost, SOSReport)
+
+
+class _BytesUpload:
+    """Minimal async reader so in-memory images go through the same ingest as uploads"""
+
+    def __init__(self, data: bytes):
+        self._buffer = io.BytesIO(data)
+        self.size = len(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+
+class BlobStoreService:
+    """
+    Content-addressed image store.
+
+    Each distinct image is kept once at uploads/blobs/ab/cd/<sha256>.<ext>
+    (two-level fan-out on the hash, so no directory grows past a few
+    hundred entries). The image_blobs table counts how many hazard_posts
+    and sos_reports rows point at each blob; the counts are adjusted from
+    a before_flush hook in the same transaction that writes the rows, and
+    blobs nobody references any more are removed by collect_garbage.
+    """
+
+    def __init__(self):
+        # Stored paths use forward slashes so image_path doubles as the /uploads URL
+        self.root = f"{image_service.upload_dir}/blobs"
+        self.tmp_dir = f"{self.root}/tmp"
+        # Unreferenced blobs younger than this may belong to an upload that is still being saved
+        self.gc_grace_seconds = int(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+        self._table = ImageBlob.__table__
+
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def register(self, session_class=Session):
+        """Attach the flush hook (idempotent)"""
+        if not event.contains(session_class, "before_flush", self._before_flush):
+            event.listen(session_class, "before_flush", self._before_flush)
+
+    # ---- paths ----
+
+    def blob_path(self, sha256: str, extension: str) -> str:
+        return f"{self.root}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+    def blob_hash(self, path: Optional[str]) -> Optional[str]:
+        """The SHA-256 a stored path is keyed by, or None for paths outside the store"""
+        if not path:
+            return None
+        if not path.startswith(f"{self.root}/"):
+            return None
+        return os.path.splitext(os.path.basename(path))[0]
+
+    # ---- writes ----
+
+    async def store_upload(self, upload) -> ImageMetadata:
+        """
+        Ingest an upload and file it under its content hash
+
+        Args:
+            upload: UploadFile (anything with an async read(size))
+
+        Returns:
+            ImageMetadata whose path is the blob (an existing one if the bytes were seen before)
+
+        Raises:
+            ImageRejected: as image_service.ingest_upload
+        """
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        metadata = await image_service.ingest_upload(upload, tmp_path)
+        return await asyncio.to_thread(self._commit, metadata)
+
+    async def store_bytes(self, data: bytes) -> ImageMetadata:
+        """store_upload for an image already in memory (e.g. a base64 offline sync)"""
+        return await self.store_upload(_BytesUpload(data))
+
+    def _commit(self, metadata: ImageMetadata) -> ImageMetadata:
+        extension = IMAGE_EXTENSIONS.get(metadata.format, '.img')
+        dest_path = self.blob_path(metadata.sha256, extension)
+
+        try:
+            # Touching a duplicate keeps it out of a concurrent garbage collection;
+            # if the collection retired it first, this upload's copy takes its place
+            os.utime(dest_path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            os.replace(metadata.path, dest_path)
+        else:
+            os.remove(metadata.path)
+            logger.info(f"Duplicate image stored once: {dest_path}")
+
+        metadata.path = dest_path
+        return metadata
+
+    def store_file(self, path: str, keep_original: bool = False) -> Tuple[str, int]:
+        """
+        Move an existing file into the store (blocking; used by migrate_image_store.py)
+
+        Args:
+            path: File to store
+            keep_original: Copy instead of move, so the caller can delete it once it is safe
+
+        Returns:
+            (blob path, size in bytes)
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(image_service.ingest_chunk_size), b""):
+                digest.update(chunk)
+
+        try:
+            with Image.open(path) as img:
+                extension = IMAGE_EXTENSIONS.get(img.format)
+        except Exception:
+            extension = None
+        if extension is None:
+            extension = os.path.splitext(path)[1].lower() or '.img'
+
+        dest_path = self.blob_path(digest.hexdigest(), extension)
+        if not os.path.exists(dest_path):
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            if keep_original:
+                tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+                shutil.copy2(path, tmp_path)
+                os.replace(tmp_path, dest_path)
+            else:
+                os.replace(path, dest_path)
+        if not keep_original and os.path.exists(path):
+            os.remove(path)
+        return dest_path, os.path.getsize(dest_path)
+
+    # ---- reference counts ----
+
+    async def reconcile(self, db: AsyncSession) -> int:
+        """
+        Recount references from hazard_posts and sos_reports
+
+        Returns:
+            Number of blobs referenced at least once
+        """
+        paths = union_all(*[
+            select(model.image_path.label('image_path')) for model in REFERRERS
+        ]).subquery()
+        rows = (await db.execute(
+            select(paths.c.image_path, func.count()).group_by(paths.c.image_path)
+        )).all()
+
+        counts = {}
+        for path, count in rows:
+            sha256 = self.blob_hash(path)
+            if sha256:
+                counts[sha256] = (path, count)
+
+        await db.execute(update(self._table).values(ref_count=0))
+        for sha256, (path, count) in counts.items():
+            result = await db.execute(
+                update(self._table).where(self._table.c.sha256 == sha256).values(ref_count=count)
+            )
+            if not result.rowcount:
+                await db.execute(insert(self._table).values(
+                    sha256=sha256, path=path, size_bytes=self._size(path), ref_count=count
+                ))
+        await db.commit()
+
+        logger.info(f"Reconciled image store: {len(counts)} referenced blobs")
+        return len(counts)
+
+    async def collect_garbage(self, db: AsyncSession) -> int:
+        """
+        Delete images nobody uses any more (past the grace period), with their derivatives
+
+        Three kinds are collected: blobs whose reference count dropped to
+        zero, blob files without a row (the transaction that would have
+        referenced them rolled back), and watermarked copies no post points
+        at. Analysis copies are removed with their blob and responsive
+        variants with the image they were rendered from. A blob is renamed
+        away and its mtime checked again before it is deleted, so an upload
+        that reuses it at the same moment either keeps it or stores its own.
+
+        Returns:
+            Number of images removed (derivatives not counted)
+        """
+        cutoff = time.time() - self.gc_grace_seconds
+        removed = 0
+
+        blobs = (await db.scalars(select(ImageBlob).where(ImageBlob.ref_count <= 0))).all()
+        for blob in blobs:
+            if self._is_recent(blob.path, cutoff):
+                continue
+
+            # Drop the row first; if a new reference arrived meanwhile the file stays
+            result = await db.execute(
+                delete(self._table).where(self._table.c.sha256 == blob.sha256, self._table.c.ref_count <= 0)
+            )
+            retired = await asyncio.to_thread(self._retire, blob.path, cutoff) if result.rowcount else None
+            if retired is None:
+                await db.rollback()
+                continue
+            await db.commit()
+            self._remove_blob(blob.path, retired)
+            removed += 1
+
+        known = set((await db.scalars(select(ImageBlob.sha256))).all())
+        stale = await asyncio.to_thread(self._stale_files, self.root, cutoff)
+        for path in stale:
+            if self._is_recent(path, cutoff):
+                continue  # reused (a duplicate upload touches it) since the walk
+            if os.path.dirname(path) == self.tmp_dir:
+                self._remove_file(path)  # an ingest that died half-way
+            elif self.blob_hash(path) not in known:
+                retired = await asyncio.to_thread(self._retire, path, cutoff)
+                if retired is not None:
+                    self._remove_blob(path, retired)
+                    removed += 1
+
+        referenced = set((await db.scalars(
+            select(HazardPost.watermarked_image_path).where(HazardPost.watermarked_image_path != None)
+        )).all())
+        stale = await asyncio.to_thread(self._stale_files, image_service.watermarked_dir, cutoff)
+        for path in stale:
+            if path not in referenced and not self._is_recent(path, cutoff):
+                self._remove_file(path)
+                image_service.remove_variants(path)
+                removed += 1
+
+        if removed:
+            logger.info(f"Removed {removed} unused images from the store")
+        return removed
+
+    def _is_recent(self, path: str, cutoff: float) -> bool:
+        try:
+            return os.path.getmtime(path) > cutoff
+        except FileNotFoundError:
+            return False
+
+    def _stale_files(self, root: str, cutoff: float) -> List[str]:
+        """Files under root not modified since cutoff, as forward-slash paths like the stored ones"""
+        stale = []
+        for directory, _, names in os.walk(root):
+            directory = directory.replace(os.sep, '/')
+            for name in names:
+                path = f"{directory}/{name}"
+                try:
+                    if os.path.getmtime(path) <= cutoff:
+                        stale.append(path)
+                except FileNotFoundError:
+                    pass
+        return stale
+
+    def _retire(self, path: str, cutoff: float) -> Optional[str]:
+        """
+        Move an unused blob out of the uploads' way before deleting it
+
+        Renaming is atomic, so a duplicate upload's utime either lands
+        before it (the mtime shows it and the blob is put back) or finds
+        the file gone and stores its own copy.
+
+        Returns:
+            Where the file now is (nothing there if it was already gone), or
+            None if it was reused and has been put back
+        """
+        retired = f"{self.tmp_dir}/gc-{uuid.uuid4().hex}"
+        try:
+            os.replace(path, retired)
+        except FileNotFoundError:
+            return retired
+        if self._is_recent(retired, cutoff):
+            os.replace(retired, path)  # same bytes as any copy stored meanwhile
+            return None
+        return retired
+
+    def _remove_blob(self, path: str, file_path: Optional[str] = None):
+        """Delete a blob file (at file_path if it was retired) and the derivatives keyed by its path"""
+        self._remove_file(file_path or path)
+        image_service.remove_analysis_derivatives(path)
+        image_service.remove_variants(path)  # rendered from the blob when watermarking failed
+
+    def _remove_file(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def stats(self, db: AsyncSession) -> Dict:
+        blobs, references, size_bytes = (await db.execute(
+            select(func.count(), func.coalesce(func.sum(ImageBlob.ref_count), 0),
+                   func.coalesce(func.sum(ImageBlob.size_bytes), 0))
+        )).one()
+        unreferenced = await db.scalar(select(func.count()).where(ImageBlob.ref_count <= 0))
+        return {
+            "blobs": blobs,
+            "references": references,
+            "deduplicated": max(0, references - (blobs - unreferenced)),
+            "unreferenced": unreferenced,
+            "size_bytes": size_bytes
+        }
+
+    # ---- flush hook ----
+
+    def _before_flush(self, session: Session, flush_context, instances):
+        deltas = Counter()
+        paths = {}
+
+        def count(path, delta):
+            sha256 = self.blob_hash(path)
+            if sha256:
+                deltas[sha256] += delta
+                paths[sha256] = path
+
+        for obj in session.new:
+            if isinstance(obj, REFERRERS):
+                count(obj.image_path, 1)
+
+        for obj in session.dirty:
+            if isinstance(obj, REFERRERS) and session.is_modified(obj):
+                history = inspect(obj).attrs['image_path'].history
+                if history.deleted:
+                    count(history.deleted[0], -1)
+                    count(obj.image_path, 1)
+
+        for obj in session.deleted:
+            if isinstance(obj, REFERRERS):
+                history = inspect(obj).attrs['image_path'].history
+                count(history.deleted[0] if history.deleted else obj.image_path, -1)
+
+        deltas = {sha256: delta for sha256, delta in deltas.items() if delta}
+        if deltas:
+            self._apply(session, deltas, paths)
+
+    def _apply(self, session: Session, deltas: Dict[str, int], paths: Dict[str, str]):
+        connection = session.connection()
+        table = self._table
+
+        for sha256, delta in deltas.items():
+            increment = (
+                update(table).where(table.c.sha256 == sha256)
+                .values(ref_count=table.c.ref_count + delta)
+            )
+
+            if connection.execute(increment).rowcount:
+                continue
+
+            # First reference to this blob; another writer may insert it concurrently
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(
+                        sha256=sha256, path=paths[sha256],
+                        size_bytes=self._size(paths[sha256]), ref_count=delta
+                    ))
+            except IntegrityError:
+                connection.execute(increment)
+
+    def _size(self, path: str) -> Optional[int]:
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return None
+
+
+# Singleton instance
+blob_store_service = BlobStoreService()
+blob_store_service.register()
@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from services.translation_service import translation_service
+from services.translation_memory_service import translation_memory_service
+
+logger = logging.getLogger(__name__)
+
+CATALOG_LANGUAGES = ['en', 'hi', 'kn']
+
+# English source content; every other language is compiled from it
+UI_ELEMENTS = {
+    "app_title": "Ocean Hazard Live Reporting",
+    "report_hazard": "Report Hazard",
+    "dashboard": "Dashboard",
+    "map": "Map",
+    "select_language": "Select Language",
+    "hazard_type": "Hazard Type",
+    "tsunami": "Tsunami",
+    "cyclone": "Cyclone",
+    "high_tide": "High Tide",
+    "severity": "Severity",
+    "low": "Low",
+    "medium": "Medium",
+    "high": "High",
+    "description": "Description",
+    "location": "Location",
+    "capture_image": "Capture Image",
+    "upload_image": "Upload Image",
+    "submit_report": "Submit Report",
+    "verified_reports": "Verified Reports",
+    "pending_reports": "Pending Reports",
+    "incois_alerts": "INCOIS Alerts",
+    "ai_confidence": "AI Confidence",
+    "view_details": "View Details",
+    "report_submitted": "Report Submitted Successfully",
+    "report_verified": "Report Verified",
+    "report_rejected": "Report Rejected",
+    "offline_mode": "Offline Mode - Will sync when online",
+    "network_restored": "Network Restored - Syncing data",
+    "safety_guidelines": "Safety Guidelines",
+    "evacuation_info": "Evacuation Information"
+}
+
+GUIDELINES = {
+    "tsunami": {
+        "title": "Tsunami Safety Guidelines",
+        "precautions": [
+            "Move to higher ground immediately",
+            "Stay away from the beach and coastal areas",
+            "Listen to emergency broadcasts",
+            "Do not return until authorities say it's safe"
+        ],
+        "evacuation": [
+            "Evacuate vertically (go to upper floors) if you cannot evacuate horizontally",
+            "Take emergency supplies with you",
+            "Help others who need assistance",
+            "Follow designated evacuation routes"
+        ],
+        "dos": [
+            "Stay informed through official channels",
+            "Keep emergency kit ready",
+            "Know your evacuation routes",
+            "Practice evacuation drills"
+        ],
+        "donts": [
+            "Don't go to the beach to watch the waves",
+            "Don't wait for official warnings if you feel strong earthquake",
+            "Don't return home until all-clear is given",
+            "Don't drive unless absolutely necessary"
+        ]
+    },
+    "cyclone": {
+        "title": "Cyclone Safety Guidelines",
+        "precautions": [
+            "Stay indoors and away from windows",
+            "Secure loose objects outside",
+            "Stock up on food, water, and medicines",
+            "Charge all electronic devices"
+        ],
+        "evacuation": [
+            "Move to designated cyclone shelters if advised",
+            "Take important documents and valuables",
+            "Turn off electricity and gas",
+            "Inform family members of your location"
+        ],
+        "dos": [
+            "Monitor weather updates regularly",
+            "Keep emergency supplies ready",
+            "Reinforce doors and windows",
+            "Stay in the strongest part of the building"
+        ],
+        "donts": [
+            "Don't venture outside during the storm",
+            "Don't use electrical appliances",
+            "Don't touch wet switches or wires",
+            "Don't spread rumors or unverified information"
+        ]
+    },
+    "high_tide": {
+        "title": "High Tide Safety Guidelines",
+        "precautions": [
+            "Stay away from low-lying coastal areas",
+            "Monitor tide schedules and warnings",
+            "Secure boats and marine equipment",
+            "Be prepared to evacuate if necessary"
+        ],
+        "evacuation": [
+            "Move to higher ground if flooding occurs",
+            "Take valuables and important documents",
+            "Follow local authority instructions",
+            "Help elderly and children evacuate first"
+        ],
+        "dos": [
+            "Check tide timings regularly",
+            "Keep emergency contact numbers handy",
+            "Maintain drainage systems around your property",
+            "Stay informed about weather conditions"
+        ],
+        "donts": [
+            "Don't park vehicles in low-lying areas",
+            "Don't ignore warning signs",
+            "Don't attempt to cross flooded areas",
+            "Don't delay evacuation if advised"
+        ]
+    }
+}
+
+
+def _strings(content: Dict) -> List[str]:
+    """Every translatable string of a content dict, in order"""
+    texts = []
+    for value in content.values():
+        texts.extend([value] if isinstance(value, str) else value)
+    return texts
+
+
+def _refill(content: Dict, translated: List[str]) -> Dict:
+    """Rebuild a content dict from _strings() output of the same shape"""
+    values = iter(translated)
+    return {
+        key: next(values) if isinstance(value, str) else [next(values) for _ in value]
+        for key, value in content.items()
+    }
+
+
+class LocalizedCatalogService:
+    """
+    Precompiled, versioned bundles of localized UI labels and guidelines.
+
+    Every (content, language) pair is translated ahead of time, at startup
+    in the background or with `python build_catalogs.py`, and written to
+    CATALOG_DIR with a manifest of content hashes. Requests are answered
+    from memory with the hash as ETag, so the read path never calls the
+    LLM. A bundle is rebuilt when its English source or the translation
+    model changes, or when it was compiled while translation was failing.
+    """
+
+    def __init__(self):
+        self.catalog_dir = os.getenv("CATALOG_DIR", "cache/catalogs")
+        self.max_age = int(os.getenv("CATALOG_MAX_AGE", "3600"))
+
+        self._bundles: Dict[Tuple[str, str], Tuple[bytes, str]] = {}  # (name, language) -> (body, etag)
+        self._manifest: Dict[str, Dict] = {}  # "name.language" -> etag, source_hash, complete
+        self._build_task: Optional[asyncio.Task] = None
+
+        os.makedirs(self.catalog_dir, exist_ok=True)
+
+    def contents(self) -> Dict[str, Dict]:
+        """Catalog name -> English content"""
+        catalogs = {"ui": UI_ELEMENTS}
+        for hazard_type, guidelines in GUIDELINES.items():
+            catalogs[f"guidelines.{hazard_type}"] = guidelines
+        return catalogs
+
+    def _source_hash(self, content: Dict) -> str:
+        source = json.dumps(content, sort_keys=True) + translation_service.model + str(translation_memory_service.version)
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+    def _path(self, name: str, language: str) -> str:
+        return os.path.join(self.catalog_dir, f"{name}.{language}.json")
+
+    # ---- serving ----
+
+    def get(self, name: str, language: str) -> Optional[Tuple[bytes, str, bool]]:
+        """
+        A compiled bundle, falling back to English while a translation is not built yet
+
+        Returns:
+            (JSON body, ETag, exact) where exact is False for the English fallback,
+            or None for an unknown catalog
+        """
+        bundle = self._bundles.get((name, language))
+        if bundle:
+            return bundle[0], bundle[1], True
+        bundle = self._bundles.get((name, 'en'))
+        if bundle:
+            return bundle[0], bundle[1], language == 'en'
+        return None
+
+    def versions(self) -> Dict[str, str]:
+        """ETag of every compiled bundle, for clients that cache by version"""
+        return {f"{name}.{language}": etag for (name, language), (_, etag) in sorted(self._bundles.items())}
+
+    # ---- building ----
+
+    def load(self):
+        """Load current bundles from disk and compile English (no LLM needed) in memory"""
+        try:
+            with open(os.path.join(self.catalog_dir, "manifest.json")) as f:
+                self._manifest = json.load(f)
+        except (OSError, ValueError):
+            self._manifest = {}
+
+        for name, content in self.contents().items():
+            self._store(name, 'en', content, self._source_hash(content), complete=True)
+
+            for language in CATALOG_LANGUAGES:
+                entry = self._manifest.get(f"{name}.{language}")
+                if language == 'en' or not entry or entry["source_hash"] != self._source_hash(content):
+                    continue
+                try:
+                    with open(self._path(name, language), "rb") as f:
+                        body = f.read()
+                except OSError:
+                    continue
+                self._bundles[(name, language)] = (body, self._etag(body))
+
+        self._write_manifest()
+        logger.info(f"Loaded {len(self._bundles)} localized catalog bundles")
+
+    def start(self):
+        """Load bundles, then compile missing or stale translations in the background"""
+        self.load()
+        if self._build_task is None or self._build_task.done():
+            self._build_task = asyncio.create_task(self.build())
+
+    async def build(self, force: bool = False) -> int:
+        """
+        Compile every (content, language) bundle that is missing, stale or incomplete
+
+        Args:
+            force: Rebuild everything
+
+        Returns:
+            Number of bundles written
+        """
+        built = 0
+        for name, content in self.contents().items():
+            source_hash = self._source_hash(content)
+            for language in CATALOG_LANGUAGES:
+                if language == 'en':
+                    continue
+                entry = self._manifest.get(f"{name}.{language}")
+                if (not force and entry and entry["source_hash"] == source_hash
+                        and entry["complete"] and (name, language) in self._bundles):
+                    continue
+
+                try:
+                    texts = _strings(content)
+                    translated = _refill(content, await translation_service.translate_many(texts, language))
+                    # Complete only if every string came from the LLM (fallbacks are never memorised)
+                    found = await translation_memory_service.lookup(texts, language, translation_service.model)
+                    complete = translation_service.enabled and len(found) == len(set(texts))
+                except Exception as e:
+                    logger.error(f"Catalog {name}.{language} build failed: {str(e)}")
+                    continue
+
+                self._store(name, language, translated, source_hash, complete)
+                self._write_manifest()
+                built += 1
+
+        if built:
+            logger.info(f"Compiled {built} localized catalog bundles")
+        return built
+
+    def _store(self, name: str, language: str, content: Dict, source_hash: str, complete: bool):
+        body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        etag = self._etag(body)
+
+        path = self._path(name, language)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+        self._bundles[(name, language)] = (body, etag)
+        self._manifest[f"{name}.{language}"] = {"etag": etag, "source_hash": source_hash, "complete": complete}
+
+    def _write_manifest(self):
+        path = os.path.join(self.catalog_dir, "manifest.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def _etag(self, body: bytes) -> str:
+        return f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+
+
+# Singleton instance
+catalog_service = LocalizedCatalogService()
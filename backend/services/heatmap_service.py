@@ -0,0 +1,347 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import event, insert, inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import logging
+
+from database import CacheGeneration, HazardPost, INCOISAlert
+import geo
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_WEIGHTS = {'high': 1.0, 'medium': 0.6, 'low': 0.3}
+ALERT_WEIGHT = 1.5
+
+# Web Mercator latitude limit
+MAX_LATITUDE = 85.05112878
+
+# cache_generations rows for the two layers
+POSTS_GENERATION = 'heatmap_posts'
+ALERTS_GENERATION = 'heatmap_alerts'
+
+
+def severity_weight(severity: Optional[str]) -> float:
+    return SEVERITY_WEIGHTS.get(severity, 0.3)
+
+
+def bump_generation(session: Session, name: str) -> int:
+    """Increment a cache_generations counter in the session's transaction and return the new value"""
+    table = CacheGeneration.__table__
+    connection = session.connection()
+    if not connection.execute(
+        update(table).where(table.c.name == name).values(generation=table.c.generation + 1)
+    ).rowcount:
+        connection.execute(insert(table).values(name=name, generation=1))
+    return connection.execute(select(table.c.generation).where(table.c.name == name)).scalar_one()
+
+
+def _mercator(latitudes: np.ndarray, longitudes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Project coordinates to normalized Web Mercator x, y in [0, 1)"""
+    lat = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(longitudes, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return x, y
+
+
+class _Grid:
+    """Sparse grid for one zoom level: sorted int64 cell keys and summed intensities"""
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.float64)
+
+    def merge(self, keys: np.ndarray, values: np.ndarray):
+        """
+        Add sorted, unique (keys, values) deltas
+
+        Cells that already exist are updated in place; only new cells and
+        cells emptied by rejections shift the arrays (a memmove, no re-sort).
+        """
+        if not len(keys):
+            return
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+
+        existing = pos[found]
+        self.values[existing] += values[found]
+
+        # Cells emptied by rejections drop out of the grid
+        emptied = existing[np.abs(self.values[existing]) <= 1e-9]
+        new_keys, new_values = keys[~found], values[~found]
+        keep = np.abs(new_values) > 1e-9
+        new_keys, new_values = new_keys[keep], new_values[keep]
+
+        if len(emptied):
+            self.keys = np.delete(self.keys, emptied)
+            self.values = np.delete(self.values, emptied)
+        if len(new_keys):
+            at = np.searchsorted(self.keys, new_keys)
+            self.keys = np.insert(self.keys, at, new_keys)
+            self.values = np.insert(self.values, at, new_values)
+
+
+class HeatmapService:
+    """
+    Server-side heatmap aggregation.
+
+    Verified posts and active INCOIS alerts are binned into one sparse grid
+    per zoom level (CELLS_PER_TILE cells across each 256px map tile), so a
+    viewport query returns at most one value per screen cell regardless of
+    how many reports fall inside it. Post grids are updated incrementally
+    when a committed transaction changes a post's verification; alert grids
+    are replaced whenever alerts are re-synced.
+
+    Every app worker holds its own grids, so each layer has a counter in
+    cache_generations that the changing transaction bumps. A worker applies
+    its own commit's delta only if that commit is the next generation after
+    its grids; otherwise (another worker committed in between) the grids
+    are rebuilt by refresh(), which compares the counters at most every
+    HEATMAP_SYNC_SECONDS.
+    """
+
+    def __init__(self):
+        self.min_zoom = 0
+        self.max_zoom = int(os.getenv("HEATMAP_MAX_ZOOM", "14"))
+        self.cells_per_tile = int(os.getenv("HEATMAP_CELLS_PER_TILE", "16"))
+
+        self.sync_interval = float(os.getenv("HEATMAP_SYNC_SECONDS", "2"))
+
+        self._lock = threading.Lock()
+        self._posts = {z: _Grid() for z in self.zoom_levels}
+        self._alerts = {z: _Grid() for z in self.zoom_levels}
+
+        # Generation each layer reflects (None: unknown, rebuild on next refresh)
+        self._post_generation: Optional[int] = None
+        self._alert_generation: Optional[int] = None
+        self._checked_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self.rebuilds = 0
+
+    @property
+    def zoom_levels(self) -> range:
+        return range(self.min_zoom, self.max_zoom + 1)
+
+    def register(self, session_class=Session):
+        """Attach the flush/commit hooks that keep post grids current (idempotent)"""
+        for name, handler in (
+            ("before_flush", self._before_flush),
+            ("after_commit", self._after_commit),
+            ("after_rollback", self._after_rollback),
+        ):
+            if not event.contains(session_class, name, handler):
+                event.listen(session_class, name, handler)
+
+    # ---- building ----
+
+    def _scale(self, zoom: int) -> int:
+        return (1 << zoom) * self.cells_per_tile
+
+    def _bin(self, latitudes, longitudes, weights, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized binning of points into (sorted cell keys, summed weights)"""
+        scale = self._scale(zoom)
+        x, y = _mercator(np.asarray(latitudes, dtype=np.float64), longitudes)
+        cx = np.clip((x * scale).astype(np.int64), 0, scale - 1)
+        cy = np.clip((y * scale).astype(np.int64), 0, scale - 1)
+        keys = (cx << 32) | cy
+        unique, inverse = np.unique(keys, return_inverse=True)
+        return unique, np.bincount(inverse, weights=np.asarray(weights, dtype=np.float64))
+
+    def _build(self, latitudes, longitudes, weights) -> Dict[int, _Grid]:
+        grids = {}
+        for zoom in self.zoom_levels:
+            grid = _Grid()
+            if len(latitudes):
+                grid.keys, grid.values = self._bin(latitudes, longitudes, weights, zoom)
+            grids[zoom] = grid
+        return grids
+
+    async def _generation(self, db: AsyncSession, name: str) -> int:
+        generation = await db.scalar(select(CacheGeneration.generation).where(CacheGeneration.name == name))
+        return generation or 0
+
+    async def rebuild(self, db: AsyncSession):
+        """Rebuild every post and alert grid from the database"""
+        await self._load_posts(db)
+        await self.load_alerts(db)
+
+    async def refresh(self, db: AsyncSession):
+        """Rebuild the layers other workers have changed since this one last loaded them"""
+        if time.monotonic() - self._checked_at < self.sync_interval:
+            return
+        async with self._refresh_lock:
+            if time.monotonic() - self._checked_at < self.sync_interval:
+                return
+            generations = dict((await db.execute(
+                select(CacheGeneration.name, CacheGeneration.generation)
+                .where(CacheGeneration.name.in_([POSTS_GENERATION, ALERTS_GENERATION]))
+            )).all())
+            if generations.get(POSTS_GENERATION, 0) != self._post_generation:
+                await self._load_posts(db)
+                self.rebuilds += 1
+            if generations.get(ALERTS_GENERATION, 0) != self._alert_generation:
+                await self.load_alerts(db)
+            self._checked_at = time.monotonic()
+
+    async def _load_posts(self, db: AsyncSession):
+        # Counter and rows are read in one transaction, i.e. from one snapshot
+        generation = await self._generation(db, POSTS_GENERATION)
+        posts = (await db.execute(
+            select(HazardPost.latitude, HazardPost.longitude, HazardPost.severity).where(
+                HazardPost.verified == True,
+                HazardPost.latitude != None,
+                HazardPost.longitude != None
+            )
+        )).all()
+
+        post_grids = self._build(
+            [p.latitude for p in posts],
+            [p.longitude for p in posts],
+            [severity_weight(p.severity) for p in posts]
+        )
+
+        with self._lock:
+            self._posts = post_grids
+            self._post_generation = generation
+        logger.info(f"Heatmap rebuilt from {len(posts)} verified posts")
+
+    async def load_alerts(self, db: AsyncSession):
+        """Replace the alert layer with the currently active INCOIS alerts"""
+        generation = await self._generation(db, ALERTS_GENERATION)
+        alerts = (await db.execute(
+            select(INCOISAlert.latitude, INCOISAlert.longitude).where(
+                INCOISAlert.active == True,
+                INCOISAlert.latitude != None,
+                INCOISAlert.longitude != None
+            )
+        )).all()
+
+        alert_grids = self._build(
+            [a.latitude for a in alerts],
+            [a.longitude for a in alerts],
+            [ALERT_WEIGHT] * len(alerts)
+        )
+
+        with self._lock:
+            self._alerts = alert_grids
+            self._alert_generation = generation
+
+    def apply(self, points: List[Tuple[float, float, float]]):
+        """Add signed (latitude, longitude, weight) contributions to every post grid"""
+        if not points:
+            return
+        latitudes, longitudes, weights = zip(*points)
+        with self._lock:
+            for zoom in self.zoom_levels:
+                keys, values = self._bin(latitudes, longitudes, weights, zoom)
+                self._posts[zoom].merge(keys, values)
+
+    # ---- querying ----
+
+    def query(self, north: float, south: float, east: float, west: float,
+              zoom: float) -> Dict:
+        """
+        Return heatmap cells inside a viewport
+
+        Returns:
+            Dict with the grid zoom used and a list of {lat, lng, intensity} cells
+        """
+        zoom = max(self.min_zoom, min(self.max_zoom, int(zoom)))
+        scale = self._scale(zoom)
+        north, south, east, west = geo.normalize_bbox(north, south, east, west)
+
+        (x_west, x_east), (y_north, y_south) = [
+            tuple(int(v) for v in np.clip((arr * scale).astype(np.int64), 0, scale - 1))
+            for arr in _mercator(np.array([north, south]), np.array([west, east]))
+        ]
+        col_ranges = [(x_west, x_east)] if x_west <= x_east else [(x_west, scale - 1), (0, x_east)]
+
+        with self._lock:
+            layers = [self._posts[zoom], self._alerts[zoom]]
+            keys_parts, values_parts = [], []
+            for grid in layers:
+                for col_lo, col_hi in col_ranges:
+                    lo = np.searchsorted(grid.keys, col_lo << 32)
+                    hi = np.searchsorted(grid.keys, (col_hi + 1) << 32)
+                    keys, values = grid.keys[lo:hi], grid.values[lo:hi]
+                    rows = keys & 0xFFFFFFFF
+                    inside = (rows >= y_north) & (rows <= y_south)
+                    keys_parts.append(keys[inside])
+                    values_parts.append(values[inside])
+
+        keys = np.concatenate(keys_parts)
+        values = np.concatenate(values_parts)
+        if len(keys):
+            keys, inverse = np.unique(keys, return_inverse=True)
+            values = np.bincount(inverse, weights=values)
+
+        # Cell centres back to lat/lng
+        lng = ((keys >> 32) + 0.5) / scale * 360.0 - 180.0
+        lat = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * ((keys & 0xFFFFFFFF) + 0.5) / scale))))
+
+        cells = [
+            {"lat": round(float(a), 6), "lng": round(float(b), 6), "intensity": round(float(v), 3)}
+            for a, b, v in zip(lat, lng, values)
+        ]
+        return {"zoom": zoom, "cells": cells}
+
+    # ---- session hooks ----
+
+    def _before_flush(self, session: Session, flush_context, instances):
+        points = []
+
+        for obj in session.new:
+            if isinstance(obj, HazardPost) and obj.verified:
+                points.append((obj.latitude, obj.longitude, severity_weight(obj.severity)))
+
+        for obj in list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, HazardPost):
+                continue
+            if obj not in session.deleted and not session.is_modified(obj):
+                continue
+
+            was_verified = self._previous(obj, 'verified')
+            is_verified = bool(obj.verified) and obj not in session.deleted
+            if bool(was_verified) != is_verified:
+                sign = 1.0 if is_verified else -1.0
+                points.append((obj.latitude, obj.longitude, sign * severity_weight(obj.severity)))
+
+        points = [p for p in points if p[0] is not None and p[1] is not None]
+        if points:
+            session.info.setdefault('heatmap_points', []).extend(points)
+            if 'heatmap_generation' not in session.info:
+                session.info['heatmap_generation'] = bump_generation(session, POSTS_GENERATION)
+
+    def _previous(self, obj, attr):
+        history = inspect(obj).attrs[attr].history
+        if history.deleted:
+            return history.deleted[0]
+        return getattr(obj, attr)
+
+    def _after_commit(self, session: Session):
+        points = session.info.pop('heatmap_points', None)
+        generation = session.info.pop('heatmap_generation', None)
+        if not points:
+            return
+        if generation is not None and self._post_generation == generation - 1:
+            self.apply(points)
+            self._post_generation = generation
+        else:
+            # Another worker committed in between; refresh() rebuilds from the table
+            self._post_generation = None
+            self._checked_at = 0.0
+
+    def _after_rollback(self, session: Session):
+        session.info.pop('heatmap_points', None)
+        session.info.pop('heatmap_generation', None)
+
+
+# Singleton instance
+heatmap_service = HeatmapService()
+heatmap_service.register()
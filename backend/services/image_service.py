@@ -1,10 +1,208 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFile, ImageFont, ImageOps
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import aiofiles
+import asyncio
+import hashlib
+import json
 import os
+import re
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fonts are loaded once per process (each watermark worker preloads them)
+_fonts: Optional[Tuple] = None
+
+
+def _load_fonts() -> Tuple:
+    global _fonts
+    if _fonts is None:
+        try:
+            # Try to use a nicer font if available
+            _fonts = (ImageFont.truetype("arial.ttf", 40), ImageFont.truetype("arial.ttf", 30))
+        except Exception:
+            # Fallback to default
+            _fonts = (ImageFont.load_default(), ImageFont.load_default())
+    return _fonts
+
+
+def render_watermark(
+    image_path: str,
+    watermarked_path: str,
+    location_name: str,
+    latitude: float,
+    longitude: float,
+    timestamp: datetime
+) -> str:
+    """Draw the location/date/time watermark and save it (runs in a watermark worker)"""
+    # Open image
+    image = Image.open(image_path)
+    
+    # Convert to RGB if needed
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    
+    font_large, font_small = _load_fonts()
+    
+    date_str = timestamp.strftime("%d %b %Y")
+    time_str = timestamp.strftime("%I:%M %p")
+    coords_str = f"{latitude:.4f}, {longitude:.4f}"
+    
+    # Image dimensions
+    width, height = image.size
+    
+    # Watermark position (bottom of image)
+    margin = 20
+    y_position = height - 150
+    
+    # Semi-transparent background for text
+    overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
+    overlay_draw = ImageDraw.Draw(overlay)
+    
+    # Draw semi-transparent rectangle
+    overlay_draw.rectangle(
+        [(0, y_position - 20), (width, height)],
+        fill=(0, 0, 0, 180)
+    )
+    
+    # Composite overlay onto image
+    image = image.convert('RGBA')
+    image = Image.alpha_composite(image, overlay)
+    image = image.convert('RGB')
+    
+    # Redraw on composited image
+    draw = ImageDraw.Draw(image)
+    
+    # Draw watermark text
+    text_color = (255, 255, 255)
+    
+    # Location
+    if location_name:
+        draw.text((margin, y_position), f"📍 {location_name}", 
+                 fill=text_color, font=font_large)
+    
+    # Coordinates
+    draw.text((margin, y_position + 45), coords_str, 
+             fill=text_color, font=font_small)
+    
+    # Date and time
+    datetime_text = f"📅 {date_str}  🕐 {time_str}"
+    draw.text((margin, y_position + 85), datetime_text, 
+             fill=text_color, font=font_small)
+    
+    # Save watermarked image
+    image.save(watermarked_path, quality=90)
+    return watermarked_path
+
+
+# Encodings of every variant width: map key -> (PIL format, extension)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'jpeg': ('JPEG', '.jpg')
+}
+
+
+def _variant_files(directory: str, stem: str) -> List[str]:
+    """Variant images and manifests of one source, across all its versions"""
+    pattern = re.compile(rf"{re.escape(stem)}_[0-9a-f]{{8}}(_w\d+\.\w+|\.json)")
+    try:
+        return [entry for entry in os.listdir(directory) if pattern.fullmatch(entry)]
+    except FileNotFoundError:
+        return []
+
+
+def render_variants(source_path: str, prefix: str, widths: List[int], quality: int) -> Dict[str, Dict[str, str]]:
+    """
+    Encode width-bucketed WebP and JPEG copies of an image (runs in a watermark worker)
+
+    Files are written as <prefix>_w<width>.<ext> plus a <prefix>.json manifest,
+    where prefix ends in <stem>_<fingerprint>; copies left from an older
+    fingerprint of the same source are deleted.
+
+    Returns:
+        {"webp": {"320": path, ...}, "jpeg": {...}}
+    """
+    directory, name = os.path.split(prefix)
+    stem = name.rsplit('_', 1)[0]
+    os.makedirs(directory, exist_ok=True)
+    variants = {key: {} for key in VARIANT_FORMATS}
+    
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        # Never upscale; an image narrower than every bucket gets one copy at its own width
+        buckets = [width for width in sorted(widths) if width < image.width] or [image.width]
+        for width in buckets:
+            resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            for key, (image_format, extension) in VARIANT_FORMATS.items():
+                path = f"{prefix}_w{width}{extension}"
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                if image_format == 'WEBP':
+                    resized.save(tmp_path, image_format, quality=quality, method=4)
+                else:
+                    resized.save(tmp_path, image_format, quality=quality, optimize=True, progressive=True)
+                os.replace(tmp_path, path)
+                variants[key][str(width)] = path
+    
+    # The manifest goes last: its presence means the set is complete
+    tmp_path = f"{prefix}.json.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(variants, f)
+    os.replace(tmp_path, f"{prefix}.json")
+    
+    for entry in _variant_files(directory, stem):
+        if not entry.startswith(f"{name}_") and entry != f"{name}.json":
+            try:
+                os.remove(os.path.join(directory, entry))
+            except FileNotFoundError:
+                pass
+    return variants
+
+
+IMAGE_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'MPO': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'GIF': 'image/gif',
+    'BMP': 'image/bmp'
+}
+
+
+class ImageRejected(Exception):
+    """Upload refused during ingest; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ImageMetadata:
+    """What ingest learned about an upload, so later stages do not reopen the file"""
+
+    def __init__(self, path: str, size_bytes: int, sha256: str,
+                 format: str, width: int, height: int):
+        self.path = path
+        self.size_bytes = size_bytes
+        self.sha256 = sha256
+        self.format = format
+        self.width = width
+        self.height = height
+
+    @property
+    def mime_type(self) -> str:
+        return IMAGE_MIME_TYPES.get(self.format, 'image/jpeg')
+
+    def __repr__(self) -> str:
+        return (f"ImageMetadata({self.path!r}, {self.format} {self.width}x{self.height}, "
+                f"{self.size_bytes} bytes, sha256={self.sha256[:12]})")
+
 
 class ImageProcessingService:
     """Service for image watermarking and processing"""
@@ -12,10 +210,116 @@ class ImageProcessingService:
     def __init__(self):
         self.upload_dir = "uploads"
         self.watermarked_dir = "uploads/watermarked"
+        self.analysis_dir = "uploads/analysis"
+        self.variant_dir = "uploads/variants"
+        
+        # Downscaled copy sent to Gemini instead of the full-size photo
+        self.analysis_max_edge = int(os.getenv("ANALYSIS_IMAGE_MAX_EDGE", "1024"))
+        self.analysis_quality = int(os.getenv("ANALYSIS_IMAGE_QUALITY", "80"))
+        
+        # Responsive copies for the dashboard/admin grids (srcset widths)
+        self.variant_widths = [
+            int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",") if width.strip()
+        ]
+        self.variant_quality = int(os.getenv("IMAGE_VARIANT_QUALITY", "75"))
+        self._variant_maps: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()  # source -> (prefix, map)
+        self._variant_maps_size = 2048
+        
+        # Upload ingest limits
+        self.max_image_bytes = int(os.getenv("MAX_IMAGE_SIZE_MB", "10")) * 1024 * 1024
+        self.ingest_chunk_size = 256 * 1024
+        self.sniff_limit = 1024 * 1024  # give up on an unrecognised header after this many bytes
         
         # Create directories if they don't exist
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.watermarked_dir, exist_ok=True)
+        os.makedirs(self.analysis_dir, exist_ok=True)
+        os.makedirs(self.variant_dir, exist_ok=True)
+        
+        # Watermarking and variant encoding are CPU-bound, so they run in worker processes
+        self.watermark_workers = int(os.getenv("WATERMARK_WORKERS", "2"))
+        self._watermark_pool: Optional[ProcessPoolExecutor] = None
+    
+    async def ingest_upload(self, upload, dest_path: str) -> ImageMetadata:
+        """
+        Stream an upload to disk in one pass: size limit, SHA-256 and
+        format/dimension sniffing all happen as the chunks are written,
+        then the whole file is verified before it is handed back
+        
+        Args:
+            upload: UploadFile (anything with an async read(size))
+            dest_path: Where to write the image
+            
+        Returns:
+            ImageMetadata for the stored file
+            
+        Raises:
+            ImageRejected: too large (413) or not a readable image (400); nothing is left on disk
+        """
+        declared = getattr(upload, "size", None)
+        if declared is not None and declared > self.max_image_bytes:
+            raise ImageRejected(f"Image too large (max {self.max_image_bytes // (1024 * 1024)}MB)", 413)
+        
+        digest = hashlib.sha256()
+        parser: Optional[ImageFile.Parser] = ImageFile.Parser()
+        header = None
+        size = 0
+        
+        try:
+            async with aiofiles.open(dest_path, "wb") as out:
+                while True:
+                    chunk = await upload.read(self.ingest_chunk_size)
+                    if not chunk:
+                        break
+                    
+                    size += len(chunk)
+                    if size > self.max_image_bytes:
+                        raise ImageRejected(
+                            f"Image too large (max {self.max_image_bytes // (1024 * 1024)}MB)", 413
+                        )
+                    
+                    digest.update(chunk)
+                    if parser is not None:
+                        header = self._sniff(parser, chunk)
+                        if header is not None or size >= self.sniff_limit:
+                            parser = None  # header known (or hopeless); stop parsing
+                    
+                    await out.write(chunk)
+            
+            if header is None or not await asyncio.to_thread(self._verify, dest_path):
+                raise ImageRejected("Invalid image file or format")
+        except BaseException:
+            try:
+                os.remove(dest_path)
+            except OSError:
+                pass
+            raise
+        
+        metadata = ImageMetadata(dest_path, size, digest.hexdigest(), *header)
+        logger.info(f"Image ingested: {metadata}")
+        return metadata
+    
+    def _verify(self, path: str) -> bool:
+        """Full structural check of the file (catches truncated or corrupt bodies the header hides)"""
+        try:
+            with Image.open(path) as img:
+                img.verify()
+        except Exception as e:
+            logger.warning(f"Image failed verification: {str(e)}")
+            return False
+        return True
+    
+    def _sniff(self, parser: ImageFile.Parser, chunk: bytes) -> Optional[Tuple[str, int, int]]:
+        """Feed the header parser; (format, width, height) once the header is complete"""
+        try:
+            parser.feed(chunk)
+        except Exception as e:
+            logger.warning(f"Image header rejected: {str(e)}")
+            return None
+        if parser.image is None:
+            return None
+        width, height = parser.image.size
+        return parser.image.format, width, height
     
     async def add_watermark(
         self, 
@@ -23,7 +327,8 @@ class ImageProcessingService:
         location_name: str, 
         latitude: float, 
         longitude: float,
-        timestamp: datetime = None
+        timestamp: datetime = None,
+        watermarked_filename: Optional[str] = None
     ) -> str:
         """
         Add watermark to image with location, date, and time
@@ -34,88 +339,26 @@ class ImageProcessingService:
             latitude: Latitude coordinate
             longitude: Longitude coordinate
             timestamp: Timestamp (defaults to now)
+            watermarked_filename: Output name (defaults to wm_<original name>)
             
         Returns:
             Path to watermarked image
         """
         try:
-            # Open image
-            image = Image.open(image_path)
-            
-            # Convert to RGB if needed
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Create drawing context
-            draw = ImageDraw.Draw(image)
-            
-            # Use default font (PIL's built-in)
-            try:
-                # Try to use a nicer font if available
-                font_large = ImageFont.truetype("arial.ttf", 40)
-                font_small = ImageFont.truetype("arial.ttf", 30)
-            except:
-                # Fallback to default
-                font_large = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            
             # Prepare watermark text
             if timestamp is None:
                 timestamp = datetime.utcnow()
             
-            date_str = timestamp.strftime("%d %b %Y")
-            time_str = timestamp.strftime("%I:%M %p")
-            coords_str = f"{latitude:.4f}, {longitude:.4f}"
-            
-            # Image dimensions
-            width, height = image.size
-            
-            # Watermark position (bottom of image)
-            margin = 20
-            y_position = height - 150
-            
-            # Semi-transparent background for text
-            overlay = Image.new('RGBA', image.size, (0, 0, 0, 0))
-            overlay_draw = ImageDraw.Draw(overlay)
-            
-            # Draw semi-transparent rectangle
-            overlay_draw.rectangle(
-                [(0, y_position - 20), (width, height)],
-                fill=(0, 0, 0, 180)
-            )
-            
-            # Composite overlay onto image
-            image = image.convert('RGBA')
-            image = Image.alpha_composite(image, overlay)
-            image = image.convert('RGB')
-            
-            # Redraw on composited image
-            draw = ImageDraw.Draw(image)
-            
-            # Draw watermark text
-            text_color = (255, 255, 255)
-            
-            # Location
-            if location_name:
-                draw.text((margin, y_position), f"📍 {location_name}", 
-                         fill=text_color, font=font_large)
-            
-            # Coordinates
-            draw.text((margin, y_position + 45), coords_str, 
-                     fill=text_color, font=font_small)
-            
-            # Date and time
-            datetime_text = f"📅 {date_str}  🕐 {time_str}"
-            draw.text((margin, y_position + 85), datetime_text, 
-                     fill=text_color, font=font_small)
-            
             # Generate watermarked filename
-            original_filename = os.path.basename(image_path)
-            watermarked_filename = f"wm_{original_filename}"
+            if watermarked_filename is None:
+                watermarked_filename = f"wm_{os.path.basename(image_path)}"
             watermarked_path = os.path.join(self.watermarked_dir, watermarked_filename)
             
-            # Save watermarked image
-            image.save(watermarked_path, quality=90)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                self._get_watermark_pool(), render_watermark,
+                image_path, watermarked_path, location_name, latitude, longitude, timestamp
+            )
             
             logger.info(f"Watermarked image saved: {watermarked_path}")
             
@@ -126,39 +369,181 @@ class ImageProcessingService:
             # Return original path if watermarking fails
             return image_path
     
-    async def validate_image(self, image_path: str) -> bool:
+    def _variant_location(self, source_path: str) -> Tuple[str, str]:
+        """(shard directory, stem) holding the variants of a source image"""
+        stem = os.path.splitext(os.path.basename(source_path))[0]
+        shard = hashlib.sha1(stem.encode()).hexdigest()[:2]
+        return f"{self.variant_dir}/{shard}", stem
+    
+    def _variant_prefix(self, source_path: str) -> Optional[str]:
+        """Variant path prefix for the current version of a source (None if it is missing)"""
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return None
+        directory, stem = self._variant_location(source_path)
+        fingerprint = hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:8]
+        return f"{directory}/{stem}_{fingerprint}"
+    
+    def _remember_variants(self, source_path: str, prefix: str, variants: Dict):
+        self._variant_maps[source_path] = (prefix, variants)
+        self._variant_maps.move_to_end(source_path)
+        while len(self._variant_maps) > self._variant_maps_size:
+            self._variant_maps.popitem(last=False)
+    
+    def variant_map(self, source_path: Optional[str]) -> Optional[Dict[str, Dict[str, str]]]:
+        """
+        srcset-style variant map for the current version of an image
+        
+        Returns:
+            {"webp": {"320": path, ...}, "jpeg": {...}}, or None if not rendered yet
+        """
+        if not source_path:
+            return None
+        prefix = self._variant_prefix(source_path)
+        if prefix is None:
+            return None
+        
+        cached = self._variant_maps.get(source_path)
+        if cached and cached[0] == prefix:
+            return cached[1]
+        
+        try:
+            with open(f"{prefix}.json") as f:
+                variants = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._remember_variants(source_path, prefix, variants)
+        return variants
+    
+    async def create_variants(self, source_path: str) -> Optional[Dict[str, Dict[str, str]]]:
         """
-        Validate image file
+        Render the responsive variants of an image in the process pool
         
         Args:
-            image_path: Path to image
+            source_path: Image to derive from (normally the watermarked copy)
             
         Returns:
-            True if valid, False otherwise
+            The variant map, or None if the source could not be rendered
         """
+        prefix = self._variant_prefix(source_path)
+        if prefix is None:
+            return None
+        
         try:
-            # Check file exists
-            if not os.path.exists(image_path):
-                return False
-            
-            # Check file size (max 10MB)
-            max_size = int(os.getenv("MAX_IMAGE_SIZE_MB", "10")) * 1024 * 1024
-            file_size = os.path.getsize(image_path)
-            
-            if file_size > max_size:
-                logger.warning(f"Image too large: {file_size} bytes")
-                return False
+            loop = asyncio.get_running_loop()
+            variants = await loop.run_in_executor(
+                self._get_watermark_pool(), render_variants,
+                source_path, prefix, self.variant_widths, self.variant_quality
+            )
+        except Exception as e:
+            logger.error(f"Error creating image variants for {source_path}: {str(e)}")
+            return None
+        
+        self._remember_variants(source_path, prefix, variants)
+        logger.info(f"Image variants saved: {prefix} ({len(variants['jpeg'])} widths)")
+        return variants
+    
+    def remove_variants(self, source_path: str):
+        """Delete every variant of a source image (e.g. when the source itself is removed)"""
+        directory, stem = self._variant_location(source_path)
+        for entry in _variant_files(directory, stem):
+            try:
+                os.remove(os.path.join(directory, entry))
+            except FileNotFoundError:
+                pass
+        self._variant_maps.pop(source_path, None)
+    
+    def remove_analysis_derivatives(self, image_path: str):
+        """Delete the analysis copies of an image (any edge/quality they were built with)"""
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        pattern = re.compile(rf"{re.escape(stem)}_\d+q\d+\.jpg")
+        try:
+            entries = os.listdir(self.analysis_dir)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if pattern.fullmatch(entry):
+                try:
+                    os.remove(os.path.join(self.analysis_dir, entry))
+                except FileNotFoundError:
+                    pass
+    
+    def _get_watermark_pool(self) -> ProcessPoolExecutor:
+        if self._watermark_pool is None:
+            self._watermark_pool = ProcessPoolExecutor(
+                max_workers=self.watermark_workers, initializer=_load_fonts
+            )
+        return self._watermark_pool
+    
+    def shutdown(self):
+        """Stop the watermark workers"""
+        if self._watermark_pool is not None:
+            self._watermark_pool.shutdown(wait=False, cancel_futures=True)
+            self._watermark_pool = None
+    
+    async def create_analysis_derivative(
+        self,
+        image_path: str,
+        image_format: Optional[str] = None,
+        size: Optional[Tuple[int, int]] = None
+    ) -> str:
+        """
+        Get the analysis-resolution copy of an image, building it off the event loop
+        
+        Args:
+            image_path: Path to original image
+            image_format: PIL format sniffed at upload, if known
+            size: (width, height) sniffed at upload, if known
             
-            # Try to open image
-            with Image.open(image_path) as img:
-                # Verify it's a valid image
-                img.verify()
+        Returns:
+            Path to the derivative (the original path if it is already small
+            enough or the copy could not be built)
+        """
+        return await asyncio.to_thread(self.analysis_derivative, image_path, image_format, size)
+    
+    def analysis_derivative(
+        self,
+        image_path: str,
+        image_format: Optional[str] = None,
+        size: Optional[Tuple[int, int]] = None
+    ) -> str:
+        """Blocking version of create_analysis_derivative; reuses the copy cached on disk"""
+        # A JPEG within the edge limit would only be re-encoded, so it is sent as is
+        if image_format == 'JPEG' and size and max(size) <= self.analysis_max_edge:
+            return image_path
+        
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        derivative_path = os.path.join(
+            self.analysis_dir, f"{stem}_{self.analysis_max_edge}q{self.analysis_quality}.jpg"
+        )
+        
+        try:
+            if os.path.getmtime(derivative_path) >= os.path.getmtime(image_path):
+                return derivative_path
+        except OSError:
+            pass
+        
+        try:
+            edge = self.analysis_max_edge
+            with Image.open(image_path) as image:
+                image.draft('RGB', (edge, edge))  # let the JPEG decoder skip detail we drop anyway
+                image = ImageOps.exif_transpose(image)
+                if image.mode != 'RGB':
+                    image = image.convert('RGB')
+                image.thumbnail((edge, edge), Image.LANCZOS)
+                
+                tmp_path = f"{derivative_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                image.save(tmp_path, 'JPEG', quality=self.analysis_quality, optimize=True)
+            os.replace(tmp_path, derivative_path)
             
-            return True
+            logger.info(f"Analysis derivative saved: {derivative_path} "
+                        f"({os.path.getsize(image_path)} -> {os.path.getsize(derivative_path)} bytes)")
+            return derivative_path
             
         except Exception as e:
-            logger.error(f"Image validation failed: {str(e)}")
-            return False
+            logger.error(f"Error creating analysis derivative: {str(e)}")
+            return image_path
 
 
 # Singleton instance
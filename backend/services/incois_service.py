@@ -1,14 +1,38 @@
 import os
+import asyncio
+import time
 import httpx
 from typing import List, Optional, Dict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_, select
 import logging
 
+from alert_matcher import MATCH_WINDOW_HOURS, AlertMatcher, correlation_result
+from database import AsyncReadSessionLocal, INCOISAlert
+
 logger = logging.getLogger(__name__)
 
 
 class INCOISService:
-    """Service for fetching and validating ocean hazard data from INCOIS"""
+    """
+    Service for fetching and validating ocean hazard data from INCOIS
+
+    Validation reads an in-process snapshot of the alert feed instead of
+    fetching it per post: the snapshot is fresh for INCOIS_CACHE_TTL_SECONDS,
+    concurrent callers share a single in-flight fetch, and a stale snapshot
+    (up to INCOIS_STALE_MAX_SECONDS old) is served while it is refreshed in
+    the background. All requests go through one pooled HTTP client, and
+    matching runs on a vectorized AlertMatcher built once per snapshot.
+
+    With INCOIS_VALIDATION_SOURCE=local (the default) reports are matched
+    against the synced incois_alerts table instead of the live feed, so
+    validation never waits on INCOIS itself. Alerts in force now are kept
+    in a matcher that is reloaded every INCOIS_LOCAL_RELOAD_SECONDS or as
+    soon as a sync changes the table; it serves reports made up to one
+    reload interval before it was loaded. Older reports (offline sync, job
+    retries) are matched against the alerts that were in force when they
+    were made, read per report.
+    """
     
     def __init__(self):
         self.api_url = os.getenv("INCOIS_API_URL", "https://incois.gov.in/api")
@@ -17,37 +41,158 @@ class INCOISService:
         
         if not self.enabled:
             logger.warning("INCOIS API not configured. Using mock data for development.")
+        
+        self.cache_ttl = float(os.getenv("INCOIS_CACHE_TTL_SECONDS", "60"))
+        self.stale_max = float(os.getenv("INCOIS_STALE_MAX_SECONDS", "600"))
+        self.error_ttl = float(os.getenv("INCOIS_ERROR_TTL_SECONDS", "10"))  # no snapshot: wait before refetching
+        
+        self._client: Optional[httpx.AsyncClient] = None
+        self._snapshot: Optional[List[Dict]] = None
+        self._fetched_at = 0.0  # time.monotonic() of the snapshot
+        self._retry_at = 0.0
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self._matcher: Optional[AlertMatcher] = None
+        self._matcher_source: Optional[List[Dict]] = None
+        
+        # Validation against the synced table ("local") or the live feed ("remote")
+        self.validation_source = os.getenv("INCOIS_VALIDATION_SOURCE", "local")
+        self.local_reload = float(os.getenv("INCOIS_LOCAL_RELOAD_SECONDS", "60"))
+        self._local_matcher: Optional[AlertMatcher] = None
+        self._local_loaded_at = 0.0
+        self._local_since: Optional[datetime] = None  # reports made since then use the cached matcher
+        self._local_lock = asyncio.Lock()
+        self.local_loads = 0
+        self.report_loads = 0
+        
+        self.hits = 0
+        self.stale_hits = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.not_modified = 0
+        self.errors = 0
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=10.0,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+            )
+        return self._client
     
-    async def fetch_active_alerts(self) -> List[Dict]:
+    async def close(self):
+        """Close the pooled HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def fetch_feed(self) -> List[Dict]:
         """
-        Fetch active ocean hazard alerts from INCOIS
+        Fetch the feed and store it as the snapshot; raises on failure
         
-        Returns:
-            List of alert dictionaries
+        Requests are conditional (If-None-Match / If-Modified-Since with the
+        validators of the current snapshot); on 304 the snapshot is kept and
+        returned as the same list object, so callers can skip unchanged feeds
+        with an identity check.
         """
+        self.fetches += 1
         if not self.enabled:
             # Return mock data for development
-            return self._get_mock_alerts()
+            alerts = self._get_mock_alerts()
+            if alerts == self._snapshot:
+                # Behave like a 304 so unchanged mock feeds are skipped too
+                self.not_modified += 1
+                self._fetched_at = time.monotonic()
+                return self._snapshot
+        else:
+            headers = {"Authorization": f"Bearer {self.api_key}"}
+            if self._snapshot is not None:
+                if self._etag:
+                    headers["If-None-Match"] = self._etag
+                if self._last_modified:
+                    headers["If-Modified-Since"] = self._last_modified
+            
+            response = await self._get_client().get(f"{self.api_url}/alerts", headers=headers)
+            if response.status_code == 304 and self._snapshot is not None:
+                self.not_modified += 1
+                self._fetched_at = time.monotonic()
+                return self._snapshot
+            if response.status_code != 200:
+                raise RuntimeError(f"INCOIS API error: {response.status_code}")
+            alerts = response.json()
+            self._etag = response.headers.get("etag")
+            self._last_modified = response.headers.get("last-modified")
+            logger.info(f"Fetched {len(alerts)} alerts from INCOIS")
+        
+        self._snapshot = alerts
+        self._fetched_at = time.monotonic()
+        return alerts
+    
+    async def get_active_alerts(self) -> List[Dict]:
+        """
+        Active alerts from the snapshot, fetching only when it is missing or too old
         
+        Returns:
+            List of alert dictionaries ([] if INCOIS is unreachable and nothing is cached)
+        """
+        now = time.monotonic()
+        age = now - self._fetched_at
+        
+        if self._snapshot is not None and age < self.cache_ttl:
+            self.hits += 1
+            return self._snapshot
+        
+        if self._snapshot is not None and age < self.stale_max:
+            # Stale-while-revalidate: answer now, refresh once in the background
+            self.stale_hits += 1
+            self._start_refresh()
+            return self._snapshot
+        
+        if self._snapshot is None and now < self._retry_at:
+            return []
+        
+        if self._refresh is not None and not self._refresh.done():
+            self.coalesced += 1
+        task = self._start_refresh()
+        # Shielded: a cancelled caller must not cancel the fetch the others are waiting on
+        return await asyncio.shield(task)
+    
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._refresh_snapshot())
+        return self._refresh
+    
+    async def _refresh_snapshot(self) -> List[Dict]:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.api_url}/alerts",
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                    timeout=10.0
-                )
-                
-                if response.status_code == 200:
-                    alerts = response.json()
-                    logger.info(f"Fetched {len(alerts)} alerts from INCOIS")
-                    return alerts
-                else:
-                    logger.error(f"INCOIS API error: {response.status_code}")
-                    return []
-                    
+            return await self.fetch_feed()
         except Exception as e:
-            logger.error(f"Error fetching INCOIS alerts: {str(e)}")
-            return []
+            self.errors += 1
+            logger.error(f"Error refreshing INCOIS alerts: {str(e)}")
+            if self._snapshot is None:
+                self._retry_at = time.monotonic() + self.error_ttl
+                return []
+            return self._snapshot  # keep serving the last good feed
+    
+    def stats(self) -> Dict:
+        return {
+            "alerts": len(self._snapshot) if self._snapshot is not None else None,
+            "age_seconds": round(time.monotonic() - self._fetched_at, 1) if self._snapshot is not None else None,
+            "ttl_seconds": self.cache_ttl,
+            "stale_max_seconds": self.stale_max,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "coalesced": self.coalesced,
+            "fetches": self.fetches,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "validation_source": self.validation_source,
+            "local_alerts": len(self._local_matcher) if self._local_matcher is not None else None,
+            "local_age_seconds": round(time.monotonic() - self._local_loaded_at, 1)
+            if self._local_matcher is not None else None,
+            "local_loads": self.local_loads,
+            "report_loads": self.report_loads
+        }
     
     async def validate_hazard(
         self, 
@@ -71,77 +216,138 @@ class INCOISService:
             - correlation: str (description of match)
             - matching_alerts: List[Dict]
         """
-        alerts = await self.fetch_active_alerts()
-        
-        matching_alerts = []
-        
-        for alert in alerts:
-            # Check hazard type match
-            if alert.get('alert_type') != hazard_type:
-                continue
-            
-            # Check location proximity (within 50km)
-            alert_lat = alert.get('latitude')
-            alert_lon = alert.get('longitude')
-            
-            if alert_lat and alert_lon:
-                distance = self._calculate_distance(
-                    latitude, longitude, alert_lat, alert_lon
-                )
-                
-                if distance <= alert.get('radius_km', 50):
-                    # Check time proximity (within 24 hours)
-                    alert_time = datetime.fromisoformat(alert.get('issued_at'))
-                    time_diff = abs((timestamp - alert_time).total_seconds() / 3600)
-                    
-                    if time_diff <= 24:
-                        matching_alerts.append({
-                            'alert_id': alert.get('id'),
-                            'title': alert.get('title'),
-                            'distance_km': round(distance, 2),
-                            'time_diff_hours': round(time_diff, 2)
-                        })
-        
-        validated = len(matching_alerts) > 0
-        
-        if validated:
-            correlation = f"Matches {len(matching_alerts)} INCOIS alert(s). "
-            correlation += f"Closest: {matching_alerts[0]['title']} "
-            correlation += f"({matching_alerts[0]['distance_km']}km away)"
+        if self.validation_source == "local":
+            matcher = await self._get_local_matcher(timestamp)
         else:
-            correlation = "No matching INCOIS alerts found in vicinity"
-        
-        return {
-            'validated': validated,
-            'correlation': correlation,
-            'matching_alerts': matching_alerts
-        }
+            matcher = await self._get_feed_matcher()
+        return correlation_result(matcher.match(hazard_type, latitude, longitude, timestamp))
+    
+    async def get_matcher(self) -> AlertMatcher:
+        """Matcher for the configured INCOIS_VALIDATION_SOURCE"""
+        if self.validation_source == "local":
+            return await self._get_local_matcher()
+        return await self._get_feed_matcher()
     
-    def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    async def _get_feed_matcher(self) -> AlertMatcher:
+        """Vectorized index over the current snapshot, rebuilt only when the snapshot changes"""
+        alerts = await self.get_active_alerts()
+        if self._matcher is None or self._matcher_source is not alerts:
+            self._matcher = AlertMatcher(alerts)
+            self._matcher_source = alerts
+        return self._matcher
+    
+    async def _get_local_matcher(self, timestamp: Optional[datetime] = None) -> AlertMatcher:
         """
-        Calculate distance between two coordinates using Haversine formula
-        
+        Vectorized index over the synced incois_alerts table
+
+        Args:
+            timestamp: When the report was made; a report older than the
+                cached index covers gets an index of the alerts in force back then
+
         Returns:
-            Distance in kilometers
+            The cached index (reloaded when out of date) or a one-off index
         """
-        from math import radians, sin, cos, sqrt, atan2
+        matcher = await self._get_cached_local_matcher()
+        if timestamp is None or self._local_since is None:
+            return matcher
+        
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        if timestamp >= self._local_since:
+            return matcher
         
-        R = 6371  # Earth's radius in km
+        try:
+            alerts = await self._load_local_alerts(timestamp, timestamp)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error loading INCOIS alerts for a report made at {timestamp}: {str(e)}")
+            return matcher
+        self.report_loads += 1
+        return AlertMatcher(alerts)
+    
+    async def _get_cached_local_matcher(self) -> AlertMatcher:
+        """The shared index for recent reports, reloaded when out of date"""
+        if self._local_matcher is not None and time.monotonic() - self._local_loaded_at < self.local_reload:
+            return self._local_matcher
         
-        lat1_rad = radians(lat1)
-        lat2_rad = radians(lat2)
-        delta_lat = radians(lat2 - lat1)
-        delta_lon = radians(lon2 - lon1)
+        async with self._local_lock:
+            # Another caller may have reloaded while we waited
+            if self._local_matcher is not None and time.monotonic() - self._local_loaded_at < self.local_reload:
+                return self._local_matcher
+            try:
+                # Reports are validated a little after they are made, so the index
+                # also covers the reload interval before it was loaded
+                since = datetime.utcnow() - timedelta(seconds=self.local_reload)
+                self._local_matcher = AlertMatcher(await self._load_local_alerts(since))
+                self._local_loaded_at = time.monotonic()
+                self._local_since = since
+                self.local_loads += 1
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error loading local INCOIS alerts: {str(e)}")
+                if self._local_matcher is None:
+                    return await self._get_feed_matcher()
+                self._local_loaded_at = time.monotonic()  # keep the last good index until the next reload
+            return self._local_matcher
+    
+    async def _load_local_alerts(self, since: datetime, until: Optional[datetime] = None) -> List[Dict]:
+        """
+        Synced alerts that were in force for reports made in [since, until]
+
+        That is alerts issued within MATCH_WINDOW_HOURS of the range, not
+        past valid_until at its start, and still active unless they have
+        since run out (an alert that left the feed early is treated as
+        withdrawn). Served by ix_incois_alerts_active_issued_at.
+
+        Args:
+            since: Earliest report time (naive UTC)
+            until: Latest report time; open-ended for the shared index
+
+        Returns:
+            Alert dicts for AlertMatcher, with the feed's own id
+        """
+        window = timedelta(hours=MATCH_WINDOW_HOURS)
+        conditions = [
+            or_(INCOISAlert.active == True, INCOISAlert.valid_until <= datetime.utcnow()),
+            INCOISAlert.issued_at >= since - window,
+            or_(INCOISAlert.valid_until == None, INCOISAlert.valid_until >= since)
+        ]
+        if until is not None:
+            conditions.append(INCOISAlert.issued_at <= until + window)
         
-        a = sin(delta_lat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
+        async with AsyncReadSessionLocal() as db:
+            rows = (await db.scalars(select(INCOISAlert).where(*conditions))).all()
         
-        distance = R * c
-        return distance
+        return [
+            {
+                'id': self._feed_id(row.external_id),
+                'alert_type': row.alert_type,
+                'title': row.title,
+                'latitude': row.latitude,
+                'longitude': row.longitude,
+                'radius_km': row.radius_km,
+                'issued_at': row.issued_at,
+                'valid_until': row.valid_until,
+                'active': row.active
+            }
+            for row in rows
+        ]
+    
+    def _feed_id(self, external_id: Optional[str]):
+        """The feed's id as it was before sync stored it as text (None for alerts added by hand)"""
+        if external_id is not None and external_id.isdigit():
+            return int(external_id)
+        return external_id
+    
+    def invalidate_local(self):
+        """Reload the local index on next use (call after the incois_alerts table changes)"""
+        self._local_loaded_at = 0.0
     
     def _get_mock_alerts(self) -> List[Dict]:
         """Return mock INCOIS alerts for development"""
-        now = datetime.utcnow()
+        # Issued on the hour, so the simulated feed changes hourly like a real
+        # bulletin instead of on every poll
+        now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
         
         return [
             {
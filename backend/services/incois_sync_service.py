@@ -0,0 +1,242 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from database import AsyncSessionLocal, INCOISAlert, upsert
+from services.incois_service import incois_service
+from services.heatmap_service import ALERTS_GENERATION, bump_generation, heatmap_service
+from services.tile_service import tile_service
+import geo
+
+logger = logging.getLogger(__name__)
+
+# Columns taken from the feed; a stored alert is rewritten only if one of them differs
+ALERT_FIELDS = [
+    'alert_type', 'severity', 'title', 'description', 'latitude', 'longitude',
+    'affected_area', 'radius_km', 'issued_at', 'valid_until', 'source', 'active'
+]
+
+
+def _parse_time(value) -> Optional[datetime]:
+    """Feed timestamp as naive UTC, like every other DateTime column"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class INCOISSyncService:
+    """
+    Keeps the incois_alerts table in step with the INCOIS feed.
+
+    A background poller syncs at startup and then every
+    INCOIS_POLL_INTERVAL_SECONDS (0 syncs once and does not repeat). Feed
+    requests are conditional, so an unchanged feed costs one 304 and no
+    database work beyond expiring alerts. A changed feed is diffed against
+    the stored alerts (keyed by the unique external_id): new alerts are
+    upserted, changed ones updated, and ones that left the feed or passed
+    their valid_until deactivated, all in one transaction. Every app
+    worker runs a poller, so the inserts are ON CONFLICT upserts: a worker
+    that loses the race to insert an alert updates it instead.
+    """
+
+    def __init__(self):
+        self.interval = float(os.getenv("INCOIS_POLL_INTERVAL_SECONDS", "300"))
+
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._synced_feed: Optional[List[Dict]] = None  # feed object last written to the table
+        self._last_sync: Optional[datetime] = None
+
+        self.polls = 0
+        self.unchanged = 0
+        self.errors = 0
+        self.totals = {'inserted': 0, 'updated': 0, 'deactivated': 0, 'expired': 0}
+
+    async def sync(self, db: AsyncSession, force: bool = False) -> Dict:
+        """
+        Fetch the feed and apply it to incois_alerts
+
+        Args:
+            db: Session to write with (committed here)
+            force: Diff the feed even if it is the one synced last time
+
+        Returns:
+            Counts of inserted, updated, deactivated (left the feed) and
+            expired (past valid_until) alerts, plus the feed size
+
+        Raises:
+            Exception: INCOIS could not be fetched or the write failed (nothing is changed)
+        """
+        async with self._lock:
+            alerts = await incois_service.fetch_feed()
+            now = datetime.utcnow()
+            counts = {'inserted': 0, 'updated': 0, 'deactivated': 0, 'expired': 0}
+            touched: List[Tuple[Optional[float], Optional[float]]] = []
+
+            if force or alerts is not self._synced_feed:
+                await self._apply_feed(db, alerts, now, counts, touched)
+            else:
+                self.unchanged += 1
+
+            # Alerts the feed still lists (or that were added by hand) stop at valid_until
+            expired = (await db.execute(
+                select(INCOISAlert.id, INCOISAlert.latitude, INCOISAlert.longitude).where(
+                    INCOISAlert.active == True,
+                    INCOISAlert.valid_until != None,
+                    INCOISAlert.valid_until <= now
+                )
+            )).all()
+            if expired:
+                await db.execute(
+                    update(INCOISAlert).where(INCOISAlert.id.in_([row.id for row in expired])).values(active=False)
+                )
+                counts['expired'] = len(expired)
+                touched.extend((row.latitude, row.longitude) for row in expired)
+
+            if touched:
+                await db.run_sync(bump_generation, ALERTS_GENERATION)
+            await db.commit()
+            self._synced_feed = alerts
+            self._last_sync = now
+
+            if touched:
+                await heatmap_service.load_alerts(db)
+                incois_service.invalidate_local()
+                for latitude, longitude in touched:
+                    tile_service.invalidate_point(latitude, longitude)
+
+            for key, value in counts.items():
+                self.totals[key] += value
+            if any(counts.values()):
+                logger.info(
+                    f"INCOIS sync: {counts['inserted']} new, {counts['updated']} updated, "
+                    f"{counts['deactivated']} withdrawn, {counts['expired']} expired"
+                )
+
+            return {**counts, 'total': len(alerts)}
+
+    async def _apply_feed(self, db: AsyncSession, alerts: List[Dict], now: datetime,
+                          counts: Dict, touched: List):
+        """Diff the feed against the stored alerts and write the difference"""
+        feed = {}
+        for alert_data in alerts:
+            valid_until = _parse_time(alert_data.get('valid_until'))
+            feed[str(alert_data.get('id'))] = {
+                'alert_type': alert_data.get('alert_type'),
+                'severity': alert_data.get('severity'),
+                'title': alert_data.get('title'),
+                'description': alert_data.get('description'),
+                'latitude': alert_data.get('latitude'),
+                'longitude': alert_data.get('longitude'),
+                'affected_area': alert_data.get('affected_area'),
+                'radius_km': alert_data.get('radius_km', 50.0),
+                'issued_at': _parse_time(alert_data.get('issued_at')),
+                'valid_until': valid_until,
+                'source': alert_data.get('source', 'INCOIS'),
+                'active': bool(alert_data.get('active', True)) and (valid_until is None or valid_until > now)
+            }
+
+        # Every stored alert the feed mentions, plus the active ones it may have dropped
+        stored = (await db.execute(
+            select(INCOISAlert.id, INCOISAlert.external_id,
+                   *[getattr(INCOISAlert, field) for field in ALERT_FIELDS])
+            .where(
+                INCOISAlert.external_id != None,
+                or_(INCOISAlert.active == True, INCOISAlert.external_id.in_(list(feed)))
+            )
+        )).all()
+        stored = {row.external_id: row for row in stored}
+
+        inserts, updates, withdrawn = [], [], []
+        for external_id, values in feed.items():
+            row = stored.get(external_id)
+            if row is None:
+                inserts.append({
+                    **values,
+                    'external_id': external_id,
+                    'geohash': geo.encode(values['latitude'], values['longitude']),
+                    'fetched_at': now
+                })
+                touched.append((values['latitude'], values['longitude']))
+            elif any(getattr(row, field) != values[field] for field in ALERT_FIELDS):
+                updates.append({
+                    **values,
+                    'id': row.id,
+                    'geohash': geo.encode(values['latitude'], values['longitude']),
+                    'fetched_at': now
+                })
+                touched.append((row.latitude, row.longitude))
+                touched.append((values['latitude'], values['longitude']))
+
+        for external_id, row in stored.items():
+            if external_id not in feed and row.active:
+                withdrawn.append(row.id)
+                touched.append((row.latitude, row.longitude))
+
+        if inserts:
+            await db.execute(
+                upsert(db, INCOISAlert, 'external_id', ALERT_FIELDS + ['geohash', 'fetched_at']), inserts
+            )
+        if updates:
+            await db.execute(update(INCOISAlert), updates)
+        if withdrawn:
+            await db.execute(
+                update(INCOISAlert).where(INCOISAlert.id.in_(withdrawn)).values(active=False)
+            )
+
+        counts['inserted'] = len(inserts)
+        counts['updated'] = len(updates)
+        counts['deactivated'] = len(withdrawn)
+
+    # ---- poller ----
+
+    def start(self):
+        """Start polling on the running event loop (idempotent; the first sync runs right away)"""
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._poll())
+        if self.interval > 0:
+            logger.info(f"INCOIS poller started (every {self.interval:.0f}s)")
+        else:
+            logger.info("INCOIS polling disabled; syncing once at startup")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            self.polls += 1
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.sync(db)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"INCOIS poll failed: {str(e)}")
+            if self.interval <= 0:
+                return
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict:
+        return {
+            "poll_interval_seconds": self.interval,
+            "polling": self._task is not None and not self._task.done(),
+            "last_sync": self._last_sync.isoformat() if self._last_sync else None,
+            "polls": self.polls,
+            "unchanged": self.unchanged,
+            "errors": self.errors,
+            **self.totals
+        }
+
+
+# Singleton instance
+incois_sync_service = INCOISSyncService()
@@ -0,0 +1,246 @@
+import asyncio
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import and_, exists, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from database import AsyncSessionLocal, HazardPost, ValidationJob
+from background_tasks import process_post_background
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ['queued', 'running', 'done', 'failed']
+
+
+class ValidationJobService:
+    """
+    Durable queue for post validation (AI + INCOIS).
+
+    Jobs live in the validation_jobs table, so they survive restarts. A
+    fixed pool of asyncio workers claims them with a compare-and-set
+    UPDATE; the pool size is also the cap on concurrent Gemini/INCOIS
+    calls. Failed runs are retried with exponential backoff, and a job
+    whose worker died is picked up again once its lease expires; both
+    count towards JOB_MAX_ATTEMPTS, after which the job is failed.
+    """
+
+    def __init__(self):
+        self.workers = int(os.getenv("JOB_WORKERS", "8"))  # match GEMINI_BATCH_SIZE so a surge fills a batch
+        self.max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+        self.retry_base = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+        self.retry_max = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+        self.lease_seconds = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+        self.poll_interval = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+        self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    # ---- producers ----
+
+    def enqueue(self, db: AsyncSession, post_id: int):
+        """Queue a post for validation in the caller's transaction (commit to publish)"""
+        db.add(ValidationJob(post_id=post_id, status='queued', attempts=0, run_after=datetime.utcnow()))
+
+    def notify(self):
+        """Wake idle workers after a commit that queued jobs"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def resubmit_pending(self, db: AsyncSession) -> int:
+        """
+        Queue every unprocessed pending post that has no job yet
+
+        Returns:
+            Number of posts queued
+        """
+        has_job = exists().where(ValidationJob.post_id == HazardPost.id)
+        post_ids = (await db.scalars(
+            select(HazardPost.id).where(
+                HazardPost.verified == False,
+                HazardPost.rejected == False,
+                HazardPost.ai_analysis == None,
+                ~has_job
+            ).order_by(HazardPost.id)
+        )).all()
+
+        if post_ids:
+            now = datetime.utcnow()
+            await db.execute(insert(ValidationJob), [
+                {'post_id': post_id, 'status': 'queued', 'attempts': 0, 'run_after': now, 'created_at': now}
+                for post_id in post_ids
+            ])
+            await db.commit()
+            logger.info(f"Resubmitted {len(post_ids)} pending posts for validation")
+            self.notify()
+        return len(post_ids)
+
+    async def get_depth(self, db: AsyncSession) -> Dict:
+        """
+        Queue depth per status
+
+        Returns:
+            Dict with a count per status, workers, and the age in seconds of the oldest queued job
+        """
+        counts = {status: 0 for status in JOB_STATUSES}
+        rows = (await db.execute(
+            select(ValidationJob.status, func.count(ValidationJob.id)).group_by(ValidationJob.status)
+        )).all()
+        for status, count in rows:
+            counts[status] = count
+
+        oldest = await db.scalar(
+            select(func.min(ValidationJob.run_after)).where(ValidationJob.status == 'queued')
+        )
+        counts['oldest_queued_seconds'] = (
+            max(0.0, (datetime.utcnow() - oldest).total_seconds()) if oldest else 0.0
+        )
+        counts['workers'] = len(self._tasks)
+        return counts
+
+    # ---- worker pool ----
+
+    def start(self):
+        """Start the worker pool on the running event loop (idempotent)"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{self._owner}:{i}"))
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} validation workers")
+
+    async def stop(self):
+        """Cancel the workers; a job cut off mid-run is retried once its lease expires"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, name: str):
+        while True:
+            try:
+                job = await self._claim(name)
+            except Exception as e:
+                logger.error(f"Job claim failed ({name}): {str(e)}")
+                job = None
+
+            if job is None:
+                await self._idle()
+                continue
+
+            try:
+                await self._run(job, name)
+            except Exception as e:
+                # Bookkeeping failed; the lease brings the job back
+                logger.error(f"Validation job {job.id} bookkeeping failed ({name}): {str(e)}")
+
+    async def _idle(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _due(self, now: datetime):
+        lease_expired = now - timedelta(seconds=self.lease_seconds)
+        return or_(
+            and_(ValidationJob.status == 'queued', ValidationJob.run_after <= now),
+            and_(ValidationJob.status == 'running', ValidationJob.locked_at < lease_expired)
+        )
+
+    def _claimable(self, now: datetime):
+        return and_(self._due(now), ValidationJob.attempts < self.max_attempts)
+
+    async def _claim(self, name: str) -> Optional[ValidationJob]:
+        """Atomically take the next due job, or None if there is nothing to do"""
+        async with AsyncSessionLocal() as db:
+            await self._fail_exhausted(db)
+            for _ in range(3):
+                now = datetime.utcnow()
+                job_id = await db.scalar(
+                    select(ValidationJob.id).where(self._claimable(now))
+                    .order_by(ValidationJob.run_after, ValidationJob.id).limit(1)
+                )
+                if job_id is None:
+                    return None
+
+                # Only one worker can move the row out of its claimable state
+                result = await db.execute(
+                    update(ValidationJob)
+                    .where(ValidationJob.id == job_id, self._claimable(now))
+                    .values(status='running', locked_by=name, locked_at=now,
+                            attempts=ValidationJob.attempts + 1)
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return await db.get(ValidationJob, job_id)
+            return None
+
+    async def _fail_exhausted(self, db: AsyncSession):
+        """Fail due jobs that have used up their attempts (e.g. their worker kept dying mid-run)"""
+        now = datetime.utcnow()
+        exhausted = and_(self._due(now), ValidationJob.attempts >= self.max_attempts)
+        if await db.scalar(select(ValidationJob.id).where(exhausted).limit(1)) is None:
+            return
+
+        result = await db.execute(
+            update(ValidationJob).where(exhausted)
+            .values(status='failed', locked_by=None, locked_at=None, finished_at=now,
+                    last_error=f"Gave up after {self.max_attempts} attempts (lease expired)")
+        )
+        await db.commit()
+        if result.rowcount:
+            logger.error(f"Failed {result.rowcount} validation jobs that ran out of attempts")
+
+    async def _run(self, job: ValidationJob, name: str):
+        try:
+            await process_post_background(job.post_id, final_attempt=job.attempts >= self.max_attempts)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._retry_or_fail(job, name, e)
+        else:
+            await self._finish(job, name, status='done', last_error=None)
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _retry_or_fail(self, job: ValidationJob, name: str, error: Exception):
+        if job.attempts >= self.max_attempts:
+            logger.error(f"Validation job {job.id} (post {job.post_id}) failed permanently: {str(error)}")
+            await self._finish(job, name, status='failed', last_error=str(error))
+            return
+
+        delay = self._backoff(job.attempts)
+        logger.warning(f"Validation job {job.id} (post {job.post_id}) attempt {job.attempts} "
+                       f"failed, retrying in {delay:.0f}s: {str(error)}")
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ValidationJob)
+                .where(ValidationJob.id == job.id, ValidationJob.locked_by == name)
+                .values(status='queued', locked_by=None, locked_at=None, last_error=str(error),
+                        run_after=datetime.utcnow() + timedelta(seconds=delay))
+            )
+            await db.commit()
+
+    async def _finish(self, job: ValidationJob, name: str, status: str, last_error: Optional[str]):
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ValidationJob)
+                .where(ValidationJob.id == job.id, ValidationJob.locked_by == name)
+                .values(status=status, locked_by=None, locked_at=None,
+                        last_error=last_error, finished_at=datetime.utcnow())
+            )
+            await db.commit()
+
+
+# Singleton instance
+job_service = ValidationJobService()
@@ -0,0 +1,188 @@
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from sqlalchemy import event, func, inspect, select, update, insert, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import logging
+
+from database import HazardPost, PostStat
+
+logger = logging.getLogger(__name__)
+
+HAZARD_TYPES = ['tsunami', 'cyclone', 'high_tide']
+STATUSES = ['pending', 'verified', 'rejected']
+
+# Stored buckets: a post that is both verified and rejected counts towards
+# both reported statuses, as the verified == True / rejected == True queries did
+BUCKETS = STATUSES + ['verified_rejected']
+
+
+def post_status(verified: Optional[bool], rejected: Optional[bool]) -> str:
+    """Bucket a post into exactly one stored counter"""
+    if verified and rejected:
+        return 'verified_rejected'
+    if rejected:
+        return 'rejected'
+    if verified:
+        return 'verified'
+    return 'pending'
+
+
+def _fold(buckets: Dict[str, int]) -> Dict[str, int]:
+    """Reported statuses from bucket counts (verified_rejected counts as both)"""
+    both = buckets.get('verified_rejected', 0)
+    return {
+        'pending': buckets.get('pending', 0),
+        'verified': buckets.get('verified', 0) + both,
+        'rejected': buckets.get('rejected', 0) + both
+    }
+
+
+class StatsService:
+    """
+    Maintains per-(hazard_type, status) post counters in the post_stats table.
+
+    Counters are adjusted from a before_flush hook, so every insert, status
+    change or delete of a HazardPost updates post_stats inside the same
+    transaction that writes the post itself.
+    """
+
+    def __init__(self):
+        self._table = PostStat.__table__
+
+    def register(self, session_class=Session):
+        """Attach the flush hook (idempotent)"""
+        if not event.contains(session_class, "before_flush", self._before_flush):
+            event.listen(session_class, "before_flush", self._before_flush)
+
+    async def get_counts(self, db: AsyncSession) -> Dict:
+        """
+        Read all counters in a single query
+
+        Returns:
+            Dict with total, pending, verified, rejected and by_hazard_type
+            (verified and rejected are counted independently, so a post
+            flagged both ways appears in both)
+        """
+        buckets = Counter()
+        by_hazard_type = {}
+
+        for row in (await db.scalars(select(PostStat))).all():
+            buckets[row.status] += row.count
+            by_hazard_type.setdefault(row.hazard_type, Counter())[row.status] += row.count
+
+        counts = _fold(buckets)
+        counts['total'] = sum(buckets.values())
+        counts['by_hazard_type'] = {
+            hazard_type: _fold(per_type) for hazard_type, per_type in by_hazard_type.items()
+        }
+        return counts
+
+    async def reconcile(self, db: AsyncSession) -> Dict:
+        """
+        Rebuild post_stats from scratch with one GROUP BY over hazard_posts
+
+        Returns:
+            The freshly computed counters (same shape as get_counts)
+        """
+        rebuilt = Counter({
+            (hazard_type, status): 0
+            for hazard_type in HAZARD_TYPES for status in BUCKETS
+        })
+
+        rows = (await db.execute(
+            select(
+                HazardPost.hazard_type,
+                HazardPost.verified,
+                HazardPost.rejected,
+                func.count(HazardPost.id)
+            ).group_by(HazardPost.hazard_type, HazardPost.verified, HazardPost.rejected)
+        )).all()
+
+        for hazard_type, verified, rejected, count in rows:
+            rebuilt[(hazard_type or 'unknown', post_status(verified, rejected))] += count
+
+        await db.execute(delete(self._table))
+        if rebuilt:
+            await db.execute(insert(self._table), [
+                {'hazard_type': hazard_type, 'status': status, 'count': count}
+                for (hazard_type, status), count in rebuilt.items()
+            ])
+        await db.commit()
+
+        logger.info(f"Reconciled post stats: {sum(rebuilt.values())} posts")
+        return await self.get_counts(db)
+
+    async def ensure_initialized(self, db: AsyncSession):
+        """Build the counters once for databases that predate post_stats"""
+        has_stats = (await db.scalars(select(PostStat).limit(1))).first() is not None
+        if not has_stats:
+            await self.reconcile(db)
+
+    # ---- flush hook ----
+
+    def _before_flush(self, session: Session, flush_context, instances):
+        deltas = Counter()
+
+        for obj in session.new:
+            if isinstance(obj, HazardPost):
+                deltas[self._key(obj.hazard_type, obj.verified, obj.rejected)] += 1
+
+        for obj in session.dirty:
+            if isinstance(obj, HazardPost) and session.is_modified(obj):
+                old_key, new_key = self._transition(obj)
+                if old_key != new_key:
+                    deltas[old_key] -= 1
+                    deltas[new_key] += 1
+
+        for obj in session.deleted:
+            if isinstance(obj, HazardPost):
+                old_key, _ = self._transition(obj)
+                deltas[old_key] -= 1
+
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if deltas:
+            self._apply(session, deltas)
+
+    def _key(self, hazard_type, verified, rejected) -> Tuple[str, str]:
+        return (hazard_type or 'unknown', post_status(verified, rejected))
+
+    def _transition(self, post: HazardPost) -> Tuple[Tuple[str, str], Tuple[str, str]]:
+        """Return the (old, new) counter keys for a modified or deleted post"""
+        state = inspect(post)
+
+        def previous(attr):
+            history = state.attrs[attr].history
+            if history.deleted:
+                return history.deleted[0]
+            return getattr(post, attr)
+
+        old_key = self._key(previous('hazard_type'), previous('verified'), previous('rejected'))
+        new_key = self._key(post.hazard_type, post.verified, post.rejected)
+        return old_key, new_key
+
+    def _apply(self, session: Session, deltas: Dict[Tuple[str, str], int]):
+        connection = session.connection()
+        table = self._table
+
+        for (hazard_type, status), delta in deltas.items():
+            match = (table.c.hazard_type == hazard_type) & (table.c.status == status)
+            increment = update(table).where(match).values(count=table.c.count + delta)
+
+            if connection.execute(increment).rowcount:
+                continue
+
+            # First post for this pair; another writer may insert it concurrently
+            try:
+                with connection.begin_nested():
+                    connection.execute(insert(table).values(
+                        hazard_type=hazard_type, status=status, count=delta
+                    ))
+            except IntegrityError:
+                connection.execute(increment)
+
+
+# Singleton instance
+stats_service = StatsService()
+stats_service.register()
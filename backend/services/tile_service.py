@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import and_, case, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from database import HazardPost, INCOISAlert
+import geo
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {'low': 0, 'medium': 1, 'high': 2}
+SEVERITY_BY_RANK = {rank: severity for severity, rank in SEVERITY_RANK.items()}
+
+MARKER_FIELDS = ["id", "type", "hazard_type", "severity", "lat", "lng", "title", "timestamp"]
+CLUSTER_FIELDS = ["lat", "lng", "count", "severity"]
+
+
+class MapTileService:
+    """
+    Pre-rendered marker tiles for /api/map/tiles/{z}/{x}/{y}.
+
+    Each tile is a compact JSON document of the verified posts and active
+    INCOIS alerts inside it; up to TILE_CLUSTER_MAX_ZOOM nearby points are
+    merged into clusters by a GROUP BY on a geohash prefix, so a low-zoom
+    tile costs one aggregate row per cluster rather than one row per post.
+    Rendered tiles are kept on disk and in an in-memory LRU, and only the
+    tiles containing a changed post are invalidated. The disk file is the
+    token shared by all workers: a memory entry is only served while the
+    file it was written as is still in place, so an invalidation in one
+    worker reaches the others on their next request.
+    """
+
+    def __init__(self):
+        self.cache_dir = os.getenv("TILE_CACHE_DIR", "cache/tiles")
+        self.max_zoom = int(os.getenv("TILE_MAX_ZOOM", "16"))
+        self.cluster_max_zoom = int(os.getenv("TILE_CLUSTER_MAX_ZOOM", "11"))
+        self.cluster_grid = int(os.getenv("TILE_CLUSTER_GRID", "8"))  # cells per tile side, power of two
+        self.memory_size = int(os.getenv("TILE_MEMORY_CACHE_SIZE", "2048"))
+
+        # key -> (body, ETag, (inode, mtime_ns) of the disk file it was stored as)
+        self._memory: "OrderedDict[Tuple[int, int, int], Tuple[bytes, str, Tuple[int, int]]]" = OrderedDict()
+        self._rendering: Dict[Tuple[int, int, int], object] = {}  # key -> token of latest render
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def is_valid(self, z: int, x: int, y: int) -> bool:
+        return 0 <= z <= self.max_zoom and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+    async def get_tile(self, db: AsyncSession, z: int, x: int, y: int) -> Tuple[bytes, str]:
+        """
+        Get a rendered tile, building and caching it on a miss
+
+        Returns:
+            Tuple of (JSON body, ETag)
+        """
+        key = (z, x, y)
+
+        # File system calls run in a thread so a slow disk doesn't stall the event loop
+        disk_token = await asyncio.to_thread(self._disk_token, key)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and cached[2] == disk_token:
+                self._memory.move_to_end(key)
+                return cached[:2]
+            token = object()
+            self._rendering[key] = token
+
+        try:
+            stored = await asyncio.to_thread(self._read_disk, key)
+            if stored is None:
+                body = await self._render(db, z, x, y)
+                cached = (body, self._etag(body))
+                with self._lock:
+                    # Skip storing if the tile was invalidated while rendering
+                    if self._rendering.get(key) is not token:
+                        return cached
+                disk_token = await asyncio.to_thread(self._write_disk, key, body)
+            else:
+                body, disk_token = stored
+                cached = (body, self._etag(body))
+
+            with self._lock:
+                if self._rendering.get(key) is token and disk_token is not None:
+                    self._remember(key, (*cached, disk_token))
+            return cached
+        finally:
+            with self._lock:
+                if self._rendering.get(key) is token:
+                    del self._rendering[key]
+
+    def clear(self):
+        """Drop every cached tile (memory and disk)"""
+        with self._lock:
+            self._rendering.clear()
+            self._memory.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def invalidate_point(self, latitude: Optional[float], longitude: Optional[float]):
+        """Drop the cached tile containing a coordinate at every zoom level (in every worker)"""
+        if latitude is None or longitude is None:
+            return
+
+        for z in range(self.max_zoom + 1):
+            x, y = geo.tile_for(latitude, longitude, z)
+            key = (z, x, y)
+            with self._lock:
+                self._rendering.pop(key, None)
+                self._memory.pop(key, None)
+            try:
+                os.remove(self._disk_path(key))
+            except FileNotFoundError:
+                pass
+
+    # ---- rendering ----
+
+    async def _render(self, db: AsyncSession, z: int, x: int, y: int) -> bytes:
+        if z <= self.cluster_max_zoom:
+            markers, clusters = await self._render_clusters(db, z, x, y)
+        else:
+            markers, clusters = await self._render_markers(db, z, x, y), []
+
+        tile = {
+            "z": z, "x": x, "y": y,
+            "marker_fields": MARKER_FIELDS,
+            "markers": markers,
+            "cluster_fields": CLUSTER_FIELDS,
+            "clusters": clusters
+        }
+        return json.dumps(tile, separators=(",", ":")).encode("utf-8")
+
+    def _tile_filter(self, model, z: int, x: int, y: int):
+        """Rows inside a tile; points on a shared edge belong to one tile only, as in geo.tile_for"""
+        north, south, east, west = geo.tile_bounds(z, x, y)
+        clause = geo.bbox_filter(model, north, south, east, west, z)
+        if x < (1 << z) - 1:
+            clause = and_(clause, model.longitude < east)
+        if y < (1 << z) - 1:
+            clause = and_(clause, model.latitude > south)
+        return clause
+
+    def _layers(self):
+        """(type, model, visibility filter, type column, title column, time column) per marker source"""
+        return [
+            ("post", HazardPost, HazardPost.verified == True,
+             HazardPost.hazard_type, None, HazardPost.timestamp),
+            ("incois_alert", INCOISAlert, INCOISAlert.active == True,
+             INCOISAlert.alert_type, INCOISAlert.title, INCOISAlert.issued_at),
+        ]
+
+    def _marker(self, kind, id, hazard_type, severity, latitude, longitude, title, timestamp) -> list:
+        if kind == "post":
+            title = f"{(hazard_type or '').title()} - {(severity or '').title()}"
+        return [id, kind, hazard_type, severity, latitude, longitude, title,
+                timestamp.isoformat() if timestamp else None]
+
+    async def _render_markers(self, db: AsyncSession, z: int, x: int, y: int) -> List[list]:
+        markers = []
+        for kind, model, visible, type_col, title_col, time_col in self._layers():
+            rows = (await db.execute(
+                select(
+                    model.id, type_col, model.severity, model.latitude, model.longitude,
+                    title_col if title_col is not None else literal(None), time_col
+                ).where(visible, self._tile_filter(model, z, x, y))
+            )).all()
+            markers.extend(self._marker(kind, *row) for row in rows)
+        return markers
+
+    def _cluster_precision(self, z: int) -> int:
+        """Shortest geohash prefix whose cells are no wider than a cluster cell at zoom z"""
+        cluster_width = 360.0 / (1 << z) / self.cluster_grid
+        precision = 1
+        while precision < geo.GEOHASH_PRECISION and geo.cell_size(precision)[1] > cluster_width:
+            precision += 1
+        return precision
+
+    async def _render_clusters(self, db: AsyncSession, z: int, x: int, y: int) -> Tuple[List[list], List[list]]:
+        """
+        Aggregate posts and alerts per geohash-prefix cell in SQL
+
+        Cells with a single point stay markers; the rest become clusters at
+        the mean position of their points, with the highest severity.
+        """
+        precision = self._cluster_precision(z)
+        # cell -> [count, latitude sum, longitude sum, highest severity rank, marker if count == 1]
+        cells: Dict[str, list] = {}
+
+        def add(cell, count, mean_lat, mean_lng, rank, marker):
+            entry = cells.setdefault(cell, [0, 0.0, 0.0, -1, None])
+            entry[0] += count
+            entry[1] += mean_lat * count
+            entry[2] += mean_lng * count
+            entry[3] = max(entry[3], rank)
+            entry[4] = marker if entry[0] == 1 else None
+
+        for kind, model, visible, type_col, title_col, time_col in self._layers():
+            cell = func.substr(model.geohash, 1, precision)
+            rank = case(*[(model.severity == severity, r) for severity, r in SEVERITY_RANK.items()], else_=-1)
+            groups = (await db.execute(
+                select(
+                    cell, func.count(model.id), func.avg(model.latitude), func.avg(model.longitude),
+                    func.max(rank),
+                    # Only read back for single-point cells, where min() is that point's value
+                    func.min(model.id), func.min(type_col), func.min(model.severity),
+                    func.min(title_col) if title_col is not None else literal(None), func.min(time_col)
+                ).where(
+                    visible, model.geohash != None, self._tile_filter(model, z, x, y)
+                ).group_by(cell)
+            )).all()
+            for key, count, mean_lat, mean_lng, max_rank, *single in groups:
+                marker = None
+                if count == 1:
+                    id, hazard_type, severity, title, timestamp = single
+                    marker = self._marker(kind, id, hazard_type, severity, mean_lat, mean_lng, title, timestamp)
+                add(key, count, mean_lat, mean_lng, max_rank, marker)
+
+            # Rows not backfilled with a geohash yet are bucketed here instead
+            legacy = (await db.execute(
+                select(
+                    model.id, type_col, model.severity, model.latitude, model.longitude,
+                    title_col if title_col is not None else literal(None), time_col
+                ).where(visible, model.geohash == None, self._tile_filter(model, z, x, y))
+            )).all()
+            for row in legacy:
+                add(geo.encode(row.latitude, row.longitude, precision), 1, row.latitude, row.longitude,
+                    SEVERITY_RANK.get(row.severity, -1), self._marker(kind, *row))
+
+        markers, clusters = [], []
+        for count, lat_sum, lng_sum, rank, marker in cells.values():
+            if count == 1:
+                markers.append(marker)
+                continue
+            clusters.append([
+                round(lat_sum / count, 6),
+                round(lng_sum / count, 6),
+                count,
+                SEVERITY_BY_RANK.get(rank)
+            ])
+        return markers, clusters
+
+    # ---- caches ----
+
+    def _etag(self, body: bytes) -> str:
+        return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_path(self, key) -> str:
+        z, x, y = key
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.json")
+
+    def _disk_token(self, key) -> Optional[Tuple[int, int]]:
+        """Identity of the tile's disk file; changes or disappears when any worker invalidates it"""
+        try:
+            st = os.stat(self._disk_path(key))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _read_disk(self, key) -> Optional[Tuple[bytes, Tuple[int, int]]]:
+        """Read a tile's disk file; returns (body, disk token) or None if it isn't there"""
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                st = os.fstat(f.fileno())
+                return f.read(), (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key, body: bytes) -> Optional[Tuple[int, int]]:
+        """Write a tile's disk file; returns its disk token, or None if it couldn't be written"""
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+                st = os.fstat(f.fileno())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error writing tile cache {path}: {str(e)}")
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+
+# Singleton instance
+tile_service = MapTileService()
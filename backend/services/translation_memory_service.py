@@ -0,0 +1,197 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+import logging
+
+from database import AsyncSessionLocal, TranslationMemory
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TranslationMemoryService:
+    """
+    Two-tier translation memory in front of the translation LLM.
+
+    An in-process LRU (TRANSLATION_CACHE_SIZE entries) answers repeats
+    without I/O; the translation_memory table keeps every translation
+    across restarts and workers, keyed by (SHA-256 of the source text,
+    target language, model). Entries expire after
+    TRANSLATION_CACHE_TTL_SECONDS, and bumping TRANSLATION_CACHE_VERSION
+    invalidates everything stored under an older version (e.g. after a
+    prompt change).
+    """
+
+    def __init__(self):
+        self.max_size = int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))
+        self.ttl_seconds = int(os.getenv("TRANSLATION_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+        self.version = int(os.getenv("TRANSLATION_CACHE_VERSION", "1"))
+
+        # (hash, language, model) -> (translation, stored at epoch seconds)
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    async def lookup(self, texts: List[str], target_language: str, model: str) -> Dict[str, str]:
+        """
+        Find stored translations, memory first and then one query for the rest
+
+        Returns:
+            Dict of source text -> translation for the texts that were found
+        """
+        found = {}
+        pending = {}
+        now = time.time()
+
+        with self._lock:
+            for text in set(texts):
+                key = (text_hash(text), target_language, model)
+                entry = self._entries.get(key)
+                if entry and now - entry[1] < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    found[text] = entry[0]
+                    self.memory_hits += 1
+                else:
+                    pending[key[0]] = text
+
+        if not pending:
+            return found
+
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(TranslationMemory.source_hash, TranslationMemory.translated_text,
+                           TranslationMemory.created_at)
+                    .where(
+                        TranslationMemory.source_hash.in_(list(pending)),
+                        TranslationMemory.target_language == target_language,
+                        TranslationMemory.model == model,
+                        TranslationMemory.version == self.version,
+                        TranslationMemory.created_at > datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+                    )
+                )).all()
+        except Exception as e:
+            logger.error(f"Translation memory lookup failed: {str(e)}")
+            rows = []
+
+        with self._lock:
+            for source_hash, translated_text, created_at in rows:
+                text = pending.pop(source_hash, None)
+                if text is None:
+                    continue
+                found[text] = translated_text
+                self.db_hits += 1
+                self._remember((source_hash, target_language, model), translated_text,
+                               (created_at - datetime(1970, 1, 1)).total_seconds())
+            self.misses += len(pending)
+
+        return found
+
+    async def store(self, translations: Dict[str, str], target_language: str, model: str):
+        """Record fresh LLM translations in both tiers"""
+        if not translations:
+            return
+        now = datetime.utcnow()
+
+        with self._lock:
+            for text, translated_text in translations.items():
+                self._remember((text_hash(text), target_language, model), translated_text, time.time())
+            self.stores += len(translations)
+
+        try:
+            async with AsyncSessionLocal() as db:
+                for text, translated_text in translations.items():
+                    key = {'source_hash': text_hash(text), 'target_language': target_language, 'model': model}
+                    values = {'translated_text': translated_text, 'version': self.version, 'created_at': now}
+                    try:
+                        async with db.begin_nested():
+                            db.add(TranslationMemory(source_text=text, **key, **values))
+                    except IntegrityError:
+                        # Stored before (older version or expired), or by another worker just now
+                        await db.execute(
+                            update(TranslationMemory).filter_by(**key).values(**values)
+                        )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Translation memory store failed: {str(e)}")
+
+    async def purge_stale(self) -> int:
+        """
+        Delete rows that expired or were stored under an older version
+
+        Returns:
+            Number of rows removed
+        """
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(TranslationMemory).where(or_(
+                    TranslationMemory.version != self.version,
+                    TranslationMemory.created_at <= datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+                ))
+            )
+            await db.commit()
+
+        if result.rowcount:
+            logger.info(f"Purged {result.rowcount} stale translations")
+        return result.rowcount
+
+    async def invalidate(self, target_language: Optional[str] = None) -> int:
+        """
+        Forget stored translations (all, or one language) in both tiers
+
+        Returns:
+            Number of rows removed
+        """
+        with self._lock:
+            if target_language is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[1] == target_language]:
+                    del self._entries[key]
+
+        async with AsyncSessionLocal() as db:
+            stmt = delete(TranslationMemory)
+            if target_language is not None:
+                stmt = stmt.where(TranslationMemory.target_language == target_language)
+            result = await db.execute(stmt)
+            await db.commit()
+
+        logger.info(f"Invalidated {result.rowcount} translations ({target_language or 'all languages'})")
+        return result.rowcount
+
+    def _remember(self, key: Tuple[str, str, str], translated_text: str, stored_at: float):
+        self._entries[key] = (translated_text, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "version": self.version,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0
+            }
+
+
+# Singleton instance
+translation_memory_service = TranslationMemoryService()
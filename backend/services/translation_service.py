@@ -1,8 +1,15 @@
 import os
-from groq import Groq
-from typing import Dict
+import asyncio
+import random
+import time
+import httpx
+from groq import AsyncGroq, RateLimitError
+from typing import Dict, List
 import logging
 
+from rate_limit import TokenBucketLimiter
+from services.translation_memory_service import translation_memory_service
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,18 +20,98 @@ class GroqTranslationService:
         api_key = os.getenv("GROQ_API_KEY")
         
         if api_key:
-            self.client = Groq(api_key=api_key)
+            # One pooled async client for all calls; retries are ours (429-aware, see _complete)
+            self.client = AsyncGroq(
+                api_key=api_key,
+                max_retries=0,
+                timeout=float(os.getenv("GROQ_TIMEOUT_SECONDS", "30")),
+                http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=10, max_keepalive_connections=10))
+            )
             self.enabled = True
         else:
             logger.warning("Groq API key not configured. Translation disabled.")
             self.enabled = False
         
+        self.model = os.getenv("GROQ_TRANSLATION_MODEL", "llama-3.1-70b-versatile")
+        
+        # Bulk translation: strings per keyed prompt, and parallel calls when falling back
+        self.batch_size = int(os.getenv("TRANSLATION_BATCH_SIZE", "32"))
+        self.fallback_concurrency = int(os.getenv("TRANSLATION_FALLBACK_CONCURRENCY", "4"))
+        self._semaphore = asyncio.Semaphore(self.fallback_concurrency)
+        
+        # Upstream quota (defaults match Groq's free tier), shared by every caller in FIFO order
+        self.limiter = TokenBucketLimiter(
+            float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")),
+            float(os.getenv("GROQ_TOKENS_PER_MINUTE", "6000"))
+        )
+        self.queue_timeout = float(os.getenv("GROQ_QUEUE_TIMEOUT_SECONDS", "30"))
+        self.max_retries = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+        
         self.language_names = {
             'en': 'English',
             'hi': 'Hindi',
             'kn': 'Kannada'
         }
     
+    async def _complete(self, system: str, prompt: str, max_tokens: int) -> str:
+        """
+        One chat completion within the rate limit, bounded by the shared semaphore
+        
+        Raises:
+            RateLimitTimeout: no quota before GROQ_QUEUE_TIMEOUT_SECONDS
+            RateLimitError: still throttled after GROQ_MAX_RETRIES retries
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        # Input plus a translation of about the same length; settled with the real usage
+        estimate = (len(system) + len(prompt)) // 2
+        
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                reserved = await self.limiter.acquire(estimate, deadline)
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": system
+                            },
+                            {
+                                "role": "user",
+                                "content": prompt
+                            }
+                        ],
+                        temperature=0.3,
+                        max_tokens=max_tokens
+                    )
+                except RateLimitError as e:
+                    self.limiter.settle(reserved, 0)
+                    delay = self._retry_after(e, attempt)
+                    self.limiter.pause(delay)
+                    if attempt == self.max_retries:
+                        raise
+                    logger.warning(f"Groq rate limited, retrying in {delay:.1f}s (attempt {attempt + 1})")
+                    continue
+                except BaseException:
+                    self.limiter.settle(reserved, 0)
+                    raise
+                
+                usage = getattr(response, "usage", None)
+                self.limiter.settle(reserved, usage.total_tokens if usage else reserved)
+                return response.choices[0].message.content.strip()
+    
+    def _retry_after(self, error: RateLimitError, attempt: int) -> float:
+        """Seconds to back off after a 429: Retry-After if given, else exponential with jitter"""
+        try:
+            return min(60.0, float(error.response.headers.get("retry-after")))
+        except (TypeError, ValueError, AttributeError):
+            return min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+    
+    async def close(self):
+        """Close the pooled HTTP client"""
+        if self.enabled:
+            await self.client.close()
+    
     async def translate(self, text: str, target_language: str) -> str:
         """
         Translate text to target language
@@ -44,6 +131,20 @@ class GroqTranslationService:
         if target_language == 'en':
             return text
         
+        # Translation memory: identical strings are only ever sent once
+        cached = await translation_memory_service.lookup([text], target_language, self.model)
+        if text in cached:
+            return cached[text]
+        
+        translated_text = await self._translate_one(text, target_language)
+        if translated_text is None:
+            return text  # Return original on error
+        
+        await translation_memory_service.store({text: translated_text}, target_language, self.model)
+        return translated_text
+    
+    async def _translate_one(self, text: str, target_language: str):
+        """Single-string LLM call; None on error"""
         try:
             target_lang_name = self.language_names.get(target_language, 'English')
             
@@ -55,49 +156,73 @@ Text to translate:
 
 Translation:"""
             
-            response = self.client.chat.completions.create(
-                model="llama-3.1-70b-versatile",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are a professional translator. Translate text to {target_lang_name} accurately."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=1000
+            translated_text = await self._complete(
+                f"You are a professional translator. Translate text to {target_lang_name} accurately.",
+                prompt, 1000
             )
             
-            translated_text = response.choices[0].message.content.strip()
-            
             logger.info(f"Translated text to {target_language}: {text[:50]}... -> {translated_text[:50]}...")
             
             return translated_text
             
         except Exception as e:
             logger.error(f"Translation error: {str(e)}")
-            return text  # Return original on error
+            return None
     
-    async def translate_ui_elements(self, elements: Dict[str, str], target_language: str) -> Dict[str, str]:
+    async def translate_many(self, texts: List[str], target_language: str) -> List[str]:
         """
-        Translate multiple UI elements at once
+        Translate many strings with as few LLM calls as possible
+        
+        Strings the translation memory has not seen are packed into keyed
+        prompts of up to TRANSLATION_BATCH_SIZE lines; anything a batch
+        drops (or that spans several lines) is retried one string at a
+        time, at most TRANSLATION_FALLBACK_CONCURRENCY calls in parallel.
         
         Args:
-            elements: Dictionary of key-value pairs to translate
+            texts: Strings to translate (duplicates are translated once)
             target_language: Target language code
             
         Returns:
-            Dictionary with translated values
+            Translations in the same order (originals where translation failed)
         """
-        if not self.enabled or target_language == 'en':
-            return elements
+        if not self.enabled or target_language == 'en' or not texts:
+            return list(texts)
+        
+        unique = list(dict.fromkeys(texts))
+        translations = await translation_memory_service.lookup(unique, target_language, self.model)
+        missing = [text for text in unique if text not in translations]
+        
+        if missing:
+            single_line = [text for text in missing if "\n" not in text]
+            batches = [
+                single_line[start:start + self.batch_size]
+                for start in range(0, len(single_line), self.batch_size)
+            ]
+            fresh = {}
+            for result in await asyncio.gather(*[
+                self._translate_batch(batch, target_language) for batch in batches
+            ]):
+                fresh.update(result)
+            
+            leftovers = [text for text in missing if text not in fresh]
+            if leftovers:
+                logger.info(f"Translating {len(leftovers)} strings individually to {target_language}")
+                for text, translated_text in zip(leftovers, await asyncio.gather(*[
+                    self._translate_one(text, target_language) for text in leftovers
+                ])):
+                    if translated_text is not None:
+                        fresh[text] = translated_text
+            
+            await translation_memory_service.store(fresh, target_language, self.model)
+            translations.update(fresh)
         
+        return [translations.get(text, text) for text in texts]
+    
+    async def _translate_batch(self, texts: List[str], target_language: str) -> Dict[str, str]:
+        """One keyed prompt for a batch; returns only the lines that came back"""
         try:
-            # Combine all elements into one request for efficiency
-            combined_text = "\n".join([f"{k}:::{v}" for k, v in elements.items()])
+            # Combine all strings into one request, keyed by position
+            combined_text = "\n".join([f"{i}:::{text}" for i, text in enumerate(texts)])
             
             target_lang_name = self.language_names.get(target_language, 'English')
             
@@ -110,43 +235,41 @@ Maintain the same format in your response.
 
 Translated:"""
             
-            response = self.client.chat.completions.create(
-                model="llama-3.1-70b-versatile",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": f"You are a professional UI translator. Translate to {target_lang_name}."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.3,
-                max_tokens=2000
+            content = await self._complete(
+                f"You are a professional UI translator. Translate to {target_lang_name}.",
+                prompt, 4000
             )
             
-            translated_lines = response.choices[0].message.content.strip().split('\n')
-            
             # Parse response
-            translated_elements = {}
-            for line in translated_lines:
+            translated = {}
+            for line in content.split('\n'):
                 if ':::' in line:
                     key, value = line.split(':::', 1)
-                    translated_elements[key.strip()] = value.strip()
-            
-            # Fill in any missing translations with originals
-            for key in elements:
-                if key not in translated_elements:
-                    translated_elements[key] = elements[key]
-            
-            logger.info(f"Translated {len(translated_elements)} UI elements to {target_language}")
+                    key = key.strip()
+                    if key.isdigit() and int(key) < len(texts) and value.strip():
+                        translated[texts[int(key)]] = value.strip()
             
-            return translated_elements
+            logger.info(f"Translated {len(translated)}/{len(texts)} strings to {target_language} in one call")
             
+            return translated
+        
         except Exception as e:
-            logger.error(f"UI translation error: {str(e)}")
-            return elements  # Return originals on error
+            logger.error(f"Batch translation error: {str(e)}")
+            return {}
+    
+    async def translate_ui_elements(self, elements: Dict[str, str], target_language: str) -> Dict[str, str]:
+        """
+        Translate multiple UI elements at once
+        
+        Args:
+            elements: Dictionary of key-value pairs to translate
+            target_language: Target language code
+            
+        Returns:
+            Dictionary with translated values
+        """
+        translated = await self.translate_many(list(elements.values()), target_language)
+        return dict(zip(elements.keys(), translated))
 
 
 # Singleton instance
@@ -1,10 +1,15 @@
 import os
+import io
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Tuple
 import logging
 from PIL import Image
 
+from services.image_service import IMAGE_MIME_TYPES
+
 logger = logging.getLogger(__name__)
 
 
@@ -35,6 +40,22 @@ class GeminiVisionService:
 
         self.enabled = False
         self.model = None
+
+        # The SDK call is blocking, so it runs on a dedicated pool; the
+        # semaphore is held until the thread returns, so timed-out calls
+        # still count against the cap instead of piling up behind it
+        self.max_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+        self.call_timeout = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "45"))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini")
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Micro-batching: analyses arriving within the window share one request
+        self.batch_size = int(os.getenv("GEMINI_BATCH_SIZE", "8"))
+        self.batch_window = float(os.getenv("GEMINI_BATCH_WINDOW_MS", "250")) / 1000.0
+        self._pending: List[Tuple[str, Optional[str], asyncio.Future]] = []  # (path, mime type, caller)
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batches = set()
+
         self._setup()
 
     def _setup(self):
@@ -77,39 +98,189 @@ class GeminiVisionService:
             self._setup()
         return self.enabled
 
-    def _get_image_mime_type(self, image_path: str) -> str:
+    def _get_image_mime_type(self, image_data: bytes) -> str:
+        # Sniffed from the bytes already in memory rather than reopening the file
         try:
-            with Image.open(image_path) as img:
-                return {
-                    'JPEG': 'image/jpeg',
-                    'PNG': 'image/png',
-                    'WEBP': 'image/webp',
-                    'GIF': 'image/gif',
-                    'BMP': 'image/bmp'
-                }.get(img.format, 'image/jpeg')
+            with Image.open(io.BytesIO(image_data)) as img:
+                return IMAGE_MIME_TYPES.get(img.format, 'image/jpeg')
         except Exception:
             return 'image/jpeg'
 
-    async def analyze_image(self, image_path: str) -> Dict:
-        if not self._ensure_enabled():
-            return self._get_fallback_result()
+    async def _run_blocking(self, fn: Callable, *args):
+        """
+        Run a blocking SDK call on the Gemini pool
+
+        Raises:
+            asyncio.TimeoutError: the call took longer than GEMINI_TIMEOUT_SECONDS
+        """
+        loop = asyncio.get_running_loop()
+        await self._semaphore.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(lambda _: self._release(loop))
+
+        # Cancelling the caller (or timing out) cancels the call if it has not started yet
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.call_timeout)
 
+    def _release(self, loop: asyncio.AbstractEventLoop):
         try:
-            mime_type = self._get_image_mime_type(image_path)
+            loop.call_soon_threadsafe(self._semaphore.release)
+        except RuntimeError:
+            pass  # loop already closed (shutdown)
 
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
+    def _read_image(self, image_path: str, mime_type: Optional[str] = None) -> Dict:
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+        return {"mime_type": mime_type or self._get_image_mime_type(image_data), "data": image_data}
 
-            prompt = """You are an AI validator for a coastal disaster reporting system.
+    def _generate(self, image_path: str, mime_type: Optional[str] = None) -> str:
+        prompt = """You are an AI validator for a coastal disaster reporting system.
 Respond ONLY in valid JSON with confidence between 0.0 and 1.0.
 """
 
-            response = self.model.generate_content([
-                prompt,
-                {"mime_type": mime_type, "data": image_data}
-            ])
+        response = self.model.generate_content([
+            prompt,
+            self._read_image(image_path, mime_type)
+        ])
+        return response.text.strip()
+
+    def _generate_batch(self, images: List[Tuple[str, Optional[str]]]) -> str:
+        prompt = f"""You are an AI validator for a coastal disaster reporting system.
+You will receive {len(images)} independent images, labelled Image 1 to Image {len(images)}.
+Respond ONLY with a valid JSON array of {len(images)} objects, one per image in the same order.
+Each object has the keys: image (its number), ocean_related, hazard_detected, hazard_type,
+confidence (between 0.0 and 1.0), detected_elements, scene_description, reasoning.
+"""
+
+        parts = [prompt]
+        for number, (image_path, mime_type) in enumerate(images, start=1):
+            parts.append(f"Image {number}:")
+            parts.append(self._read_image(image_path, mime_type))
+
+        response = self.model.generate_content(parts)
+        return response.text.strip()
+
+    async def analyze_image(self, image_path: str, mime_type: Optional[str] = None) -> Dict:
+        """
+        Analyze one image; concurrent calls are micro-batched into shared requests
+
+        Args:
+            image_path: Image to analyse
+            mime_type: Its MIME type if already known (otherwise sniffed from the bytes)
+
+        Returns:
+            Analysis dict (fallback result if Gemini is unavailable)
+        """
+        if self.batch_size <= 1:
+            return await self._analyze_single(image_path, mime_type)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((image_path, mime_type, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+
+        return await future
+
+    # ---- batching ----
+
+    def _flush(self):
+        """Send everything collected so far, in chunks of at most batch_size"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        pending, self._pending = self._pending, []
+        # Callers that were cancelled while waiting drop out of the batch
+        pending = [entry for entry in pending if not entry[2].done()]
+
+        for i in range(0, len(pending), self.batch_size):
+            task = asyncio.create_task(self._run_batch(pending[i:i + self.batch_size]))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, Optional[str], asyncio.Future]]):
+        try:
+            if len(batch) == 1:
+                results = [await self._analyze_single(batch[0][0], batch[0][1])]
+            else:
+                results = await self._analyze_batch([(path, mime_type) for path, mime_type, _ in batch])
+        except Exception as e:
+            logger.error(f"Gemini batch failed: {str(e)}")
+            results = [self._get_fallback_result()] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
 
-            response_text = response.text.strip()
+    async def _analyze_batch(self, images: List[Tuple[str, Optional[str]]]) -> List[Dict]:
+        """One multi-image request; images without a usable entry are retried one by one"""
+        parsed: List[Optional[Dict]] = [None] * len(images)
+
+        try:
+            if not self.enabled and not await self._run_blocking(self._ensure_enabled):
+                return [self._get_fallback_result() for _ in images]
+
+            response_text = await self._run_blocking(self._generate_batch, images)
+            parsed = self._parse_batch_response(response_text, len(images))
+            logger.info(f"✓ Gemini batch of {len(images)} images "
+                        f"({sum(p is not None for p in parsed)} parsed)")
+        except asyncio.TimeoutError:
+            logger.error(f"Gemini batch of {len(images)} timed out after {self.call_timeout:g}s")
+        except Exception:
+            logger.error("Error analyzing image batch", exc_info=True)
+
+        async def resolve(image: Tuple[str, Optional[str]], gemini_result: Optional[Dict]) -> Dict:
+            if gemini_result is not None:
+                try:
+                    return self._build_result(gemini_result)
+                except Exception:
+                    # A malformed entry only costs its own image a retry, not the batch
+                    logger.error(f"Unusable batch entry for {image[0]}", exc_info=True)
+            return await self._analyze_single(*image)
+
+        return await asyncio.gather(*[
+            resolve(image, gemini_result)
+            for image, gemini_result in zip(images, parsed)
+        ])
+
+    def _parse_batch_response(self, text: str, count: int) -> List[Optional[Dict]]:
+        """Map a batch response to one raw result per image (None where unusable)"""
+        if '```' in text:
+            text = text.split('```')[1]
+            if text.startswith('json'):
+                text = text[4:]
+        try:
+            entries = json.loads(text)
+        except Exception:
+            return [None] * count
+        if not isinstance(entries, list):
+            return [None] * count
+
+        parsed: List[Optional[Dict]] = [None] * count
+        numbered = all(isinstance(e, dict) and isinstance(e.get('image'), int) for e in entries)
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                continue
+            index = entry['image'] - 1 if numbered else position
+            if 0 <= index < count and parsed[index] is None:
+                parsed[index] = entry
+        return parsed
+
+    # ---- single image ----
+
+    async def _analyze_single(self, image_path: str, mime_type: Optional[str] = None) -> Dict:
+        try:
+            # Re-running setup lists models over the network, so it goes on the pool too
+            if not self.enabled and not await self._run_blocking(self._ensure_enabled):
+                return self._get_fallback_result()
+
+            response_text = await self._run_blocking(self._generate, image_path, mime_type)
 
             try:
                 if '```' in response_text:
@@ -118,53 +289,59 @@ Respond ONLY in valid JSON with confidence between 0.0 and 1.0.
             except Exception:
                 gemini_result = self._parse_text_response(response_text)
 
-            ocean_related = gemini_result.get('ocean_related', False)
-            hazard_detected = gemini_result.get('hazard_detected', False)
-            hazard_type = gemini_result.get('hazard_type', 'none')
-            confidence = float(gemini_result.get('confidence', 0.0))
-
-            # ✅ RELEVANCE SCORE (NOT DEAD)
-            if ocean_related and hazard_detected:
-                relevance_score = min(1.0, confidence + 0.2)
-            elif ocean_related:
-                relevance_score = confidence * 0.7
-            else:
-                relevance_score = confidence * 0.3
-
-            detected_elements = gemini_result.get('detected_elements', [])
-            scene_description = gemini_result.get('scene_description', '')
-            reasoning = gemini_result.get('reasoning', '')
-
-            result = {
-                'ocean_related': ocean_related,
-                'hazard_detected': hazard_detected,
-                'detected_hazard_type': hazard_type if hazard_detected else None,
-
-                # ✅ dashboard keys
-                'confidence': confidence,
-                'confidence_score': confidence,
-                'relevance_score': relevance_score,
-
-                'labels': detected_elements[:10],
-                'objects': detected_elements,
-                'web_entities': [],
-                'scene_description': scene_description,
-                'all_elements': detected_elements,
-                'reasoning': reasoning
-            }
-
-            logger.info(
-                f"✓ Gemini analysis | hazard={hazard_type} "
-                f"| confidence={confidence:.2f} "
-                f"| relevance={relevance_score:.2f}"
-            )
-
-            return result
+            return self._build_result(gemini_result)
 
+        except asyncio.TimeoutError:
+            logger.error(f"Gemini analysis timed out after {self.call_timeout:g}s: {image_path}")
+            return self._get_fallback_result()
         except Exception:
             logger.error("Error analyzing image", exc_info=True)
             return self._get_fallback_result()
 
+    def _build_result(self, gemini_result: Dict) -> Dict:
+        ocean_related = gemini_result.get('ocean_related', False)
+        hazard_detected = gemini_result.get('hazard_detected', False)
+        hazard_type = gemini_result.get('hazard_type', 'none')
+        confidence = float(gemini_result.get('confidence', 0.0))
+
+        # ✅ RELEVANCE SCORE (NOT DEAD)
+        if ocean_related and hazard_detected:
+            relevance_score = min(1.0, confidence + 0.2)
+        elif ocean_related:
+            relevance_score = confidence * 0.7
+        else:
+            relevance_score = confidence * 0.3
+
+        detected_elements = gemini_result.get('detected_elements', [])
+        scene_description = gemini_result.get('scene_description', '')
+        reasoning = gemini_result.get('reasoning', '')
+
+        result = {
+            'ocean_related': ocean_related,
+            'hazard_detected': hazard_detected,
+            'detected_hazard_type': hazard_type if hazard_detected else None,
+
+            # ✅ dashboard keys
+            'confidence': confidence,
+            'confidence_score': confidence,
+            'relevance_score': relevance_score,
+
+            'labels': detected_elements[:10],
+            'objects': detected_elements,
+            'web_entities': [],
+            'scene_description': scene_description,
+            'all_elements': detected_elements,
+            'reasoning': reasoning
+        }
+
+        logger.info(
+            f"✓ Gemini analysis | hazard={hazard_type} "
+            f"| confidence={confidence:.2f} "
+            f"| relevance={relevance_score:.2f}"
+        )
+
+        return result
+
     def _parse_text_response(self, text: str) -> Dict:
         text_lower = text.lower()
 
@@ -191,6 +368,15 @@ Respond ONLY in valid JSON with confidence between 0.0 and 1.0.
             'reasoning': 'Parsed from text fallback'
         }
 
+    @property
+    def configured(self) -> bool:
+        """False without an API key, when a fallback result is final rather than a transient failure"""
+        return bool(os.getenv("GEMINI_API_KEY"))
+
+    def is_fallback(self, result: Dict) -> bool:
+        """True for the placeholder returned when Gemini could not analyse the image"""
+        return result.get('reasoning') == self._get_fallback_result()['reasoning']
+
     def _get_fallback_result(self) -> Dict:
         return {
             'ocean_related': False,
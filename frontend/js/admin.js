@@ -54,15 +54,23 @@ const AdminApp = {
         await this.loadActiveSafetyAlerts();
     },
 
-    async loadPendingPosts() {
+    async loadPendingPosts(loadMore = false) {
         try {
-            const response = await fetch(`${API_CONFIG.BASE_URL}/posts?limit=100`);
+            // Posts come newest first, one page at a time; "Load more" follows X-Next-Cursor
+            let url = `${API_CONFIG.BASE_URL}/posts?limit=100`;
+            if (loadMore && this.postsCursor) {
+                url += `&cursor=${encodeURIComponent(this.postsCursor)}`;
+            }
+
+            const response = await fetch(url);
             const posts = await response.json();
+            this.postsCursor = response.headers.get('X-Next-Cursor');
 
             // Filter pending (not verified AND not rejected)
             const pending = posts.filter(p => !p.verified && !p.rejected);
+            this.pendingPosts = loadMore ? (this.pendingPosts || []).concat(pending) : pending;
 
-            this.renderPending(pending);
+            this.renderPending(this.pendingPosts);
         } catch (error) {
             console.error('Error loading posts:', error);
             const container = document.getElementById('pending-container');
@@ -77,6 +85,7 @@ const AdminApp = {
 
         if (posts.length === 0) {
             container.innerHTML = '<div class="card"><p style="text-align:center; color:var(--text-muted); padding:20px;">No pending reports for verification.</p></div>';
+            this.renderLoadMore(container);
             return;
         }
 
@@ -97,11 +106,16 @@ const AdminApp = {
             const hazardName = post.hazard_type.replace(/_/g, ' ').toUpperCase();
 
             // Ensure timestamp is treated as UTC
-            const timeStr = new Date(post.timestamp.endsWith('Z') ? post.timestamp : post.timestamp + 'Z').toLocaleString();
+            const timeStr = post.timestamp
+                ? new Date(post.timestamp.endsWith('Z') ? post.timestamp : post.timestamp + 'Z').toLocaleString()
+                : 'Unknown';
 
             card.innerHTML = `
                 <div style="display:flex; gap: 20px; flex-wrap: wrap;">
-                    <img src="${imageUrl}" style="width: 200px; height: 150px; object-fit: cover; border-radius: 8px; background: #000;">
+                    <picture>
+                        ${imageVariantSources(post.image_variants, baseUrl, '200px')}
+                        <img src="${imageUrl}" loading="lazy" style="width: 200px; height: 150px; object-fit: cover; border-radius: 8px; background: #000;">
+                    </picture>
                     <div style="flex:1; min-width: 200px;">
                         <div style="display:flex; justify-content:space-between; margin-bottom: 10px;">
                             <h4 style="margin:0">${hazardName}</h4>
@@ -146,6 +160,23 @@ const AdminApp = {
             `;
             container.appendChild(card);
         });
+
+        this.renderLoadMore(container);
+    },
+
+    renderLoadMore(container) {
+        // Older posts may still hold pending reports
+        if (!this.postsCursor) return;
+
+        const btn = document.createElement('button');
+        btn.className = 'action-btn';
+        btn.textContent = 'Load more';
+        btn.onclick = () => {
+            btn.disabled = true;
+            btn.textContent = 'Loading...';
+            this.loadPendingPosts(true);
+        };
+        container.appendChild(btn);
     },
 
     async verifyPost(postId, isApproved) {
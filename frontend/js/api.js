@@ -44,8 +44,8 @@ const ApiClient = {
     },
 
     // --- Map Data ---
-    async getMapData(north, south, east, west) {
-        return this.request(`/map/data?n=${north}&s=${south}&e=${east}&w=${west}`);
+    async getMapData(north, south, east, west, zoom) {
+        return this.request(`/map/data?n=${north}&s=${south}&e=${east}&w=${west}&zoom=${zoom}`);
     },
 
     // --- Reverse Geocoding (Added for Location Name) ---
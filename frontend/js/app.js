@@ -159,7 +159,10 @@ const App = {
             const imageUrl = post.watermarked_image_path ? `${baseUrl}/${post.watermarked_image_path}` : '';
 
             card.innerHTML = `
-                <img src="${imageUrl}" class="post-image" alt="${hazardName}" loading="lazy" onerror="this.onerror=null;this.src='https://placehold.co/600x400?text=Image+Error'">
+                <picture style="display: block;">
+                    ${imageVariantSources(post.image_variants, baseUrl, '(max-width: 600px) 100vw, 400px')}
+                    <img src="${imageUrl}" class="post-image" alt="${hazardName}" loading="lazy" onerror="this.onerror=null;this.parentElement.querySelectorAll('source').forEach(s=>s.remove());this.src='https://placehold.co/600x400?text=Image+Error'">
+                </picture>
                 <div class="post-content">
                     <div class="post-header">
                         <span class="post-type">
@@ -24,7 +24,23 @@ const SEVERITY_COLORS = {
     high: '#ef4444'
 };
 
+// <source> tags for a post's responsive image variants ({webp: {width: path}, jpeg: {...}})
+function imageVariantSources(variants, baseUrl, sizes) {
+    if (!variants) return '';
+    const types = { webp: 'image/webp', jpeg: 'image/jpeg' };
+    return Object.entries(types)
+        .filter(([format]) => variants[format] && Object.keys(variants[format]).length)
+        .map(([format, type]) => {
+            const srcset = Object.entries(variants[format])
+                .map(([width, path]) => `${baseUrl}/${path.replace(/\\/g, '/')} ${width}w`)
+                .join(', ');
+            return `<source type="${type}" srcset="${srcset}" sizes="${sizes}">`;
+        })
+        .join('');
+}
+
 // Export configuration
 window.API_CONFIG = API_CONFIG;
+window.imageVariantSources = imageVariantSources;
 window.HAZARD_ICONS = HAZARD_ICONS;
 window.SEVERITY_COLORS = SEVERITY_COLORS;
@@ -29,6 +29,9 @@ const MapManager = {
                 this.setupControls();
             });
 
+            // Markers are fetched per viewport, so refresh after each pan/zoom
+            this.map.on('moveend', () => this.loadMapData());
+
             // Try to get user location
             if (navigator.geolocation) {
                 navigator.geolocation.getCurrentPosition(
@@ -71,7 +74,8 @@ const MapManager = {
                 bounds.getNorth(),
                 bounds.getSouth(),
                 bounds.getEast(),
-                bounds.getWest()
+                bounds.getWest(),
+                this.map.getZoom()
             );
 
             // Access correct field 'markers' instead of 'points'